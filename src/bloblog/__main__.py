@@ -4,52 +4,242 @@ Uses argparse to accept a --config argument that points to a config.yaml file.
 """
 
 import argparse
+import logging
+import signal
+import sys
+import time
+from typing import IO, Any, Dict
 from bloblog.config.config_manager import ConfigManager
+from bloblog.config.logging_config import configure_logging
+from bloblog.aws.rate_control import RateControl
+from bloblog.aws.session_factory import SessionFactory
 from bloblog.metadata.client_factory import MetadataClientFactory
+from bloblog.storage.compression import CompressionCache, CompressionRules, Compressor
 from bloblog.storage.s3_client import S3Client
 from bloblog.sync.task_queue import TaskQueue
 from bloblog.sync.file_synchronizer import FileSynchronizer
+from bloblog.sync.hash_cache import HashCache
+from bloblog.sync.hashing import HashEngine
+from bloblog.sync.journal import SyncJournal
+from bloblog.sync.plan_manifest import PlanWriter, parse_shard, read_plan
+from bloblog.sync.watcher import ChangeWatcher
+from bloblog.metrics.metrics import Metrics
 
-def main():
+logger = logging.getLogger(__name__)
+
+def main() -> None:
     """
     Main entry point for the application.
     Parses command-line arguments to obtain the config file path and then 
     initiates the synchronization process using FileSynchronizer.
     """
     parser = argparse.ArgumentParser(description="Run the bloblog file synchronization.")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="sync",
+        choices=["sync", "refresh-headers", "plan", "apply"],
+        help="sync (default) synchronizes the sync root; refresh-headers only updates "
+             "Cache-Control headers that aged into a new rule, without walking the sync root; "
+             "plan writes the tasks a sync would run to --manifest; apply runs them."
+    )
     parser.add_argument(
         "--config",
         required=True,
         help="Path to the YAML configuration file."
     )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="Hash every tracked file instead of trusting unchanged size and mtime."
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="With refresh-headers, re-evaluate every record, e.g. after editing the cache_control rules."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After a full synchronization, keep running and sync changed files as inotify reports them."
+    )
+    parser.add_argument(
+        "--manifest",
+        help="With plan and apply, the NDJSON plan manifest; '-' for stdout or stdin."
+    )
+    parser.add_argument(
+        "--shard",
+        default="0/1",
+        help="With apply, run only shard i of N (0 <= i < N) of the manifest, partitioned by path hash."
+    )
     args = parser.parse_args()
+    if args.command in ("plan", "apply") and not args.manifest:
+        parser.error(f"{args.command} requires --manifest")
+    try:
+        shard, shards = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Instantiate ConfigManager
     config_manager = ConfigManager(args.config)
     config = config_manager.config
+    logging_config = config_manager.get_logging_config()
+    if args.command == "plan" and args.manifest == '-' and logging_config['output'] == 'stdout':
+        # The manifest goes to stdout; log lines in it would corrupt it.
+        logging_config['output'] = 'stderr'
+    configure_logging(logging_config)
+
+    # One registry for the run, exported when it ends
+    metrics = Metrics()
+
+    # Share one session, with connection pools sized for the configured parallelism
+    session_factory = SessionFactory.from_config(config_manager)
+
+    # Pace S3 and DynamoDB requests below the rates the services sustain, and retry failures
+    rate_control = RateControl.from_config(config_manager, metrics=metrics)
 
     # Initialize MetadataClient using MetadataClientFactory
     metadata_client_factory = MetadataClientFactory()
-    metadata_client = metadata_client_factory.get_client(config['deployment']['metadb'])
+    metadata_client = metadata_client_factory.get_client(
+        config['deployment']['metadb'], session_factory, metrics=metrics, rate_control=rate_control
+    )
+
+    # Compress the MIME types configured for it, caching the artifacts next to the sync root
+    compressor = None
+    compression_config = config_manager.get_compression_config()
+    if compression_config['rules']:
+        compression_cache = None
+        if compression_config['cache']['enabled']:
+            compression_cache = CompressionCache(
+                compression_config['cache']['path']
+                or CompressionCache.default_path(config_manager.get_sync_root_path()),
+                max_size=compression_config['cache']['max_size']
+            )
+        compressor = Compressor(
+            CompressionRules(compression_config['rules']),
+            min_size=compression_config['min_size'],
+            cache=compression_cache,
+            metrics=metrics
+        )
 
     # Initialize S3Client
     s3_client = S3Client(
-        bucket_name=config['deployment']['storage']['name']
+        bucket_name=config['deployment']['storage']['name'],
+        transfer_config=config_manager.get_transfer_config(),
+        session_factory=session_factory,
+        metrics=metrics,
+        rate_control=rate_control,
+        compressor=compressor
     )
 
-    # Initialize TaskQueue without workers parameter
-    task_queue = TaskQueue()
+    # Bound the TaskQueue so the walk cannot run far ahead of the workers
+    task_queue = TaskQueue(maxsize=config_manager.get_workers() * 16)
+
+    # Open the local hash cache, stored next to the sync root by default
+    hash_cache = None
+    hash_cache_config = config_manager.get_hash_cache_config()
+    if hash_cache_config['enabled']:
+        hash_cache = HashCache(
+            hash_cache_config['path'] or HashCache.default_path(config_manager.get_sync_root_path()),
+            max_entries=hash_cache_config['max_entries'],
+            metrics=metrics
+        )
+
+    # Hash small files on the worker threads and large files in a process pool
+    hash_engine = HashEngine(metrics=metrics, **config_manager.get_hashing_config())
+
+    # Open the run journal, which also resumes the work of an interrupted run
+    journal = None
+    journal_config = config_manager.get_journal_config()
+    if journal_config['enabled'] and args.command != "plan":
+        journal_path = journal_config['path'] or SyncJournal.default_path(config_manager.get_sync_root_path())
+        if args.command == "apply":
+            # Shards may run side by side on one host, each with its own journal.
+            journal_path += f".shard-{shard}-of-{shards}"
+        journal = SyncJournal(journal_path)
 
     # Create FileSynchronizer with config_manager
     file_synchronizer = FileSynchronizer(
         metadata_client=metadata_client,
         s3_client=s3_client,
         config_manager=config_manager,
-        task_queue=task_queue
+        task_queue=task_queue,
+        paranoid=args.paranoid,
+        hash_cache=hash_cache,
+        hash_engine=hash_engine,
+        metrics=metrics,
+        journal=journal,
+        task_attempts=config_manager.get_rate_control_config()['task_attempts']
     )
 
     # Start synchronization
-    file_synchronizer.start_synchronization()
+    status = 'failed'
+    try:
+        if args.command == "refresh-headers":
+            file_synchronizer.refresh_headers(all_records=args.all)
+        elif args.command == "plan":
+            write_plan(file_synchronizer, args.manifest)
+        elif args.command == "apply":
+            with open_manifest(args.manifest, 'r') as manifest:
+                file_synchronizer.apply(read_plan(manifest, shard, shards))
+        elif args.watch:
+            watch_config = config_manager.get_watch_config()
+            watcher = ChangeWatcher(
+                config_manager.get_sync_root_path(),
+                config_manager.get_exclude_matcher(),
+                debounce=watch_config['debounce'],
+                max_delay=watch_config['max_delay']
+            )
+            signal.signal(signal.SIGTERM, lambda signum, frame: file_synchronizer.stop())
+            file_synchronizer.watch(watcher, rescan_interval=watch_config['rescan_interval'])
+        else:
+            file_synchronizer.start_synchronization()
+        status = 'ok'
+    finally:
+        hash_engine.close()
+        if hash_cache is not None:
+            hash_cache.close()
+        if compressor is not None:
+            compressor.close()
+        if journal is not None:
+            journal.close()
+        metadata_client.close()
+        write_metrics(metrics, config_manager.get_metrics_config(), args.command, status)
+
+def write_plan(file_synchronizer: FileSynchronizer, manifest_path: str) -> None:
+    """
+    Write the plan manifest and print the files and bytes of each operation.
+    """
+    with open_manifest(manifest_path, 'w') as manifest:
+        writer = PlanWriter(manifest)
+        file_synchronizer.plan(writer)
+    for operation, totals in writer.totals.items():
+        print(f"{operation}: {totals['files']} files, {totals['bytes']} bytes", file=sys.stderr)
+
+def open_manifest(path: str, mode: str) -> IO[str]:
+    """
+    Open a manifest file, or stdin/stdout for '-'.
+    """
+    if path == '-':
+        stream = sys.stdout if mode == 'w' else sys.stdin
+        return open(stream.fileno(), mode, encoding='utf-8', closefd=False)
+    return open(path, mode, encoding='utf-8')
+
+def write_metrics(metrics: Metrics, metrics_config: Dict[str, Any], command: str, status: str) -> None:
+    """
+    Export the metrics of a run to the configured JSON summary and Prometheus textfile.
+    A failed export is logged rather than masking the outcome of the run.
+    """
+    metrics.set_gauge('last_run_timestamp_seconds', time.time(), command=command)
+    metrics.set_gauge('last_run_success', 1 if status == 'ok' else 0, command=command)
+    metrics.set_gauge('last_run_duration_seconds', time.time() - metrics.started, command=command)
+    try:
+        if metrics_config['json_path']:
+            metrics.write_json(metrics_config['json_path'], command=command, status=status)
+        if metrics_config['prometheus_path']:
+            metrics.write_prometheus(metrics_config['prometheus_path'])
+    except OSError:
+        logger.exception("Could not write the run metrics")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,321 @@
+"""
+Client-side rate control for AWS requests: an adaptive token bucket per service,
+and bounded retries with exponential backoff and jitter.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple, TypeVar
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionError, HTTPClientError
+from bloblog.config.config_manager import ConfigManager
+from bloblog.metrics.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Error codes with which S3 and DynamoDB ask clients to slow down.
+THROTTLING_ERROR_CODES = frozenset({
+    'SlowDown',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+    'Throttling',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'TooManyRequestsException'
+})
+
+# Error codes of server-side failures that succeed when retried.
+TRANSIENT_ERROR_CODES = frozenset({
+    'InternalError',
+    'InternalFailure',
+    'InternalServerError',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'RequestTimeoutException'
+})
+
+# HTTP statuses retried whatever their error code.
+TRANSIENT_STATUS_CODES = frozenset({500, 502, 503, 504})
+
+# Bucket settings of each service; max_rate is in requests per second, and
+# increase is the rate added per second of successful requests.
+DEFAULT_SERVICES = {
+    's3': {'max_rate': 3500.0, 'min_rate': 10.0, 'increase': 50.0},
+    'dynamodb': {'max_rate': 1000.0, 'min_rate': 5.0, 'increase': 25.0}
+}
+
+# Settings of services without an entry in DEFAULT_SERVICES.
+DEFAULT_SERVICE = {'max_rate': 1000.0, 'min_rate': 5.0, 'increase': 25.0}
+
+def error_code(error: Exception) -> Optional[str]:
+    """
+    Return the AWS error code of a ClientError, or None for other errors.
+    """
+    if isinstance(error, ClientError):
+        code: Optional[str] = error.response.get('Error', {}).get('Code')
+        return code
+    return None
+
+def is_throttling(error: Exception) -> bool:
+    """
+    Whether an error is the service asking to slow down, e.g. S3 SlowDown or
+    DynamoDB ProvisionedThroughputExceededException.
+    """
+    return error_code(error) in THROTTLING_ERROR_CODES
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether a failed request may succeed when sent again: throttling, server
+    errors, timeouts and dropped connections.
+    """
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    if not isinstance(error, ClientError):
+        return False
+    if is_throttling(error) or error_code(error) in TRANSIENT_ERROR_CODES:
+        return True
+    return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') in TRANSIENT_STATUS_CODES
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate follows AIMD (additive increase,
+    multiplicative decrease), the congestion control of TCP.
+
+    The rate starts at max_rate, so requests are never held back until the
+    service first throttles. Each throttle multiplies the rate by decrease,
+    once per cooldown: the requests already in flight when the service starts
+    throttling all fail together and count as one signal. Each success adds
+    increase / rate, so the rate climbs back by about increase per second while
+    requests flow. The bucket holds up to one second of tokens.
+    """
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float = 1.0,
+        increase: float = 25.0,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        :param max_rate: Highest rate, in requests per second.
+        :param min_rate: Lowest rate the bucket backs off to.
+        :param increase: Requests per second added per second of successes.
+        :param decrease: Factor the rate is multiplied by on a throttle.
+        :param cooldown: Minimum seconds between two decreases.
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.rate = max_rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = max_rate
+        self._updated = clock()
+        self._last_decrease: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take one token, waiting for the bucket to refill if it is empty. The
+        token is taken before waiting, so concurrent callers queue up behind
+        each other instead of racing for the next token.
+
+        :return: Seconds spent waiting.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate)
+        if delay:
+            self._sleep(delay)
+        return delay
+
+    def on_success(self) -> None:
+        """
+        Raise the rate additively after a successful request.
+        """
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self) -> bool:
+        """
+        Cut the rate multiplicatively after the service throttled a request.
+
+        :return: True if the rate was cut, False within the cooldown of the last cut.
+        """
+        with self._lock:
+            now = self._clock()
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return False
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, self.rate)
+            self._last_decrease = now
+            return True
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+class RateControl:
+    """
+    Paces the requests of every client sharing it with one AdaptiveTokenBucket
+    per service, and retries failed requests.
+
+    Throttled, server-side and connection failures are retried up to
+    max_attempts times in all, after a delay drawn uniformly between zero and
+    an exponentially growing cap ("full jitter"), so clients that were
+    throttled together do not retry together. Other errors are raised at once.
+
+    botocore makes a single attempt per request unless aws.max_attempts asks
+    for more, each of which counts against max_attempts here too. Clients
+    registered with observe() report every throttled attempt botocore makes,
+    so the buckets slow down before botocore gives up.
+    """
+    def __init__(
+        self,
+        services: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_attempts: int = 8,
+        base_delay: float = 0.1,
+        max_delay: float = 20.0,
+        metrics: Optional[Metrics] = None,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        :param services: AdaptiveTokenBucket settings by service, over DEFAULT_SERVICES.
+        :param max_attempts: Maximum attempts per request, including the first.
+        :param base_delay: Backoff cap of the first retry, in seconds.
+        :param max_delay: Largest backoff cap, in seconds.
+        :param metrics: Registry for throttles, retries and the current rates.
+        :param sleep: Function used to wait between attempts.
+        """
+        self.services: Dict[str, Dict[str, Any]] = {name: dict(settings) for name, settings in DEFAULT_SERVICES.items()}
+        for name, settings in (services or {}).items():
+            self.services[name] = dict(self.services.get(name, DEFAULT_SERVICE), **settings)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = metrics or Metrics()
+        self._sleep = sleep
+        self._buckets: Dict[str, AdaptiveTokenBucket] = {}
+        self._observed: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_manager: ConfigManager, metrics: Optional[Metrics] = None) -> 'RateControl':
+        """
+        Build the rate control of the configured aws.rate_control settings.
+
+        :param config_manager: A ConfigManager instance.
+        :param metrics: Registry for throttles, retries and the current rates.
+        :return: A RateControl.
+        """
+        config = config_manager.get_rate_control_config()
+        return cls(
+            services=config['services'],
+            max_attempts=config['max_attempts'],
+            base_delay=config['base_delay'],
+            max_delay=config['max_delay'],
+            metrics=metrics
+        )
+
+    def bucket(self, service: str) -> AdaptiveTokenBucket:
+        """
+        Return the bucket of a service, created on first use.
+        """
+        with self._lock:
+            bucket = self._buckets.get(service)
+            if bucket is None:
+                bucket = AdaptiveTokenBucket(**self.services.get(service, DEFAULT_SERVICE), sleep=self._sleep)
+                self._buckets[service] = bucket
+            return bucket
+
+    def call(self, service: str, operation: str, request: Callable[[], T]) -> T:
+        """
+        Send a request once a token of its service is available, retrying it
+        with backoff while it fails with a retryable error.
+
+        :param service: Service whose bucket paces the request, e.g. 's3'.
+        :param operation: Operation name, for the retry counters.
+        :param request: Sends the request and returns its result; called once per attempt.
+        :return: The result of the first successful attempt.
+        :raises ClientError: If the last attempt failed, or the error is not retryable.
+        """
+        bucket = self.bucket(service)
+        attempt = 1
+        while True:
+            bucket.acquire()
+            try:
+                result = request()
+            except (BotoCoreError, ClientError) as e:
+                if is_throttling(e) and service not in self._observed:
+                    self.throttled(service)
+                if attempt >= self.max_attempts or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt)
+                logger.debug("Retrying %s %s in %.2fs after %s", service, operation, delay, e)
+                self.metrics.increment('aws_retries_total', service=service, operation=operation)
+                self._sleep(delay)
+                attempt += 1
+                continue
+            bucket.on_success()
+            return result
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Return the delay before retrying after a failed attempt.
+
+        :param attempt: Number of the attempt that failed, from 1.
+        :return: Seconds, uniformly drawn below min(max_delay, base_delay * 2 ** (attempt - 1)).
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def wait(self, attempt: int) -> float:
+        """
+        Wait out the backoff after a failed attempt, with the sleep function of
+        the rate control.
+
+        :param attempt: Number of the attempt that failed, from 1.
+        :return: Seconds waited.
+        """
+        delay = self.backoff(attempt)
+        self._sleep(delay)
+        return delay
+
+    def throttled(self, service: str) -> None:
+        """
+        Report a throttled request of a service, slowing its bucket down.
+        """
+        bucket = self.bucket(service)
+        self.metrics.increment('aws_throttles_total', service=service)
+        if bucket.on_throttle():
+            logger.info("%s is throttling requests, lowering the request rate to %.1f/s", service, bucket.rate)
+            self.metrics.set_gauge('aws_request_rate_limit', bucket.rate, service=service)
+
+    def observe(self, client: Any, service: str) -> None:
+        """
+        Report the throttled attempts botocore retries on its own for a client.
+
+        :param client: A boto3 client, e.g. S3 or the client of a DynamoDB resource.
+        :param service: Service whose bucket the throttles slow down.
+        """
+        def on_needs_retry(response: Optional[Tuple[Any, Dict[str, Any]]] = None, **kwargs: Any) -> None:
+            # response is (http_response, parsed) when the attempt got an answer.
+            if response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+                self.throttled(service)
+
+        # Runs before botocore's own retry handler, and never changes its decision.
+        client.meta.events.register_first('needs-retry', on_needs_retry)
+        with self._lock:
+            self._observed.add(service)
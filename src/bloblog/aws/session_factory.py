@@ -0,0 +1,73 @@
+"""
+Shared factory for boto3 clients and resources with right-sized connection pools.
+"""
+
+import threading
+from typing import Any
+import boto3
+from botocore.config import Config
+from bloblog.config.config_manager import ConfigManager
+
+class SessionFactory:
+    """
+    Creates boto3 clients and resources from one shared session, all using the
+    same botocore configuration for pool size, keep-alive, timeouts and retries.
+    """
+    def __init__(
+        self,
+        max_pool_connections: int = 10,
+        connect_timeout: float = 10,
+        read_timeout: float = 60,
+        retry_mode: str = 'standard',
+        max_attempts: int = 1,
+        tcp_keepalive: bool = True
+    ):
+        """
+        :param max_pool_connections: HTTP connections pooled per client.
+        :param connect_timeout: Seconds to wait when opening a connection.
+        :param read_timeout: Seconds to wait for a response.
+        :param retry_mode: botocore retry mode: 'legacy', 'standard' or 'adaptive'.
+        :param max_attempts: Maximum botocore attempts per request, including the first;
+            more multiply the retries of the RateControl around each request.
+        :param tcp_keepalive: Enable TCP keep-alive on pooled connections.
+        """
+        self.botocore_config = Config(
+            max_pool_connections=max_pool_connections,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={'mode': retry_mode, 'max_attempts': max_attempts},
+            tcp_keepalive=tcp_keepalive
+        )
+        self.session = boto3.session.Session()
+        # boto3 sessions are not thread-safe; clients created from them are.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_manager: ConfigManager) -> 'SessionFactory':
+        """
+        Build a factory sized for the configured parallelism.
+
+        :param config_manager: A ConfigManager instance.
+        :return: A SessionFactory.
+        """
+        return cls(**config_manager.get_aws_config())
+
+    def client(self, service_name: str) -> Any:
+        """
+        Create a low-level client for a service.
+
+        :param service_name: e.g. 's3'.
+        :return: A boto3 client.
+        """
+        with self._lock:
+            return self.session.client(service_name, config=self.botocore_config)
+
+    def resource(self, service_name: str) -> Any:
+        """
+        Create a resource for a service.
+
+        :param service_name: e.g. 'dynamodb'.
+        :return: A boto3 service resource.
+        """
+        with self._lock:
+            return self.session.resource(service_name, config=self.botocore_config)
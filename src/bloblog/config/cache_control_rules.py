@@ -0,0 +1,104 @@
+"""
+Compiles the cache_control configuration into a lookup table of Cache-Control headers.
+"""
+
+import bisect
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Transition time stored for headers that never change with age (9999-12-31T23:59:59Z).
+NO_TRANSITION = 253402300799
+
+class CacheControlRule:
+    """
+    One compiled rule: its settings and its age thresholds in ascending order.
+    """
+    def __init__(self, settings: str, ages: List[Tuple[timedelta, timedelta]]):
+        """
+        :param settings: Cache-Control directives appended to max-age.
+        :param ages: (item, max) pairs: files older than item are cached for max.
+        """
+        ages = sorted(ages, key=lambda age: age[0])
+        self.thresholds = [item.total_seconds() for item, _ in ages]
+        self.headers = [f"max-age={int(max_age.total_seconds())},{settings}" for _, max_age in ages]
+
+class CacheControlRules:
+    """
+    Resolves the Cache-Control header of a file from its MIME type and age.
+
+    Rules are looked up by exact MIME type first, then by wildcard major type
+    (e.g. "image/*"), and files matching no rule get the default header. A file
+    younger than every threshold of its rule also gets the default header;
+    otherwise it gets the max-age of the oldest threshold it has passed.
+
+    A file's age only matters through the number of thresholds it has passed
+    (its age bucket), so headers are memoized by (content_type, bucket).
+    """
+    def __init__(self, cache_control: Dict[str, Any], parse_age: Callable[[str], timedelta]):
+        """
+        :param cache_control: The cache_control section of the configuration.
+        :param parse_age: Parser for age strings such as "1w".
+        """
+        default = cache_control['default']
+        self.default_header = f"max-age={default['max-age']},{default['settings']}"
+        self._rules: Dict[str, CacheControlRule] = {}
+        for rule in cache_control.get('rules') or []:
+            compiled = CacheControlRule(
+                rule['settings'],
+                [(parse_age(age['item']), parse_age(age['max'])) for age in rule.get('age') or []]
+            )
+            for mimetype in rule['mimetype']:
+                # The first rule listing a MIME type wins, as before.
+                self._rules.setdefault(mimetype, compiled)
+        self._headers: Dict[Tuple[str, int], str] = {}
+
+    def rule_for(self, content_type: str) -> Optional[CacheControlRule]:
+        """
+        Find the rule of a MIME type: exact match, then "major/*".
+
+        :param content_type: MIME type of the file.
+        :return: The rule, or None if the default applies.
+        """
+        rule = self._rules.get(content_type)
+        if rule is None:
+            rule = self._rules.get(content_type.split('/', 1)[0] + '/*')
+        return rule
+
+    def header(self, content_type: str, age_seconds: float) -> str:
+        """
+        Return the Cache-Control header for a file.
+
+        :param content_type: MIME type of the file.
+        :param age_seconds: Seconds since the file was last modified.
+        :return: The Cache-Control header value.
+        """
+        rule = self.rule_for(content_type)
+        if rule is None:
+            return self.default_header
+        # Number of thresholds the file is strictly older than.
+        bucket = bisect.bisect_left(rule.thresholds, age_seconds)
+        key = (content_type, bucket)
+        header = self._headers.get(key)
+        if header is None:
+            header = rule.headers[bucket - 1] if bucket else self.default_header
+            self._headers[key] = header
+        return header
+
+    def next_transition(self, content_type: str, modified: float, age_seconds: float) -> int:
+        """
+        Return when the header of a file next changes, i.e. when it passes its
+        next age threshold.
+
+        :param content_type: MIME type of the file.
+        :param modified: POSIX time the file was last modified.
+        :param age_seconds: Seconds since the file was last modified.
+        :return: The POSIX time in whole seconds, or NO_TRANSITION.
+        """
+        rule = self.rule_for(content_type)
+        if rule is None:
+            return NO_TRANSITION
+        bucket = bisect.bisect_left(rule.thresholds, age_seconds)
+        if bucket >= len(rule.thresholds):
+            return NO_TRANSITION
+        # The header changes once the age is strictly greater than the threshold.
+        return int(modified + rule.thresholds[bucket]) + 1
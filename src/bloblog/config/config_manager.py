@@ -2,10 +2,14 @@
 Manages application configuration including cache control logic.
 """
 
+import os
+import time
 import yaml
-from typing import List
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime, timedelta
 from bloblog.metadata.file_metadata import FileMetadata
+from .exclude_matcher import ExcludeMatcher
+from .cache_control_rules import CacheControlRules
 import mimetypes
 
 
@@ -22,6 +26,8 @@ class ConfigManager:
         """
         with open(config_file, 'r') as file:
             self.config = yaml.safe_load(file)
+        self._exclude_matcher: Optional[ExcludeMatcher] = None
+        self._cache_control_rules: Optional[CacheControlRules] = None
 
     def get_sync_root_path(self) -> str:
         """
@@ -29,7 +35,8 @@ class ConfigManager:
 
         :return: The directory path as a string.
         """
-        return self.config['sync']['root_path']
+        root_path: str = self.config['sync']['root_path']
+        return root_path
 
     def get_exclude_patterns(self) -> List[str]:
         """
@@ -37,7 +44,18 @@ class ConfigManager:
 
         :return: List of glob patterns.
         """
-        return self.config['sync']['exclude_patterns']
+        patterns: List[str] = self.config['sync']['exclude_patterns']
+        return patterns
+
+    def get_exclude_matcher(self) -> ExcludeMatcher:
+        """
+        Retrieve the exclude patterns compiled into a single matcher, built once.
+
+        :return: An ExcludeMatcher for paths relative to the sync root.
+        """
+        if self._exclude_matcher is None:
+            self._exclude_matcher = ExcludeMatcher(self.get_exclude_patterns())
+        return self._exclude_matcher
 
     def get_workers(self) -> int:
         """
@@ -45,34 +63,224 @@ class ConfigManager:
 
         :return: The number of workers as an integer.
         """
-        return self.config.get('workers', 1)
+        return int(self.config.get('workers', 1))
+
+    def is_snapshot_enabled(self) -> bool:
+        """
+        Whether the metadata table should be preloaded into memory before the walk.
+
+        :return: True to look paths up in an in-memory snapshot, False to query per file.
+        """
+        return bool(self.config['sync'].get('snapshot', True))
+
+    def is_dedup_enabled(self) -> bool:
+        """
+        Whether files whose content is already in the bucket are copied server-side instead of uploaded.
+
+        :return: True to deduplicate by SHA-256, False to always upload.
+        """
+        return bool(self.config['sync'].get('dedup', True))
+
+    def get_hash_cache_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the local hash cache settings.
+
+        :return: A dict with enabled, path (None for the default location) and max_entries.
+        """
+        hash_cache = self.config['sync'].get('hash_cache') or {}
+        return {
+            'enabled': hash_cache.get('enabled', True),
+            'path': hash_cache.get('path'),
+            'max_entries': hash_cache.get('max_entries', 1000000)
+        }
+
+    def get_journal_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the settings of the journal that lets interrupted runs resume.
+
+        :return: A dict with enabled and path (None for the default location).
+        """
+        journal = self.config['sync'].get('journal') or {}
+        return {
+            'enabled': journal.get('enabled', True),
+            'path': journal.get('path')
+        }
+
+    def get_scan_segments(self) -> int:
+        """
+        Retrieve the number of parallel segments used to scan the metadata table.
+
+        :return: The number of scan segments, defaulting to the number of workers.
+        """
+        return int(self.config['sync'].get('scan_segments', self.get_workers()))
+
+    def get_transfer_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the S3 transfer settings, with sizes converted to bytes.
+
+        :return: A dict with multipart_threshold, multipart_chunksize, max_concurrency,
+            max_total_threads and max_inflight_bytes.
+        """
+        transfer = self.config.get('transfer') or {}
+        return {
+            'multipart_threshold': self._parse_size(transfer.get('multipart_threshold', '64MB')),
+            'multipart_chunksize': self._parse_size(transfer.get('multipart_chunksize', '16MB')),
+            'max_concurrency': transfer.get('max_concurrency', 8),
+            'max_total_threads': transfer.get('max_total_threads', 32),
+            'max_inflight_bytes': self._parse_size(transfer.get('max_inflight_bytes', '1GB'))
+        }
+
+    def get_hashing_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the hashing engine settings, with sizes converted to bytes.
+
+        :return: A dict with chunk_size, use_mmap, process_threshold and processes.
+        """
+        hashing = self.config.get('hashing') or {}
+        return {
+            'chunk_size': self._parse_size(hashing.get('chunk_size', '1MB')),
+            'use_mmap': hashing.get('use_mmap', True),
+            'process_threshold': self._parse_size(hashing.get('process_threshold', '32MB')),
+            'processes': hashing.get('processes', os.cpu_count() or 1)
+        }
+
+    def get_watch_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the settings of watch mode.
+
+        :return: A dict with debounce, max_delay and rescan_interval in seconds.
+        """
+        watch = self.config.get('watch') or {}
+        return {
+            'debounce': float(watch.get('debounce', 0.5)),
+            'max_delay': float(watch.get('max_delay', 5.0)),
+            'rescan_interval': float(watch.get('rescan_interval', 60.0))
+        }
+
+    def get_logging_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the logging settings.
+
+        :return: A dict with level, format, output and file_path (None unless logging to a file).
+        """
+        logging_config = self.config.get('logging') or {}
+        return {
+            'level': logging_config.get('level', 'INFO'),
+            'format': logging_config.get('format', 'text'),
+            'output': logging_config.get('output', 'stdout'),
+            'file_path': logging_config.get('file_path')
+        }
+
+    def get_metrics_config(self) -> Dict[str, Any]:
+        """
+        Retrieve where the metrics of a run are written, from logging.metrics.
+
+        :return: A dict with json_path and prometheus_path, each None when that export is disabled.
+        """
+        metrics = (self.config.get('logging') or {}).get('metrics') or {}
+        return {
+            'json_path': metrics.get('json_path'),
+            'prometheus_path': metrics.get('prometheus_path')
+        }
+
+    def get_aws_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the settings for AWS clients. Unless set explicitly, the connection
+        pool is sized for the most concurrent requests one client can issue: every
+        worker plus all transfer threads for S3, or every worker plus all scan
+        segments for DynamoDB. botocore makes a single attempt per request by
+        default, as the rate control retries failed requests itself.
+
+        :return: A dict of SessionFactory keyword arguments.
+        """
+        aws = self.config.get('aws') or {}
+        concurrency = self.get_workers() + max(
+            self.get_transfer_config()['max_total_threads'],
+            self.get_scan_segments()
+        )
+        return {
+            'max_pool_connections': aws.get('max_pool_connections', max(10, concurrency)),
+            'connect_timeout': aws.get('connect_timeout', 10),
+            'read_timeout': aws.get('read_timeout', 60),
+            'retry_mode': aws.get('retry_mode', 'standard'),
+            'max_attempts': aws.get('max_attempts', 1),
+            'tcp_keepalive': aws.get('tcp_keepalive', True)
+        }
+
+    def get_compression_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the settings of the optional compression of uploads.
+
+        :return: A dict with rules (empty when compression is off), min_size in
+            bytes, and cache with enabled, path (None for the default location)
+            and max_size in bytes.
+        """
+        compression = self.config.get('compression') or {}
+        cache = compression.get('cache') or {}
+        return {
+            'rules': compression.get('rules') or [],
+            'min_size': self._parse_size(compression.get('min_size', '1KB')),
+            'cache': {
+                'enabled': cache.get('enabled', True),
+                'path': cache.get('path'),
+                'max_size': self._parse_size(cache.get('max_size', '1GB'))
+            }
+        }
+
+    def get_rate_control_config(self) -> Dict[str, Any]:
+        """
+        Retrieve the settings of the client-side rate control of AWS requests
+        (aws.rate_control).
+
+        :return: A dict with max_attempts, base_delay and max_delay of request
+            retries, task_attempts, and the token bucket settings of each
+            configured service under services.
+        """
+        rate_control = (self.config.get('aws') or {}).get('rate_control') or {}
+        return {
+            'max_attempts': rate_control.get('max_attempts', 8),
+            'base_delay': rate_control.get('base_delay', 0.1),
+            'max_delay': rate_control.get('max_delay', 20),
+            'task_attempts': rate_control.get('task_attempts', 3),
+            'services': rate_control.get('services') or {}
+        }
+
+    def get_cache_control_rules(self) -> CacheControlRules:
+        """
+        Retrieve the cache_control rules, compiled once into a lookup table.
+
+        :return: A CacheControlRules instance.
+        """
+        if self._cache_control_rules is None:
+            self._cache_control_rules = CacheControlRules(self.config['cache_control'], self._parse_age)
+        return self._cache_control_rules
 
     def cache_control(self, file_metadata: FileMetadata) -> FileMetadata:
         """
         Determine the appropriate Cache-Control header for a given file.
 
+        The age of the file is taken from its mtime_ns, or from last_modified
+        for records that predate it. The time at which the header next changes
+        is stored in cache_control_transition.
+
         :param file_metadata: A FileMetadata instance.
         :return: the updated FileMetadata instance.
         """
-        default_cache_control = self.config['cache_control']['default']
-        rules = self.config['cache_control']['rules']
-        last_modified = datetime.strptime(file_metadata.last_modified, "%Y-%m-%dT%H:%M:%S")
-        file_metadata.cache_control = f"max-age={default_cache_control['max-age']},{default_cache_control['settings']}"
-
-        for rule in rules:
-            if file_metadata.content_type in rule['mimetype']:
-                for age_rule in rule['age']:
-                    item_time = self._parse_age(age_rule['item'])
-                    max_time = self._parse_age(age_rule['max'])
-                    if datetime.now() - last_modified > item_time:
-                        file_metadata.cache_control = f"max-age={int(max_time.total_seconds())},{rule['settings']}"
-                    else:
-                        break
-                else:
-                    continue
-                break
+        rules = self.get_cache_control_rules()
+        modified = self._modified_timestamp(file_metadata)
+        age = time.time() - modified
+        file_metadata.cache_control = rules.header(file_metadata.content_type, age)
+        file_metadata.cache_control_transition = rules.next_transition(file_metadata.content_type, modified, age)
         return file_metadata
 
+    def _modified_timestamp(self, file_metadata: FileMetadata) -> float:
+        """
+        Return when a file was last modified, as a POSIX timestamp.
+        """
+        if file_metadata.mtime_ns:
+            return file_metadata.mtime_ns / 1e9
+        return datetime.fromisoformat(file_metadata.last_modified).timestamp()
+
     def _parse_age(self, age_str: str) -> timedelta:
         """
         Parse an age string into a timedelta object.
@@ -92,3 +300,19 @@ class ConfigManager:
             return timedelta(days=value * 365)
         else:
             raise ValueError(f"Unknown age unit: {unit}")
+
+    def _parse_size(self, size: Union[int, str]) -> int:
+        """
+        Parse a size into bytes.
+
+        :param size: Number of bytes, or a string with a unit (e.g., "512KB", "64MB", "1GB").
+        :return: The size in bytes.
+        """
+        if isinstance(size, int):
+            return size
+        units = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'B': 1}
+        size_str = str(size).strip().upper()
+        for unit, multiplier in units.items():
+            if size_str.endswith(unit):
+                return int(float(size_str[:-len(unit)]) * multiplier)
+        return int(size_str)
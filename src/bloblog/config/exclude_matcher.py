@@ -0,0 +1,95 @@
+"""
+Compiles exclude patterns into a single matcher for relative paths.
+"""
+
+import re
+from typing import List
+
+# Characters that make a pattern a glob rather than a literal.
+GLOB_CHARS = set('*?[')
+
+class ExcludeMatcher:
+    """
+    Matches relative paths (using '/' separators) against exclude patterns.
+
+    Three pattern forms are supported:
+    - regex: prefixed with "re:" or written as r"..." / r'...'; searched anywhere in the path.
+    - glob: contains *, ? or [...]; "**" crosses directories, "*" and "?" do not.
+      Without a "/" it matches any path component, e.g. "*.tmp" or "node_modules";
+      with a "/" it is anchored at the sync root, e.g. "drafts/*.md".
+    - literal: anything else; matched as a substring of the path.
+
+    A pattern that matches a directory also matches everything below it, so the
+    walker can prune excluded directories without listing them.
+    """
+    def __init__(self, patterns: List[str]):
+        """
+        :param patterns: Exclude patterns from the configuration.
+        :raises ValueError: If a regex pattern does not compile.
+        """
+        self.patterns = list(patterns or [])
+        parts = [f"(?:{self._translate(pattern)})" for pattern in self.patterns]
+        self._regex = re.compile("|".join(parts)) if parts else None
+
+    def matches(self, relative_path: str) -> bool:
+        """
+        Check whether a path, or one of its parent directories, is excluded.
+
+        :param relative_path: Path relative to the sync root, using '/' separators.
+        :return: True if the path should be excluded.
+        """
+        return self._regex is not None and self._regex.search(relative_path) is not None
+
+    @classmethod
+    def _translate(cls, pattern: str) -> str:
+        """
+        Translate one exclude pattern into a regular expression.
+        """
+        if pattern.startswith('re:'):
+            regex = pattern[3:]
+        elif len(pattern) >= 3 and pattern[0] == 'r' and pattern[1] in '"\'' and pattern[-1] == pattern[1]:
+            regex = pattern[2:-1]
+        elif GLOB_CHARS & set(pattern):
+            return cls._translate_glob(pattern)
+        else:
+            return re.escape(pattern)
+        try:
+            re.compile(regex)
+        except re.error as e:
+            raise ValueError(f"Invalid exclude regex {pattern!r}: {e}") from e
+        return regex
+
+    @staticmethod
+    def _translate_glob(pattern: str) -> str:
+        """
+        Translate a glob into a regex matching whole path components.
+        """
+        anchored = '/' in pattern.rstrip('/')
+        pattern = pattern.strip('/')
+        regex = ''
+        index = 0
+        while index < len(pattern):
+            char = pattern[index]
+            if pattern.startswith('**', index):
+                regex += '.*'
+                index += 2
+                continue
+            if char == '*':
+                regex += '[^/]*'
+            elif char == '?':
+                regex += '[^/]'
+            elif char == '[':
+                end = pattern.find(']', index + 2)
+                if end == -1:
+                    regex += re.escape(char)
+                else:
+                    body = pattern[index + 1:end]
+                    if body.startswith('!'):
+                        body = '^' + body[1:]
+                    regex += f"[{body.replace(chr(92), chr(92) * 2)}]"
+                    index = end
+            else:
+                regex += re.escape(char)
+            index += 1
+        prefix = '^' if anchored else '(?:^|/)'
+        return f"{prefix}{regex}(?:/|$)"
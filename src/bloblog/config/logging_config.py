@@ -0,0 +1,61 @@
+"""
+Configures Python logging from the logging section of the configuration.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import sys
+from typing import Any, Dict
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def configure_logging(logging_config: Dict[str, Any]) -> None:
+    """
+    Set up the root logger.
+
+    :param logging_config: A dict with level, format ("json" or "text"), output
+        ("stdout", "stderr", "file" or "syslog") and file_path, as returned by
+        ConfigManager.get_logging_config().
+    :raises ValueError: If the output is unknown or a file output has no file_path.
+    """
+    output = logging_config['output']
+    handler: logging.Handler
+    if output == 'stdout':
+        handler = logging.StreamHandler(sys.stdout)
+    elif output == 'stderr':
+        handler = logging.StreamHandler(sys.stderr)
+    elif output == 'file':
+        if not logging_config.get('file_path'):
+            raise ValueError("logging.file_path is required when logging.output is 'file'")
+        handler = logging.FileHandler(logging_config['file_path'])
+    elif output == 'syslog':
+        address = '/dev/log' if os.path.exists('/dev/log') else ('localhost', 514)
+        handler = logging.handlers.SysLogHandler(address=address)
+    else:
+        raise ValueError(f"Unsupported logging output: {output}")
+
+    if logging_config['format'] == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(logging_config['level'].upper())
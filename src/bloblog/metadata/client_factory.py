@@ -2,22 +2,41 @@
 Factory for creating MetadataClient instances based on db type.
 """
 
+from typing import Any, Dict, Optional
+from bloblog.aws.rate_control import RateControl
+from bloblog.aws.session_factory import SessionFactory
+from bloblog.metrics.metrics import Metrics
 from .metadata_client import MetadataClient
 from .dynamodb_client import DynamoDBClient
+from .sqlite_client import SQLiteClient
 
 class MetadataClientFactory:
     """
     Factory to create MetadataClient instances for different database types 
-    (e.g., DynamoDB, Elasticsearch, SimpleDB).
+    (e.g., DynamoDB, SQLite, Elasticsearch, SimpleDB).
     """
-    def get_client(self, db_config: dict) -> MetadataClient:
+    def get_client(
+        self,
+        db_config: Dict[str, Any],
+        session_factory: Optional[SessionFactory] = None,
+        metrics: Optional[Metrics] = None,
+        rate_control: Optional[RateControl] = None
+    ) -> MetadataClient:
         """
         Return a MetadataClient instance for the given db_type.
 
-        :param db_type: 'dynamodb', 'elasticsearch', 'simpledb', etc.
+        :param db_config: The metadb settings: type ('dynamodb', 'sqlite', ...) and name,
+            the table name for DynamoDB or the database file for SQLite.
+        :param session_factory: Shared factory for AWS-backed clients.
+        :param metrics: Registry for request counts and latencies.
+        :param rate_control: Shared pacing and retries of AWS requests.
         :return: A MetadataClient instance.
         """
         if db_config['type'] == 'dynamodb':
-            return DynamoDBClient(db_config['name'])
+            return DynamoDBClient(
+                db_config['name'], session_factory=session_factory, metrics=metrics, rate_control=rate_control
+            )
+        elif db_config['type'] == 'sqlite':
+            return SQLiteClient(db_config['name'], metrics=metrics)
         else:
             raise ValueError(f"Unsupported db_type: {db_config['type']}")
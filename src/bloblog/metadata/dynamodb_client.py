@@ -3,58 +3,175 @@ DynamoDB implementation of the MetadataClient interface.
 """
 
 import boto3
-from typing import List, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from concurrent.futures import ThreadPoolExecutor
 import botocore.exceptions
+from bloblog.aws.rate_control import RateControl
+from bloblog.aws.session_factory import SessionFactory
+from bloblog.metrics.metrics import Metrics
 from .metadata_client import MetadataClient
 from .file_metadata import FileMetadata
 
+# Maximum number of put/delete requests DynamoDB accepts in one BatchWriteItem call.
+BATCH_WRITE_SIZE = 25
+# Number of times UnprocessedItems are resubmitted before giving up.
+BATCH_WRITE_RETRIES = 8
+
+T = TypeVar('T')
+
 class DynamoDBClient(MetadataClient):
     """
     Handles metadata operations using a DynamoDB table.
     """
-    def __init__(self, table_name: str):
+    def __init__(
+        self,
+        table_name: str,
+        session_factory: Optional[SessionFactory] = None,
+        metrics: Optional[Metrics] = None,
+        rate_control: Optional[RateControl] = None
+    ):
         """
         :param table_name: Name of the DynamoDB table.
+        :param session_factory: Shared factory for the DynamoDB resource; the boto3 default is used when omitted.
+        :param metrics: Registry for request counts and latencies.
+        :param rate_control: Shared pacing and retries of requests; a default one is used when omitted.
         """
         self.table_name = table_name
-        self.dynamodb = boto3.resource('dynamodb')
+        self.metrics = metrics or Metrics()
+        if session_factory is not None:
+            self.dynamodb = session_factory.resource('dynamodb')
+        else:
+            self.dynamodb = boto3.resource('dynamodb')
         self.table = self.dynamodb.Table(table_name)
+        self.rate_control = rate_control or RateControl(metrics=self.metrics)
+        self.rate_control.observe(self.dynamodb.meta.client, 'dynamodb')
+        # Write-behind buffer of put/delete requests keyed by uuid, so repeated
+        # writes of a record collapse into one. A put keeps its record, which is
+        # marked clean once the request is written.
+        self._pending: Dict[str, Tuple[Dict[str, Any], Optional[FileMetadata]]] = {}
+        self._pending_lock = threading.Lock()
+        # Serializes batch sends so an older version of a record never overwrites a newer one.
+        self._send_lock = threading.Lock()
 
     def add(self, item: FileMetadata) -> None:
         """See base class docstring."""
         try:
-            self.table.put_item(Item=item.__dict__)
+            self._send('put_item', lambda: self.table.put_item(Item=item.to_item()))
+            item.mark_clean()
         except botocore.exceptions.ClientError as e:
             # Handle the error appropriately
             raise e
 
     def update(self, item: FileMetadata) -> None:
         """See base class docstring."""
+        dirty_fields = sorted(item.dirty_fields)
+        if not dirty_fields:
+            return
+        names = {f'#f{index}': name for index, name in enumerate(dirty_fields)}
+        values = {f':v{index}': getattr(item, name) for index, name in enumerate(dirty_fields)}
+        names['#uuid'] = 'uuid'
         try:
-            self.table.update_item(
+            self._send('update_item', lambda: self.table.update_item(
                 Key={'uuid': item.uuid},
-                UpdateExpression="set relative_path=:rp, last_modified=:lm, upload_status=:us, sha256=:sh, cache_control=:cc, content_type=:ct",
-                ExpressionAttributeValues={
-                    ':rp': item.relative_path,
-                    ':lm': item.last_modified,
-                    ':us': item.upload_status,
-                    ':sh': item.sha256,
-                    ':cc': item.cache_control,
-                    ':ct': item.content_type
-                }
-            )
+                UpdateExpression="set " + ", ".join(f'#f{index}=:v{index}' for index in range(len(dirty_fields))),
+                # Never recreate a record that was deleted in the meantime.
+                ConditionExpression="attribute_exists(#uuid)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            ))
+            item.mark_clean()
         except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return
             # Handle the error appropriately
             raise e
-    
+
+    def add_batched(self, item: FileMetadata) -> None:
+        """See base class docstring."""
+        with self._pending_lock:
+            self._pending[item.uuid] = ({'PutRequest': {'Item': item.to_item()}}, item)
+            full = len(self._pending) >= BATCH_WRITE_SIZE
+        if full:
+            self._drain(force=False)
+
+    def delete_batched(self, item: FileMetadata) -> None:
+        """See base class docstring."""
+        with self._pending_lock:
+            self._pending[item.uuid] = ({'DeleteRequest': {'Key': {'uuid': item.uuid}}}, None)
+            full = len(self._pending) >= BATCH_WRITE_SIZE
+        if full:
+            self._drain(force=False)
+
+    def flush(self) -> None:
+        """See base class docstring."""
+        self._drain(force=True)
+
+    def _drain(self, force: bool) -> None:
+        """
+        Send buffered requests in BatchWriteItem groups of BATCH_WRITE_SIZE. A
+        group that fails goes back to the buffer, behind any newer write of the
+        same records, so a later flush sends it again. The records of a group
+        are marked clean once it is written, unless they changed since they
+        were buffered.
+
+        :param force: Also send a final partial group when True.
+        :raises ClientError: If a group could not be written.
+        """
+        with self._send_lock:
+            while True:
+                with self._pending_lock:
+                    if not self._pending or (not force and len(self._pending) < BATCH_WRITE_SIZE):
+                        return
+                    keys = list(self._pending)[:BATCH_WRITE_SIZE]
+                    batch = [self._pending.pop(key) for key in keys]
+                try:
+                    self._write_batch([request for request, _ in batch])
+                except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError):
+                    with self._pending_lock:
+                        for key, entry in zip(keys, batch):
+                            self._pending.setdefault(key, entry)
+                    raise
+                for request, item in batch:
+                    if item is not None and item.to_item() == request['PutRequest']['Item']:
+                        item.mark_clean()
+
+    def _write_batch(self, requests: List[Dict[str, Any]]) -> None:
+        """
+        Send one group of put/delete requests. UnprocessedItems mean the table
+        is out of capacity: they slow the DynamoDB bucket of the rate control
+        down and are resubmitted after a jittered exponential backoff.
+
+        :param requests: Up to BATCH_WRITE_SIZE PutRequest or DeleteRequest entries.
+        :raises ClientError: ProvisionedThroughputExceededException, which is
+            retryable, if items are still unprocessed after BATCH_WRITE_RETRIES retries.
+        """
+        request_items = {self.table_name: requests}
+        for attempt in range(BATCH_WRITE_RETRIES + 1):
+            response = self._send('batch_write_item', lambda: self.dynamodb.batch_write_item(RequestItems=request_items))
+            sent = sum(len(requests) for requests in request_items.values())
+            request_items = response.get('UnprocessedItems') or {}
+            unprocessed = sum(len(requests) for requests in request_items.values())
+            self.metrics.increment('dynamodb_items_written_total', sent - unprocessed)
+            if not request_items:
+                return
+            self.metrics.increment('dynamodb_unprocessed_items_total', unprocessed)
+            self.rate_control.throttled('dynamodb')
+            self.rate_control.wait(attempt + 1)
+        raise botocore.exceptions.ClientError({'Error': {
+            'Code': 'ProvisionedThroughputExceededException',
+            'Message': f"{unprocessed} items left unprocessed in {self.table_name} after {BATCH_WRITE_RETRIES} retries"
+        }}, 'BatchWriteItem')
+
     def get_file_metadata(self, relative_path: str) -> Optional[FileMetadata]:
         """See base class docstring."""
         try:
-            response = self.table.query(
+            response = self._send('query', lambda: self.table.query(
                 IndexName='RelativePathIndex',
                 KeyConditionExpression='relative_path = :rp',
                 ExpressionAttributeValues={':rp': relative_path}
-            )
+            ))
             items = response.get('Items', [])
             if not items:
                 return None
@@ -63,21 +180,92 @@ class DynamoDBClient(MetadataClient):
             # Handle the error appropriately
             raise e
 
-    def fetch_all_records(self) -> List[FileMetadata]:
+    def fetch_all_records(self, segments: int = 1) -> List[FileMetadata]:
         """See base class docstring."""
-        items = []
+        return self._scan(segments)
+
+    def fetch_due_transitions(self, now: int, segments: int = 1) -> List[FileMetadata]:
+        """See base class docstring."""
+        # The filter is applied by DynamoDB, so only due records are returned.
+        return self._scan(
+            segments,
+            FilterExpression='attribute_not_exists(#transition) OR #transition <= :now',
+            ExpressionAttributeNames={'#transition': 'cache_control_transition'},
+            ExpressionAttributeValues={':now': now}
+        )
+
+    def _scan(self, segments: int, **filter_kwargs: Any) -> List[FileMetadata]:
+        """
+        Scan the table, in parallel segments when segments > 1.
+
+        :param segments: Number of parallel scan segments.
+        :param filter_kwargs: Optional FilterExpression and expression attributes.
+        :return: The matching records.
+        """
         try:
-            paginator = self.dynamodb.meta.client.get_paginator('scan')
-            for page in paginator.paginate(TableName=self.table_name):
-                items.extend(page.get('Items', []))
-            return [FileMetadata(**item) for item in items]
+            if segments <= 1:
+                return [FileMetadata(**item) for item in self._scan_segment(**filter_kwargs)]
+            with ThreadPoolExecutor(max_workers=segments) as executor:
+                futures = [
+                    executor.submit(self._scan_segment, segment, segments, **filter_kwargs)
+                    for segment in range(segments)
+                ]
+                return [FileMetadata(**item) for future in futures for item in future.result()]
         except botocore.exceptions.ClientError as e:
             # Handle the error appropriately
             raise e
 
+    def _scan_segment(self, segment: int = 0, total_segments: int = 1, **filter_kwargs: Any) -> List[Dict[str, Any]]:
+        """
+        Run a paginated scan over one segment of the table.
+
+        :param segment: Zero-based segment number to scan.
+        :param total_segments: Total number of segments the table is split into.
+        :param filter_kwargs: Optional FilterExpression and expression attributes.
+        :return: The items of the segment.
+        """
+        scan_kwargs = dict(filter_kwargs, TableName=self.table_name)
+        if total_segments > 1:
+            scan_kwargs.update(Segment=segment, TotalSegments=total_segments)
+
+        def scan() -> List[Dict[str, Any]]:
+            # A failed scan is retried from the first page of its segment.
+            items = []
+            paginator = self.dynamodb.meta.client.get_paginator('scan')
+            started = time.perf_counter()
+            for page in paginator.paginate(**scan_kwargs):
+                # Each page is one Scan request.
+                self.metrics.observe('dynamodb_request_seconds', time.perf_counter() - started, operation='scan')
+                self.metrics.increment('dynamodb_requests_total', operation='scan', outcome='ok')
+                items.extend(page.get('Items', []))
+                started = time.perf_counter()
+            return items
+
+        items = self.rate_control.call('dynamodb', 'scan', scan)
+        self.metrics.increment('dynamodb_items_read_total', len(items))
+        return items
+
     def delete(self, item: FileMetadata) -> None:
         """See base class docstring."""
-        try:
-            self.table.delete_item(Key={'uuid': item.uuid})
-        except botocore.exceptions.ClientError as e:
-            raise e
+        # Drop any buffered put first so a later flush cannot bring the record back.
+        with self._send_lock:
+            with self._pending_lock:
+                self._pending.pop(item.uuid, None)
+            try:
+                self._send('delete_item', lambda: self.table.delete_item(Key={'uuid': item.uuid}))
+            except botocore.exceptions.ClientError as e:
+                raise e
+
+    def _send(self, operation: str, request: Callable[[], T]) -> T:
+        """
+        Send a request through the rate control, recording the latency and
+        outcome of each attempt.
+
+        :param operation: Operation name for the metrics.
+        :param request: Sends the request; called once per attempt.
+        :return: The response.
+        """
+        def attempt() -> T:
+            with self.metrics.request('dynamodb', operation):
+                return request()
+        return self.rate_control.call('dynamodb', operation, attempt)
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Set
 
 """
 Data container for file metadata involved in synchronization.
@@ -9,12 +10,24 @@ class FileMetadata:
     """
     Represents metadata of a file being tracked.
 
+    Field values are remembered when the record is created and whenever it is
+    marked clean, so callers can tell which fields changed and skip writing
+    records that did not.
+
     :param uuid: Unique identifier for the file.
     :param relative_path: Relative path of the file from the sync root.
     :param last_modified: Timestamp of the file's last modification.
     :param upload_status: upload_pending, delete_pending, update_pending or uploaded
     :param sha256: SHA-256 hash of the file content.
     :param cache_control: Cache-Control header for the file.
+    :param content_type: MIME type of the file.
+    :param size: Size of the file in bytes when it was last synchronized.
+    :param mtime_ns: Modification time of the file in nanoseconds when it was last synchronized.
+    :param cache_control_transition: POSIX time at which cache_control next changes with the file's age,
+        0 if not yet computed.
+    :param content_encoding: Content-Encoding of the object in S3, e.g. gzip or br; empty if stored as is.
+    :param encoded_size: Size in bytes of the encoded object, 0 if stored as is.
+    :param encoded_sha256: SHA-256 hash of the encoded object, empty if stored as is.
     """
     uuid: str
     relative_path: str
@@ -23,3 +36,42 @@ class FileMetadata:
     sha256: str
     cache_control: str
     content_type: str
+    size: int = 0
+    mtime_ns: int = 0
+    cache_control_transition: int = 0
+    content_encoding: str = ''
+    encoded_size: int = 0
+    encoded_sha256: str = ''
+
+    def __post_init__(self) -> None:
+        # DynamoDB returns numbers as Decimal.
+        self.size = int(self.size)
+        self.mtime_ns = int(self.mtime_ns)
+        self.cache_control_transition = int(self.cache_control_transition)
+        self.encoded_size = int(self.encoded_size)
+        self.mark_clean()
+
+    def to_item(self) -> Dict[str, Any]:
+        """
+        Return the persisted fields as a dict.
+        """
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+    def mark_clean(self) -> None:
+        """
+        Remember the current field values as persisted.
+        """
+        self._clean = self.to_item()
+
+    @property
+    def dirty_fields(self) -> Set[str]:
+        """
+        Names of the fields whose values differ from the persisted ones.
+        """
+        return {name for name, value in self.to_item().items() if self._clean[name] != value}
+
+    def is_dirty(self) -> bool:
+        """
+        Whether any field differs from its persisted value.
+        """
+        return bool(self.dirty_fields)
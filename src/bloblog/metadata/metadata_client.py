@@ -3,7 +3,7 @@ Interface for metadata database operations.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Dict, List, Optional
 from .file_metadata import FileMetadata
 
 class MetadataClient(ABC):
@@ -22,12 +22,47 @@ class MetadataClient(ABC):
     @abstractmethod
     def update(self, item: FileMetadata) -> None:
         """
-        Update an existing file metadata record.
+        Update an existing file metadata record. Only the fields changed since
+        the record was loaded or last written are sent, and a record with no
+        changes is not written at all.
 
         :param item: The updated FileMetadata object.
         """
         pass
 
+    def add_batched(self, item: FileMetadata) -> None:
+        """
+        Queue a file metadata record for a batched, write-behind put of the whole record.
+
+        Backends without batch support write the record immediately. Call
+        flush() to make sure every queued record has been persisted.
+
+        :param item: The FileMetadata object.
+        """
+        self.add(item)
+
+    def delete_batched(self, item: FileMetadata) -> None:
+        """
+        Queue a file metadata record for a batched, write-behind delete.
+
+        Backends without batch support delete the record immediately.
+
+        :param item: The FileMetadata object.
+        """
+        self.delete(item)
+
+    def flush(self) -> None:
+        """
+        Persist every write queued by add_batched or delete_batched.
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Release local resources such as connections. Writes that were not flushed may be lost.
+        """
+        pass
+
     @abstractmethod
     def get_file_metadata(self, relative_path: str) -> Optional[FileMetadata]:
         """
@@ -39,14 +74,37 @@ class MetadataClient(ABC):
         pass
 
     @abstractmethod
-    def fetch_all_records(self) -> List[FileMetadata]:
+    def fetch_all_records(self, segments: int = 1) -> List[FileMetadata]:
         """
         Fetch all file metadata records.
 
+        :param segments: Number of parallel scan segments. Backends that cannot
+            scan in parallel may ignore it.
         :return: A list of FileMetadata objects.
         """
         pass
 
+    def fetch_snapshot(self, segments: int = 1) -> Dict[str, FileMetadata]:
+        """
+        Load every record into an in-memory index keyed by relative path.
+
+        :param segments: Number of parallel scan segments.
+        :return: A dict mapping relative_path to FileMetadata.
+        """
+        return {record.relative_path: record for record in self.fetch_all_records(segments)}
+
+    def fetch_due_transitions(self, now: int, segments: int = 1) -> List[FileMetadata]:
+        """
+        Fetch the records whose cache_control_transition has passed, i.e. whose
+        Cache-Control header may be out of date. Records without a computed
+        transition are included.
+
+        :param now: Current POSIX time in seconds.
+        :param segments: Number of parallel scan segments.
+        :return: A list of FileMetadata objects.
+        """
+        return [record for record in self.fetch_all_records(segments) if record.cache_control_transition <= now]
+
     @abstractmethod
     def delete(self, item: FileMetadata) -> None:
         """
@@ -0,0 +1,242 @@
+"""
+SQLite implementation of the MetadataClient, for single-host deployments and local benchmarks.
+"""
+
+import sqlite3
+import threading
+from dataclasses import fields
+from typing import Any, Dict, List, Optional, Tuple
+from bloblog.metrics.metrics import Metrics
+from .metadata_client import MetadataClient
+from .file_metadata import FileMetadata
+
+# Buffered writes applied per transaction.
+BATCH_SIZE = 500
+
+# Seconds a writer waits for another connection's transaction to finish.
+BUSY_TIMEOUT = 30.0
+
+COLUMNS = [field.name for field in fields(FileMetadata)]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS files ("
+    " uuid TEXT PRIMARY KEY,"
+    " relative_path TEXT NOT NULL,"
+    " last_modified TEXT NOT NULL,"
+    " upload_status TEXT NOT NULL,"
+    " sha256 TEXT NOT NULL,"
+    " cache_control TEXT NOT NULL,"
+    " content_type TEXT NOT NULL,"
+    " size INTEGER NOT NULL DEFAULT 0,"
+    " mtime_ns INTEGER NOT NULL DEFAULT 0,"
+    " cache_control_transition INTEGER NOT NULL DEFAULT 0,"
+    " content_encoding TEXT NOT NULL DEFAULT '',"
+    " encoded_size INTEGER NOT NULL DEFAULT 0,"
+    " encoded_sha256 TEXT NOT NULL DEFAULT '')",
+    "CREATE UNIQUE INDEX IF NOT EXISTS files_relative_path ON files (relative_path)",
+    "CREATE INDEX IF NOT EXISTS files_cache_control_transition ON files (cache_control_transition)"
+]
+
+# Columns added after the first schema, with their definitions, for databases created before them.
+ADDED_COLUMNS = {
+    'content_encoding': "TEXT NOT NULL DEFAULT ''",
+    'encoded_size': "INTEGER NOT NULL DEFAULT 0",
+    'encoded_sha256': "TEXT NOT NULL DEFAULT ''"
+}
+
+# A record replaces any row with the same uuid or the same relative_path.
+PUT_SQL = f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+DELETE_SQL = "DELETE FROM files WHERE uuid = ?"
+SELECT_SQL = f"SELECT {', '.join(COLUMNS)} FROM files"
+
+class SQLiteClient(MetadataClient):
+    """
+    Stores metadata in a local SQLite database in WAL mode, so lookups from the
+    walk workers run concurrently with writes and take microseconds instead of
+    a network round trip.
+
+    Each thread gets its own connection, whose statement cache keeps the
+    parameterized statements prepared. Writes queued with add_batched and
+    delete_batched are buffered like in DynamoDBClient and applied BATCH_SIZE
+    at a time in one transaction.
+    """
+    def __init__(self, path: str, metrics: Optional[Metrics] = None):
+        """
+        :param path: Path of the SQLite database file, created if missing.
+        :param metrics: Registry for request counts and latencies.
+        """
+        self.path = path
+        self.metrics = metrics or Metrics()
+        self._local = threading.local()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
+        # Buffered writes keyed by uuid: the record to put, or None to delete.
+        self._pending: Dict[str, Optional[FileMetadata]] = {}
+        self._pending_lock = threading.Lock()
+        # Serializes batch transactions so each buffered write is applied once, in order.
+        self._send_lock = threading.Lock()
+        connection = self._connection()
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            existing = {row[1] for row in connection.execute("PRAGMA table_info(files)")}
+            for name, definition in ADDED_COLUMNS.items():
+                if name not in existing:
+                    connection.execute(f"ALTER TABLE files ADD COLUMN {name} {definition}")
+
+    def add(self, item: FileMetadata) -> None:
+        """
+        Add or replace a file metadata record.
+
+        :param item: The FileMetadata object.
+        """
+        connection = self._connection()
+        with self.metrics.request('sqlite', 'put'), connection:
+            connection.execute(PUT_SQL, self._row(item))
+        item.mark_clean()
+
+    def update(self, item: FileMetadata) -> None:
+        """
+        Write the fields changed since the record was loaded or last written.
+        A record that was deleted in the meantime is not recreated.
+
+        :param item: The updated FileMetadata object.
+        """
+        dirty_fields = sorted(item.dirty_fields)
+        if not dirty_fields:
+            return
+        values = [getattr(item, name) for name in dirty_fields]
+        connection = self._connection()
+        with self.metrics.request('sqlite', 'update'), connection:
+            connection.execute(
+                f"UPDATE files SET {', '.join(f'{name} = ?' for name in dirty_fields)} WHERE uuid = ?",
+                values + [item.uuid]
+            )
+        item.mark_clean()
+
+    def add_batched(self, item: FileMetadata) -> None:
+        """
+        Queue a record for a batched put, writing a batch once BATCH_SIZE writes are queued.
+
+        :param item: The FileMetadata object.
+        """
+        with self._pending_lock:
+            self._pending[item.uuid] = item
+        self._drain(force=False)
+
+    def delete_batched(self, item: FileMetadata) -> None:
+        """
+        Queue a record for a batched delete, replacing any queued put of it.
+
+        :param item: The FileMetadata object.
+        """
+        with self._pending_lock:
+            self._pending[item.uuid] = None
+        self._drain(force=False)
+
+    def flush(self) -> None:
+        """
+        Write every queued put and delete.
+        """
+        self._drain(force=True)
+
+    def _drain(self, force: bool) -> None:
+        """
+        Apply queued writes in transactions of BATCH_SIZE, or all of them when forced.
+        """
+        with self._send_lock:
+            while True:
+                with self._pending_lock:
+                    if not self._pending or (not force and len(self._pending) < BATCH_SIZE):
+                        return
+                    uuids = list(self._pending)[:BATCH_SIZE]
+                    batch = [(uuid, self._pending.pop(uuid)) for uuid in uuids]
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[str, Optional[FileMetadata]]]) -> None:
+        puts = [item for _, item in batch if item is not None]
+        deletes = [(uuid,) for uuid, item in batch if item is None]
+        connection = self._connection()
+        with self.metrics.request('sqlite', 'write_batch'), connection:
+            connection.executemany(DELETE_SQL, deletes)
+            connection.executemany(PUT_SQL, [self._row(item) for item in puts])
+        for item in puts:
+            item.mark_clean()
+        self.metrics.increment('sqlite_rows_written_total', len(batch))
+
+    def get_file_metadata(self, relative_path: str) -> Optional[FileMetadata]:
+        """
+        Get file metadata by its relative path.
+
+        :param relative_path: The relative path of the file.
+        :return: FileMetadata or None if not found.
+        """
+        with self.metrics.request('sqlite', 'get'):
+            row = self._connection().execute(SELECT_SQL + " WHERE relative_path = ?", (relative_path,)).fetchone()
+        return FileMetadata(*row) if row else None
+
+    def fetch_all_records(self, segments: int = 1) -> List[FileMetadata]:
+        """
+        Fetch all file metadata records. A local read needs no parallel segments.
+
+        :param segments: Ignored.
+        :return: A list of FileMetadata objects.
+        """
+        with self.metrics.request('sqlite', 'scan'):
+            rows = self._connection().execute(SELECT_SQL).fetchall()
+        return [FileMetadata(*row) for row in rows]
+
+    def fetch_due_transitions(self, now: int, segments: int = 1) -> List[FileMetadata]:
+        """
+        Fetch the records whose cache_control_transition has passed, using its index.
+
+        :param now: Current POSIX time in seconds.
+        :param segments: Ignored.
+        :return: A list of FileMetadata objects.
+        """
+        with self.metrics.request('sqlite', 'scan'):
+            rows = self._connection().execute(SELECT_SQL + " WHERE cache_control_transition <= ?", (now,)).fetchall()
+        return [FileMetadata(*row) for row in rows]
+
+    def delete(self, item: FileMetadata) -> None:
+        """
+        Delete file metadata by its item, discarding any queued write of it.
+        """
+        with self._send_lock:
+            with self._pending_lock:
+                self._pending.pop(item.uuid, None)
+            connection = self._connection()
+            with self.metrics.request('sqlite', 'delete'), connection:
+                connection.execute(DELETE_SQL, (item.uuid,))
+
+    def close(self) -> None:
+        """
+        Close every connection. Queued writes that were not flushed are lost.
+        """
+        with self._connections_lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections = {}
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Return the connection of the calling thread, opening it on first use.
+        Connections of threads that have exited are closed.
+        """
+        connection: Optional[sqlite3.Connection] = getattr(self._local, 'connection', None)
+        if connection is not None:
+            return connection
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connections_lock:
+            for thread in [thread for thread in self._connections if not thread.is_alive()]:
+                self._connections.pop(thread).close()
+            self._connections[threading.current_thread()] = connection
+        self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row(item: FileMetadata) -> Tuple[Any, ...]:
+        return tuple(getattr(item, name) for name in COLUMNS)
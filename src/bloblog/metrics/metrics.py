@@ -0,0 +1,246 @@
+"""
+Collects counters, gauges and histograms of a synchronization run and exports
+them as a JSON run summary and a Prometheus textfile.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, ContextManager, Dict, Iterator, List, Sequence, Tuple
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Upper bounds of the task queue depth histogram buckets.
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Prefix of every exported metric name.
+PREFIX = 'bloblog_'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """
+    Counts observations per bucket and tracks their sum and maximum.
+    """
+    def __init__(self, buckets: Sequence[float]):
+        """
+        :param buckets: Ascending upper bounds; an implicit +Inf bucket follows.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ('+Inf',), self._cumulative())}
+        }
+
+    def _cumulative(self) -> List[int]:
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+class Metrics:
+    """
+    Thread-safe registry of the metrics of one run.
+
+    Metrics are identified by a name and optional labels, e.g.
+    increment('s3_requests_total', operation='put_object'). Phase timings go to
+    the 'phase_seconds' histogram with a 'phase' label, so the summary can show
+    how busy each phase was; phases overlap across threads, so their sum can
+    exceed the wall-clock duration.
+    """
+    def __init__(self) -> None:
+        self.started = time.time()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Add to a counter.
+
+        :param name: Counter name, ending in _total by convention.
+        :param value: Amount to add.
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        """
+        Set a gauge to a value.
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str) -> None:
+        """
+        Record an observation in a histogram. The buckets of the first observation are kept.
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """
+        Observe the duration of the block, in seconds, even when it raises.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, LATENCY_BUCKETS, **labels)
+
+    @contextmanager
+    def request(self, service: str, operation: str) -> Iterator[None]:
+        """
+        Count an API request and observe its latency in <service>_requests_total
+        and <service>_request_seconds, labelled with the operation and its outcome.
+        """
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            self.observe(f'{service}_request_seconds', time.perf_counter() - started, operation=operation)
+            self.increment(f'{service}_requests_total', operation=operation, outcome=outcome)
+
+    def phase(self, phase: str) -> ContextManager[None]:
+        """
+        Time one step of a phase such as walk, hash, lookup, upload or metadata_write.
+        """
+        return self.timer('phase_seconds', phase=phase)
+
+    def summary(self, **extra: Any) -> Dict[str, Any]:
+        """
+        Return every metric as a JSON-serializable run summary.
+
+        :param extra: Additional top-level fields, e.g. the command and its status.
+        """
+        finished = time.time()
+        with self._lock:
+            counters = self._group(dict(self._counters))
+            gauges = self._group(dict(self._gauges))
+            histograms = self._group({key: histogram.to_dict() for key, histogram in self._histograms.items()})
+        phases = {
+            labels.split('=', 1)[1]: {'seconds': stats['sum'], 'count': stats['count'], 'max': stats['max']}
+            for labels, stats in histograms.get('phase_seconds', {}).items()
+        }
+        return dict(
+            extra,
+            started=datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            finished=datetime.fromtimestamp(finished, timezone.utc).isoformat(),
+            duration_seconds=finished - self.started,
+            phases=phases,
+            counters=counters,
+            gauges=gauges,
+            histograms=histograms
+        )
+
+    def to_prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    for (metric, labels), value in sorted(metrics.items()):
+                        if metric == name:
+                            lines.append(f"{PREFIX}{name}{self._format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (metric, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram._cumulative()):
+                        bucket_labels = labels + (('le', str(bound)),)
+                        lines.append(f"{PREFIX}{name}_bucket{self._format_labels(bucket_labels)} {count}")
+                    lines.append(f"{PREFIX}{name}_sum{self._format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{self._format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str, **extra: Any) -> None:
+        """
+        Write the run summary as JSON.
+        """
+        self._write_atomically(path, json.dumps(self.summary(**extra), indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write a Prometheus textfile, e.g. for the node_exporter textfile collector.
+        The file is replaced atomically so the collector never reads a partial file.
+        """
+        self._write_atomically(path, self.to_prometheus())
+
+    @staticmethod
+    def _write_atomically(path: str, content: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.bloblog-metrics-')
+        try:
+            # mkstemp creates the file readable by its owner only; give it the mode
+            # open() would, so a collector running as another user can read it.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(descriptor, 0o666 & ~umask)
+            with os.fdopen(descriptor, 'w') as f:
+                f.write(content)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def _format_labels(labels: Labels) -> str:
+        if not labels:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+    @staticmethod
+    def _group(metrics: Dict[Tuple[str, Labels], Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Nest metrics by name, then by their labels written as "key=value,...".
+        """
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for (name, labels), value in sorted(metrics.items(), key=lambda item: item[0]):
+            grouped.setdefault(name, {})[','.join(f"{key}={value}" for key, value in labels)] = value
+        return grouped
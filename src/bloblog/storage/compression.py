@@ -0,0 +1,237 @@
+"""
+Optional compression of uploads, configured per MIME type, with a local cache
+of the encoded artifacts keyed by the SHA-256 of their source content.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Any, Dict, List, NamedTuple, Optional
+from bloblog.metrics.metrics import Metrics
+
+try:
+    import brotli
+except ImportError:
+    # Optional dependency, only needed by rules with encoding "br".
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Default level of each supported Content-Encoding.
+DEFAULT_LEVELS = {'gzip': 9, 'br': 11}
+
+class CompressionRule(NamedTuple):
+    """
+    How the files of one MIME type are encoded.
+    """
+    encoding: str
+    level: int
+
+class EncodedContent(NamedTuple):
+    """
+    Encoded file content and the SHA-256 hex digest of the encoded bytes.
+    """
+    data: bytes
+    encoding: str
+    sha256: str
+
+class CompressionRules:
+    """
+    Resolves the compression rule of a MIME type: exact match first, then
+    "major/*", like the cache_control rules. Files matching no rule are not
+    compressed.
+    """
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """
+        :param rules: The compression.rules section of the configuration: each rule
+            has mimetype (a list), encoding ("gzip" or "br") and an optional level.
+        :raises ValueError: If a rule has an unknown encoding, or asks for "br"
+            while the brotli package is not installed.
+        """
+        self._rules: Dict[str, CompressionRule] = {}
+        for rule in rules:
+            encoding = rule.get('encoding', 'gzip')
+            if encoding not in DEFAULT_LEVELS:
+                raise ValueError(f"Unsupported compression encoding: {encoding}")
+            if encoding == 'br' and brotli is None:
+                raise ValueError("Compression with encoding br requires the brotli package")
+            compiled = CompressionRule(encoding, int(rule.get('level', DEFAULT_LEVELS[encoding])))
+            for mimetype in rule['mimetype']:
+                self._rules.setdefault(mimetype, compiled)
+
+    def rule_for(self, content_type: str) -> Optional[CompressionRule]:
+        """
+        :param content_type: MIME type of the file.
+        :return: The rule, or None if files of this type are uploaded as they are.
+        """
+        rule = self._rules.get(content_type)
+        if rule is None:
+            rule = self._rules.get(content_type.split('/', 1)[0] + '/*')
+        return rule
+
+class CompressionCache:
+    """
+    Encoded artifacts on local disk, one file per source SHA-256, encoding and
+    level, so content that did not change is never compressed twice, even when
+    its file is renamed or re-uploaded with other headers.
+
+    Each read refreshes the modification time of the artifact; close() evicts
+    the least recently used artifacts beyond max_size bytes. Artifacts are
+    written to a temporary file and renamed, so readers never see a partial one.
+    """
+    def __init__(self, path: str, max_size: int = 1024 ** 3):
+        """
+        :param path: Directory of the cache, created if missing.
+        :param max_size: Total bytes of artifacts kept by close().
+        """
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def default_path(sync_root: str) -> str:
+        """
+        Return the default cache location, a hidden directory next to the sync
+        root so it is never walked or uploaded itself.
+
+        :param sync_root: The local directory being synchronized.
+        :return: Path of the cache directory.
+        """
+        sync_root = os.path.abspath(sync_root)
+        return os.path.join(os.path.dirname(sync_root), f".{os.path.basename(sync_root)}.bloblog-compressed")
+
+    def get(self, source_sha256: str, rule: CompressionRule) -> Optional[bytes]:
+        """
+        :return: The cached artifact, or None if it is not cached.
+        """
+        artifact = self._artifact_path(source_sha256, rule)
+        try:
+            with open(artifact, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(artifact)
+        except OSError:
+            # Evicted by another process in the meantime; the data read is still valid.
+            pass
+        return data
+
+    def put(self, source_sha256: str, rule: CompressionRule, data: bytes) -> None:
+        """
+        Store an artifact. A failed write is logged and the artifact is simply not cached.
+        """
+        artifact = self._artifact_path(source_sha256, rule)
+        try:
+            os.makedirs(os.path.dirname(artifact), exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(artifact), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(temporary, artifact)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except OSError as e:
+            logger.warning("Failed to cache the compressed artifact %s: %s", artifact, e)
+
+    def close(self) -> None:
+        """
+        Evict the least recently used artifacts until the cache fits in max_size.
+        """
+        artifacts = []
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                artifacts.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in artifacts)
+        for _, size, path in sorted(artifacts):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _artifact_path(self, source_sha256: str, rule: CompressionRule) -> str:
+        # Two-character fan-out keeps directories small.
+        return os.path.join(self.path, source_sha256[:2], f"{source_sha256}.{rule.encoding}{rule.level}")
+
+class Compressor:
+    """
+    Encodes the content of files whose MIME type has a compression rule and
+    whose size is at least min_size. Content that does not get smaller is
+    uploaded as it is.
+    """
+    def __init__(
+        self,
+        rules: CompressionRules,
+        min_size: int = 1024,
+        cache: Optional[CompressionCache] = None,
+        metrics: Optional[Metrics] = None
+    ):
+        """
+        :param rules: Compiled compression rules.
+        :param min_size: Smallest file, in bytes, worth compressing.
+        :param cache: Cache of encoded artifacts; every upload compresses again when omitted.
+        :param metrics: Registry for the bytes compressed and cache hits.
+        """
+        self.rules = rules
+        self.min_size = min_size
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+
+    def rule_for(self, content_type: str, size: int) -> Optional[CompressionRule]:
+        """
+        :param content_type: MIME type of the file.
+        :param size: Size of the file in bytes.
+        :return: The rule to encode the file with, or None to upload it as it is.
+        """
+        if size < self.min_size:
+            return None
+        return self.rules.rule_for(content_type)
+
+    def encode(self, data: bytes, source_sha256: str, rule: CompressionRule) -> Optional[EncodedContent]:
+        """
+        Encode file content, or take the artifact from the cache.
+
+        :param data: The file content.
+        :param source_sha256: SHA-256 hex digest of data, the cache key.
+        :param rule: Encoding and level to use.
+        :return: The encoded content, or None if encoding does not make it smaller.
+        """
+        encoded = self.cache.get(source_sha256, rule) if self.cache is not None else None
+        if encoded is not None:
+            self.metrics.increment('compression_cache_hits_total', encoding=rule.encoding)
+        else:
+            with self.metrics.timer('compression_seconds', encoding=rule.encoding):
+                encoded = self._compress(data, rule)
+            self.metrics.increment('compression_bytes_in_total', len(data), encoding=rule.encoding)
+            self.metrics.increment('compression_bytes_out_total', len(encoded), encoding=rule.encoding)
+            if self.cache is not None:
+                self.cache.put(source_sha256, rule, encoded)
+        if len(encoded) >= len(data):
+            return None
+        return EncodedContent(encoded, rule.encoding, hashlib.sha256(encoded).hexdigest())
+
+    def close(self) -> None:
+        """
+        Trim the artifact cache, if any.
+        """
+        if self.cache is not None:
+            self.cache.close()
+
+    @staticmethod
+    def _compress(data: bytes, rule: CompressionRule) -> bytes:
+        if rule.encoding == 'br':
+            encoded: bytes = brotli.compress(data, quality=rule.level)
+            return encoded
+        # mtime=0 makes the output depend on the content only.
+        return gzip.compress(data, compresslevel=rule.level, mtime=0)
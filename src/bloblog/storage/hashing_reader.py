@@ -0,0 +1,74 @@
+"""
+File-like wrapper that computes SHA-256 over the bytes read through it.
+"""
+
+import base64
+import hashlib
+import os
+from typing import BinaryIO, Optional
+
+class HashingReader:
+    """
+    Wraps a seekable binary file and hashes its content as it is read, so an
+    upload and the hash of what was uploaded come from a single pass over the file.
+
+    botocore and s3transfer may seek back and re-read parts of the body, e.g.
+    to compute checksums or retry a request. Only bytes beyond the contiguous
+    prefix already hashed are fed to the hash, so re-reads are not counted twice.
+    """
+    def __init__(self, fileobj: BinaryIO):
+        """
+        :param fileobj: A binary file opened for reading, positioned at its start.
+        """
+        self._fileobj = fileobj
+        self._sha256 = hashlib.sha256()
+        self._hashed = 0
+        self.size = os.fstat(fileobj.fileno()).st_size
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        """
+        Read from the file, hashing bytes not seen before.
+        """
+        position = self._fileobj.tell()
+        data = self._fileobj.read(-1 if size is None else size)
+        end = position + len(data)
+        if position <= self._hashed < end:
+            self._sha256.update(memoryview(data)[self._hashed - position:])
+            self._hashed = end
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._fileobj.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._fileobj.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether every byte of the file has been hashed.
+        """
+        return self._hashed >= self.size
+
+    def hexdigest(self) -> str:
+        """
+        Return the SHA-256 hex digest of the whole file.
+
+        :raises ValueError: If the file has not been read to the end.
+        """
+        if not self.complete:
+            raise ValueError(f"Only {self._hashed} of {self.size} bytes were read")
+        return self._sha256.hexdigest()
+
+    def b64digest(self) -> str:
+        """
+        Return the digest in the base64 form S3 uses for ChecksumSHA256.
+        """
+        self.hexdigest()
+        return base64.b64encode(self._sha256.digest()).decode('ascii')
@@ -2,66 +2,490 @@
 S3 client for handling file operations on AWS S3.
 """
 
+import base64
+import hashlib
+import logging
+import threading
 import boto3
-from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, TypeVar
 from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.aws.rate_control import RateControl, error_code
+from bloblog.aws.session_factory import SessionFactory
+from bloblog.metrics.metrics import Metrics
+from .compression import CompressionRule, Compressor, EncodedContent
+from .hashing_reader import HashingReader
+from .transfer_limiter import TransferLimiter
 import os
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Maximum number of keys S3 accepts in one DeleteObjects request.
+DELETE_BATCH_SIZE = 1000
+
+# Largest object S3 copies with a single CopyObject request.
+MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+
+# Maximum number of parts of a multipart upload.
+MAX_PARTS = 10000
+
+# Smallest and largest part S3 accepts; only the last part may be smaller.
+MIN_PART_SIZE = 5 * 1024 ** 2
+MAX_PART_SIZE = 5 * 1024 ** 3
+
+# Transfer settings used when no transfer configuration is given.
+DEFAULT_TRANSFER_CONFIG = {
+    'multipart_threshold': 64 * 1024 ** 2,
+    'multipart_chunksize': 16 * 1024 ** 2,
+    'max_concurrency': 8,
+    'max_total_threads': 32,
+    'max_inflight_bytes': 1024 ** 3
+}
+
+class MultipartUpload(NamedTuple):
+    """
+    An open multipart upload: what is needed to resume it after a crash.
+    """
+    upload_id: str
+    part_size: int
+
 class S3Client:
     """
     Interacts with AWS S3 to upload, delete, and update file metadata.
     """
-    def __init__(self, bucket_name: str):
+    def __init__(
+        self,
+        bucket_name: str,
+        transfer_config: Optional[Dict[str, Any]] = None,
+        session_factory: Optional[SessionFactory] = None,
+        metrics: Optional[Metrics] = None,
+        rate_control: Optional[RateControl] = None,
+        compressor: Optional[Compressor] = None
+    ):
         """
         :param bucket_name: S3 bucket name.
+        :param transfer_config: Transfer settings as returned by ConfigManager.get_transfer_config().
+        :param session_factory: Shared factory for the S3 client; the boto3 default client is used when omitted.
+        :param metrics: Registry for request counts, latencies and bytes transferred.
+        :param rate_control: Shared pacing and retries of requests; a default one is used when omitted.
+        :param compressor: Encodes the files of the MIME types configured for compression; files are uploaded as they are when omitted.
         """
         self.bucket_name = bucket_name
-        self.s3_client = boto3.client('s3')
+        self.metrics = metrics or Metrics()
+        if session_factory is not None:
+            self.s3_client = session_factory.client('s3')
+        else:
+            self.s3_client = boto3.client('s3')
+        self.rate_control = rate_control or RateControl(metrics=self.metrics)
+        self.rate_control.observe(self.s3_client, 's3')
+        self.compressor = compressor
+        self.transfer = dict(DEFAULT_TRANSFER_CONFIG, **(transfer_config or {}))
+        self._transfer_config = TransferConfig(
+            multipart_threshold=self.transfer['multipart_threshold'],
+            multipart_chunksize=self.transfer['multipart_chunksize'],
+            max_concurrency=self.transfer['max_concurrency'],
+            use_threads=self.transfer['max_concurrency'] > 1
+        )
+        self._limiter = TransferLimiter(self.transfer['max_inflight_bytes'], self.transfer['max_total_threads'])
 
-    def upload_file(self, metadata: FileMetadata, sync_root: str) -> None:
+    def upload_file(
+        self,
+        metadata: FileMetadata,
+        sync_root: str,
+        resume: Optional[MultipartUpload] = None,
+        on_multipart_start: Optional[Callable[[MultipartUpload], None]] = None,
+        on_multipart_closed: Optional[Callable[[MultipartUpload], None]] = None
+    ) -> Optional[str]:
         """
-        Upload a file to S3.
+        Upload a file to S3, reading it once to both send it and hash it. Files
+        below the multipart threshold are sent with a single PutObject; larger
+        files use a parallel multipart upload. Both hold a share of the global
+        in-flight bytes and thread budget while running.
+
+        S3 is asked for a SHA-256 additional checksum; for single PutObject
+        uploads the checksum S3 computed is compared with the local hash, and
+        every part of a multipart upload carries the SHA-256 of its bytes.
+
+        A multipart upload left open by an interrupted run can be resumed: parts
+        S3 already holds with the same checksum are not sent again.
+
+        Files below the multipart threshold with a compression rule for their
+        MIME type are stored encoded, with a Content-Encoding header; the
+        encoding, encoded size and encoded hash are set on metadata.
 
         :param metadata: FileMetadata describing the file.
+        :param resume: Open multipart upload of this file to continue, if any.
+        :param on_multipart_start: Called with each multipart upload this call creates, before any part is sent.
+        :param on_multipart_closed: Called with the multipart upload once it completed or was aborted;
+            an upload that could not be aborted is left open and can be resumed.
+        :return: SHA-256 hex digest of the file content, or None if S3 received other content.
+        :raises ClientError: If a request failed, after the retries of the rate control.
+        """
+        file_path = os.path.join(sync_root, metadata.relative_path)
+        extra_args = {
+            'CacheControl': metadata.cache_control,
+            'ContentType': metadata.content_type,
+            'Metadata': {'uuid': metadata.uuid},
+            'ChecksumAlgorithm': 'SHA256'
+        }
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= self.transfer['multipart_threshold']:
+                concurrency = self.transfer['max_concurrency']
+                part_size = resume.part_size if resume is not None else self._part_size(size)
+                buffered = min(size, part_size * concurrency)
+                with self._limiter.reserve(buffered, concurrency), self.metrics.request('s3', 'multipart_upload'):
+                    sha256 = self._upload_parts(
+                        f, size, metadata, extra_args, resume, on_multipart_start, on_multipart_closed
+                    )
+                self._set_encoding(metadata, None)
+                return sha256
+            rule = self.compressor.rule_for(metadata.content_type, size) if self.compressor is not None else None
+            if rule is not None:
+                return self._put_encoded(f, size, metadata, extra_args, rule)
+            reader = HashingReader(f)
+
+            def put_object() -> Dict[str, Any]:
+                # A retried attempt sends the body again from its start.
+                reader.seek(0)
+                response: Dict[str, Any] = self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=metadata.relative_path,
+                    Body=reader,
+                    **extra_args
+                )
+                return response
+
+            with self._limiter.reserve(reader.size, 1):
+                response = self._send('put_object', put_object)
+            checksum = response.get('ChecksumSHA256')
+            if checksum and checksum != reader.b64digest():
+                logger.error("Checksum mismatch uploading %s to S3", metadata.relative_path)
+                self.metrics.increment('s3_checksum_mismatches_total', operation='put_object')
+                return None
+            self.metrics.increment('s3_bytes_uploaded_total', reader.size)
+            self._set_encoding(metadata, None)
+            return reader.hexdigest()
+
+    def _put_encoded(
+        self, f: BinaryIO, size: int, metadata: FileMetadata, extra_args: Dict[str, Any], rule: CompressionRule
+    ) -> Optional[str]:
+        """
+        Send a file with a single PutObject, encoded by its compression rule
+        unless that does not make it smaller. The file is read into memory,
+        which the multipart threshold bounds; the transfer budget for it and its
+        encoded copy is reserved before reading.
+
+        :return: SHA-256 hex digest of the file content, or None if S3 received other content.
         """
+        with self._limiter.reserve(2 * size, 1):
+            data = f.read()
+            sha256 = hashlib.sha256(data).hexdigest()
+            encoded = self.compressor.encode(data, sha256, rule) if self.compressor is not None else None
+            body, body_sha256 = data, sha256
+            if encoded is not None:
+                body, body_sha256 = encoded.data, encoded.sha256
+                extra_args = dict(extra_args, ContentEncoding=encoded.encoding)
+            checksum = base64.b64encode(bytes.fromhex(body_sha256)).decode('ascii')
+            # S3 rejects the body unless it matches ChecksumSHA256.
+            response = self._send('put_object', lambda: self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=metadata.relative_path,
+                Body=body,
+                ChecksumSHA256=checksum,
+                **extra_args
+            ))
+        if response.get('ChecksumSHA256', checksum) != checksum:
+            logger.error("Checksum mismatch uploading %s to S3", metadata.relative_path)
+            self.metrics.increment('s3_checksum_mismatches_total', operation='put_object')
+            return None
+        self.metrics.increment('s3_bytes_uploaded_total', len(body))
+        self._set_encoding(metadata, encoded)
+        return sha256
+
+    @staticmethod
+    def _set_encoding(metadata: FileMetadata, encoded: Optional[EncodedContent]) -> None:
+        """
+        Record how the object of a file is stored: encoded, or as is when encoded is None.
+        """
+        metadata.content_encoding = encoded.encoding if encoded is not None else ''
+        metadata.encoded_size = len(encoded.data) if encoded is not None else 0
+        metadata.encoded_sha256 = encoded.sha256 if encoded is not None else ''
+
+    def _send(self, operation: str, request: Callable[[], T]) -> T:
+        """
+        Send a request through the rate control, recording the latency and
+        outcome of each attempt.
+
+        :param operation: Operation name for the metrics.
+        :param request: Sends the request; called once per attempt.
+        :return: The response.
+        """
+        def attempt() -> T:
+            with self.metrics.request('s3', operation):
+                return request()
+        return self.rate_control.call('s3', operation, attempt)
+
+    def _upload_parts(
+        self,
+        f: BinaryIO,
+        size: int,
+        metadata: FileMetadata,
+        extra_args: Dict[str, Any],
+        resume: Optional[MultipartUpload],
+        on_multipart_start: Optional[Callable[[MultipartUpload], None]],
+        on_multipart_closed: Optional[Callable[[MultipartUpload], None]]
+    ) -> str:
+        """
+        Send a file as a multipart upload, max_concurrency parts at a time, hashing
+        it in order as the parts are read. A failed upload is aborted; one left
+        open by a crash, or because the abort failed too, can be resumed.
+
+        :return: SHA-256 hex digest of the file.
+        :raises ClientError: If a request fails.
+        :raises BotoCoreError: If a request could not be sent, e.g. the connection dropped.
+        :raises OSError: If the file could not be read.
+        """
+        key = metadata.relative_path
+        uploaded = self._list_parts(key, resume.upload_id) if resume is not None else None
+        if resume is not None and uploaded is not None:
+            upload = resume
+        else:
+            part_size = self._part_size(size)
+            response = self._send(
+                'create_multipart_upload',
+                lambda: self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=key, **extra_args)
+            )
+            upload = MultipartUpload(response['UploadId'], part_size)
+            uploaded = {}
+            if on_multipart_start is not None:
+                on_multipart_start(upload)
+
+        concurrency = self.transfer['max_concurrency']
+        # Bounds the parts held in memory to those being sent.
+        in_flight = threading.BoundedSemaphore(concurrency)
+        sha256 = hashlib.sha256()
+        parts = []
+        futures = []
         try:
-            self.s3_client.upload_file(
-                os.path.join(sync_root, metadata.relative_path),
-                self.bucket_name,
-                metadata.relative_path,
-                ExtraArgs={
-                    'CacheControl': metadata.cache_control,
-                    'ContentType': metadata.content_type,
-                    'Metadata': {'uuid': metadata.uuid}
-                }
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for number in range(1, max(1, -(-size // upload.part_size)) + 1):
+                    in_flight.acquire()
+                    data = f.read(upload.part_size)
+                    sha256.update(data)
+                    checksum = base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')
+                    existing = uploaded.get(number)
+                    if existing is not None and self._part_matches(existing, data, checksum):
+                        in_flight.release()
+                        parts.append({'PartNumber': number, 'ETag': existing['ETag'], 'ChecksumSHA256': checksum})
+                        self.metrics.increment('s3_bytes_resumed_total', len(data))
+                        continue
+                    future = executor.submit(self._upload_part, key, upload.upload_id, number, data, checksum)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append(future)
+                parts.extend(future.result() for future in futures)
+            parts.sort(key=lambda part: part['PartNumber'])
+            self._send('complete_multipart_upload', lambda: self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=key,
+                UploadId=upload.upload_id,
+                MultipartUpload={'Parts': parts}
+            ))
+        except (BotoCoreError, ClientError, OSError):
+            if self.abort_multipart_upload(key, upload.upload_id) and on_multipart_closed is not None:
+                on_multipart_closed(upload)
+            raise
+        if on_multipart_closed is not None:
+            on_multipart_closed(upload)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def _part_matches(part: Dict[str, Any], data: bytes, checksum: str) -> bool:
+        """
+        Whether a part S3 already holds has the given bytes: by its SHA-256
+        checksum, or by its ETag, the MD5 of an unencrypted part, when S3 lists no checksum.
+        """
+        if part.get('ChecksumSHA256'):
+            return str(part['ChecksumSHA256']) == checksum
+        return part.get('Size') == len(data) and part.get('ETag', '').strip('"') == hashlib.md5(data).hexdigest()
+
+    def _upload_part(self, key: str, upload_id: str, number: int, data: bytes, checksum: str) -> Dict[str, Any]:
+        """
+        Send one part, which S3 rejects unless its bytes match checksum.
+
+        :return: The part as listed in CompleteMultipartUpload.
+        """
+        response = self._send('upload_part', lambda: self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=data,
+            ChecksumAlgorithm='SHA256',
+            ChecksumSHA256=checksum
+        ))
+        self.metrics.increment('s3_bytes_uploaded_total', len(data))
+        return {'PartNumber': number, 'ETag': response['ETag'], 'ChecksumSHA256': checksum}
+
+    def _part_size(self, size: int) -> int:
+        """
+        Size of the parts of a new multipart upload: multipart_chunksize, grown so
+        the file fits in MAX_PARTS parts and kept within the part sizes S3 accepts.
+        """
+        part_size: int = max(self.transfer['multipart_chunksize'], -(-size // MAX_PARTS))
+        return min(max(part_size, MIN_PART_SIZE), MAX_PART_SIZE)
+
+    def _list_parts(self, key: str, upload_id: str) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        List the parts S3 holds for a multipart upload.
+
+        :return: The parts by part number, or None if the upload no longer exists.
+        """
+        def list_parts() -> Dict[int, Dict[str, Any]]:
+            # A failed listing is retried from its first page.
+            parts = {}
+            paginator = self.s3_client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=key, UploadId=upload_id):
+                self.metrics.increment('s3_requests_total', operation='list_parts', outcome='ok')
+                for part in page.get('Parts', []):
+                    parts[part['PartNumber']] = part
+            return parts
+
+        try:
+            return self.rate_control.call('s3', 'list_parts', list_parts)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+                return None
+            raise
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> bool:
+        """
+        Abort a multipart upload so S3 discards its parts. Uploads that no longer
+        exist, e.g. because they completed, are ignored.
+
+        :param key: Key the upload was writing.
+        :param upload_id: ID of the multipart upload.
+        :return: True if the upload is gone, False if it is still open because the abort failed.
+        """
+        try:
+            self._send(
+                'abort_multipart_upload',
+                lambda: self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
             )
+        except (BotoCoreError, ClientError) as e:
+            if error_code(e) != 'NoSuchUpload':
+                logger.error("Failed to abort the multipart upload of %s: %s", key, e)
+                return False
+        return True
+
+    def copy_file(self, source_key: str, metadata: FileMetadata) -> bool:
+        """
+        Create a file in S3 by copying an object that already holds the same
+        content, instead of uploading it. The copy gets the headers and uuid of
+        the new file. Objects up to MAX_COPY_OBJECT_SIZE are copied with one
+        CopyObject request whose SHA-256 checksum is compared with the expected
+        hash; larger objects use a managed multipart copy.
+
+        An encoded source is copied with its encoding: metadata must carry the
+        content_encoding, encoded_size and encoded_sha256 of the source object.
+
+        :param source_key: Key of the object to copy.
+        :param metadata: FileMetadata of the new file, with its sha256 set.
+        :return: True if the copy succeeded and matches metadata.sha256; False
+            tells the caller to upload the file instead.
+        """
+        copy_source = {'Bucket': self.bucket_name, 'Key': source_key}
+        extra_args = {
+            'CacheControl': metadata.cache_control,
+            'ContentType': metadata.content_type,
+            'Metadata': {'uuid': metadata.uuid},
+            'MetadataDirective': 'REPLACE'
+        }
+        if metadata.content_encoding:
+            extra_args['ContentEncoding'] = metadata.content_encoding
+        try:
+            if metadata.size <= MAX_COPY_OBJECT_SIZE:
+                response = self._send('copy_object', lambda: self.s3_client.copy_object(
+                    Bucket=self.bucket_name,
+                    CopySource=copy_source,
+                    Key=metadata.relative_path,
+                    ChecksumAlgorithm='SHA256',
+                    **extra_args
+                ))
+                checksum = response.get('CopyObjectResult', {}).get('ChecksumSHA256')
+                stored_sha256 = metadata.encoded_sha256 if metadata.content_encoding else metadata.sha256
+                expected = base64.b64encode(bytes.fromhex(stored_sha256)).decode('ascii')
+                if checksum and checksum != expected:
+                    logger.error("Checksum mismatch copying %s to %s in S3", source_key, metadata.relative_path)
+                    self.metrics.increment('s3_checksum_mismatches_total', operation='copy_object')
+                    return False
+            else:
+                self._send('multipart_copy', lambda: self.s3_client.copy(
+                    copy_source,
+                    self.bucket_name,
+                    metadata.relative_path,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_config
+                ))
+            self.metrics.increment('s3_bytes_copied_total', metadata.encoded_size if metadata.content_encoding else metadata.size)
+            return True
         except ClientError as e:
-            print(f"Failed to upload {metadata.relative_path} to S3: {e}")
+            logger.error("Failed to copy %s to %s in S3: %s", source_key, metadata.relative_path, e)
+            return False
 
     def delete_file(self, metadata: FileMetadata) -> None:
         """
         Delete a file from S3 by key.
 
-        :param s3_key: The S3 key of the file.
+        :param metadata: FileMetadata of the file.
+        :raises ClientError: If the request failed, after the retries of the rate control.
         """
-        try:
-            self.s3_client.delete_object(Bucket=self.bucket_name, Key=metadata.relative_path)
-        except ClientError as e:
-            print(f"Failed to delete {metadata.relative_path} from S3: {e}")
+        self._send('delete_object', lambda: self.s3_client.delete_object(Bucket=self.bucket_name, Key=metadata.relative_path))
+
+    def delete_files(self, metadata_list: List[FileMetadata]) -> List[FileMetadata]:
+        """
+        Delete many files from S3 with DeleteObjects, DELETE_BATCH_SIZE keys per request.
+        Keys that fail are reported and left out of the result.
+
+        :param metadata_list: FileMetadata of the files to delete.
+        :return: The FileMetadata whose objects were deleted.
+        :raises ClientError: If a request failed, after the retries of the rate control.
+        """
+        deleted: List[FileMetadata] = []
+        for start in range(0, len(metadata_list), DELETE_BATCH_SIZE):
+            batch = metadata_list[start:start + DELETE_BATCH_SIZE]
+            response = self._send('delete_objects', lambda: self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': metadata.relative_path} for metadata in batch], 'Quiet': True}
+            ))
+            failed = set()
+            for error in response.get('Errors', []):
+                failed.add(error['Key'])
+                logger.error("Failed to delete %s from S3: %s %s", error['Key'], error.get('Code'), error.get('Message'))
+            deleted.extend(metadata for metadata in batch if metadata.relative_path not in failed)
+        return deleted
 
     def update_file_metadata(self, metadata: FileMetadata) -> None:
         """
-        Update a file's metadata in S3.
+        Update a file's metadata in S3. The object is copied onto itself, which
+        replaces its Cache-Control and Content-Type headers. The Content-Encoding
+        of an encoded object is set again, since REPLACE would drop it.
 
         :param metadata: FileMetadata with updated info.
+        :raises ClientError: If the request failed, after the retries of the rate control.
         """
-        try:
-            self.s3_client.copy_object(
-                Bucket=self.bucket_name,
-                CopySource={'Bucket': self.bucket_name, 'Key': metadata.relative_path},
-                Key=metadata.relative_path,
-                MetadataDirective='REPLACE',
-                Metadata={'uuid': metadata.uuid, 'cache-control': metadata.cache_control, "ContentType": metadata.content_type}
-            )
-        except ClientError as e:
-            print(f"Failed to update metadata for {metadata.relative_path} in S3: {e}")
+        extra_args = {'ContentEncoding': metadata.content_encoding} if metadata.content_encoding else {}
+        self._send('update_headers', lambda: self.s3_client.copy_object(
+            Bucket=self.bucket_name,
+            CopySource={'Bucket': self.bucket_name, 'Key': metadata.relative_path},
+            Key=metadata.relative_path,
+            MetadataDirective='REPLACE',
+            CacheControl=metadata.cache_control,
+            ContentType=metadata.content_type,
+            Metadata={'uuid': metadata.uuid, 'cache-control': metadata.cache_control},
+            **extra_args
+        ))
@@ -0,0 +1,50 @@
+"""
+Global limits on concurrent S3 transfers shared by all upload workers.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+class TransferLimiter:
+    """
+    Caps the bytes in flight and the transfer threads in use across all files.
+
+    Each transfer reserves its share before starting and blocks until it fits.
+    A reservation larger than a cap is clipped to the cap, so a single large
+    file can always proceed once it has the budget to itself.
+    """
+    def __init__(self, max_inflight_bytes: int, max_total_threads: int):
+        """
+        :param max_inflight_bytes: Maximum bytes buffered by concurrent transfers.
+        :param max_total_threads: Maximum transfer threads across all files.
+        """
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_total_threads = max_total_threads
+        self._inflight_bytes = 0
+        self._threads = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int, threads: int) -> Iterator[None]:
+        """
+        Hold a share of the transfer budget for the duration of the block.
+
+        :param nbytes: Bytes the transfer will buffer at most.
+        :param threads: Threads the transfer will use.
+        """
+        nbytes = min(nbytes, self.max_inflight_bytes)
+        threads = min(threads, self.max_total_threads)
+        with self._condition:
+            while (self._inflight_bytes + nbytes > self.max_inflight_bytes
+                   or self._threads + threads > self.max_total_threads):
+                self._condition.wait()
+            self._inflight_bytes += nbytes
+            self._threads += threads
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._inflight_bytes -= nbytes
+                self._threads -= threads
+                self._condition.notify_all()
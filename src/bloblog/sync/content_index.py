@@ -0,0 +1,93 @@
+"""
+Index of the content already stored in the bucket, keyed by SHA-256.
+"""
+
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+from bloblog.metadata.file_metadata import FileMetadata
+
+class StoredContent(NamedTuple):
+    """
+    An object holding indexed content, and how it is encoded in the bucket.
+    """
+    key: str
+    content_encoding: str = ''
+    encoded_size: int = 0
+    encoded_sha256: str = ''
+
+class ContentIndex:
+    """
+    Maps the SHA-256 of every uploaded object to one key holding that content,
+    so a file whose content is already in the bucket can be created with a
+    server-side copy instead of an upload.
+
+    The sizes of indexed objects are kept as well: a file whose size matches no
+    indexed object cannot be a duplicate and does not need hashing up front.
+    """
+    def __init__(self, records: Iterable[FileMetadata] = ()):
+        """
+        :param records: Metadata records to index; only uploaded records with a hash are used.
+        """
+        self._keys: Dict[str, StoredContent] = {}
+        self._sizes: Set[int] = set()
+        self._lock = threading.Lock()
+        for record in records:
+            if record.upload_status == 'uploaded':
+                self.add(record)
+
+    def add(self, record: FileMetadata) -> None:
+        """
+        Index the object of an uploaded record, keeping an existing key for the same content.
+
+        :param record: FileMetadata of an object in the bucket.
+        """
+        if not record.sha256:
+            return
+        with self._lock:
+            self._keys.setdefault(record.sha256, StoredContent(
+                record.relative_path, record.content_encoding, record.encoded_size, record.encoded_sha256
+            ))
+            self._sizes.add(record.size)
+
+    def discard(self, record: FileMetadata) -> None:
+        """
+        Stop using a record's object as a copy source, e.g. because it is about to be overwritten.
+
+        :param record: FileMetadata as it was before the change.
+        """
+        with self._lock:
+            stored = self._keys.get(record.sha256)
+            if stored is not None and stored.key == record.relative_path:
+                del self._keys[record.sha256]
+
+    def has_size(self, size: int) -> bool:
+        """
+        Whether any indexed object has this size.
+
+        :param size: File size in bytes.
+        """
+        with self._lock:
+            return size in self._sizes
+
+    def find(self, sha256: str, exclude_key: str = '') -> Optional[str]:
+        """
+        Return a key holding content with this hash.
+
+        :param sha256: SHA-256 hex digest of the content.
+        :param exclude_key: Key that must not be returned, e.g. the key being written.
+        :return: The key, or None if the content is not in the bucket.
+        """
+        stored = self.find_stored(sha256, exclude_key)
+        return stored.key if stored is not None else None
+
+    def find_stored(self, sha256: str, exclude_key: str = '') -> Optional[StoredContent]:
+        """
+        Like find(), but also return how the object is encoded, which a copy of it keeps.
+
+        :param sha256: SHA-256 hex digest of the content.
+        :param exclude_key: Key that must not be returned, e.g. the key being written.
+        :return: The object, or None if the content is not in the bucket.
+        """
+        with self._lock:
+            stored = self._keys.get(sha256)
+        return stored if stored is not None and stored.key != exclude_key else None
@@ -0,0 +1,41 @@
+"""
+Works out which tracked files were removed locally by comparing walked paths with metadata.
+"""
+
+import threading
+from typing import Iterable, List, Set
+from bloblog.metadata.file_metadata import FileMetadata
+
+class DeletionPlanner:
+    """
+    Collects the relative paths seen during a walk and plans delete tasks for
+    every metadata record whose path was not seen.
+    """
+    def __init__(self) -> None:
+        """
+        Initialize an empty set of seen paths.
+        """
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def mark_seen(self, relative_path: str) -> None:
+        """
+        Record that a file still exists locally.
+
+        :param relative_path: Path of the file relative to the sync root.
+        """
+        with self._lock:
+            self._seen.add(relative_path)
+
+    def plan(self, records: Iterable[FileMetadata]) -> List[FileMetadata]:
+        """
+        Return the records whose files were not seen, marked as delete_pending.
+
+        :param records: Every metadata record known before the walk.
+        :return: The records to delete.
+        """
+        with self._lock:
+            missing = [record for record in records if record.relative_path not in self._seen]
+        for record in missing:
+            record.upload_status = 'delete_pending'
+        return missing
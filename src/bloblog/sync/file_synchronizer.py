@@ -2,20 +2,42 @@
 Manages the synchronization process between local files and S3.
 """
 
-from typing import NoReturn
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+from botocore.exceptions import BotoCoreError, ClientError
+from bloblog.aws.rate_control import is_retryable
 from bloblog.metadata.metadata_client import MetadataClient
-from bloblog.storage.s3_client import S3Client
+from bloblog.storage.s3_client import MultipartUpload, S3Client
 from bloblog.config.config_manager import ConfigManager
+from bloblog.metrics.metrics import DEPTH_BUCKETS, Metrics
 from .task_queue import TaskQueue
+from .deletion_planner import DeletionPlanner
+from .hash_cache import HashCache
+from .hashing import HashEngine
+from .content_index import ContentIndex
+from .journal import SyncJournal
+from .plan_manifest import OPERATIONS, PlanWriter
+from .watcher import ChangeWatcher
 from bloblog.metadata.file_metadata import FileMetadata
+import logging
 import os
-import hashlib
-import re
 import uuid
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import mimetypes
+import queue
 import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Paths buffered between the directory walk and the file workers, per worker.
+WALK_QUEUE_DEPTH = 64
+
+# Records deleted per batch; matches the S3 DeleteObjects key limit.
+DELETE_BATCH_SIZE = 1000
+
+# Seconds watch mode waits for changes before checking whether it was stopped.
+WATCH_POLL_INTERVAL = 1.0
 
 class FileSynchronizer:
     """
@@ -26,188 +48,957 @@ class FileSynchronizer:
         metadata_client: MetadataClient,
         s3_client: S3Client,
         config_manager: ConfigManager,
-        task_queue: TaskQueue
+        task_queue: TaskQueue,
+        paranoid: bool = False,
+        hash_cache: Optional[HashCache] = None,
+        hash_engine: Optional[HashEngine] = None,
+        metrics: Optional[Metrics] = None,
+        journal: Optional[SyncJournal] = None,
+        task_attempts: int = 3
     ):
         """
         :param metadata_client: For DB operations on metadata.
         :param s3_client: For S3 operations.
         :param config_manager: For configuration & cache control logic.
         :param task_queue: For managing upload/delete/update tasks.
+        :param paranoid: Hash every tracked file, even when its size and mtime are unchanged.
+        :param hash_cache: Optional local cache of hashes keyed by file identity.
+        :param hash_engine: Engine used to hash files; hashes on the calling thread when omitted.
+        :param metrics: Registry for phase timings, counters and queue depth.
+        :param journal: Journal that lets a run interrupted by a crash be resumed.
+        :param task_attempts: Times a task failing with a retryable AWS error is run before it fails the run.
         """
         self.metadata_client = metadata_client
         self.s3_client = s3_client
         self.config_manager = config_manager
         self.task_queue = task_queue
+        self.paranoid = paranoid
+        self.hash_cache = hash_cache
+        self.metrics = metrics or Metrics()
+        self.hash_engine = hash_engine or HashEngine(metrics=self.metrics)
+        self._snapshot: Optional[Dict[str, FileMetadata]] = None
+        self.deletion_planner = DeletionPlanner()
+        self._planned_deletions: List[FileMetadata] = []
+        self.content_index: Optional[ContentIndex] = None
+        self._stop = threading.Event()
+        self.journal = journal
+        # Multipart uploads left open by an interrupted run, by relative path.
+        self._resumable: Dict[str, Dict[str, Any]] = {}
+        # Set while plan() runs: tasks go to the manifest and nothing is written.
+        self._planning = False
+        self.task_attempts = max(1, task_attempts)
+        # Attempts of the tasks of the current run that failed, by relative path.
+        self._task_attempts: Dict[str, int] = {}
+        self._task_attempts_lock = threading.Lock()
 
-    def start_synchronization(self) -> NoReturn:
+    def start_synchronization(self) -> None:
         """
         Begin the synchronization process:
-        - Update metadata statuses
+        - Recover the metadata writes of an interrupted run from the journal
+        - Load the metadata snapshot and index stored content by SHA-256
         - Walk local files
         - Compare with DB metadata
-        - Enqueue tasks
-        - Process tasks concurrently
+        - Enqueue tasks and plan deletes for records whose files are gone
+        - Process tasks concurrently, resuming open multipart uploads
+        - Delete the planned records in batches
+        - Abort multipart uploads no file resumed
+        - Flush buffered metadata writes
+        """
+        try:
+            self._recover()
+            self._load_snapshot()
+            self._build_content_index()
+            self._run_pipeline(self.walk_files)
+            self._abort_orphaned_uploads()
+        finally:
+            self._flush()
+        self._finish_journal()
+
+    def synchronize_paths(self, relative_paths: Iterable[str]) -> None:
+        """
+        Synchronize only the given files and directories, e.g. those reported by
+        a ChangeWatcher. Directories are walked; paths that no longer exist have
+        their records, and the records below them, deleted. Relies on the
+        snapshot and content index of a previous start_synchronization(), which
+        the task handlers keep current.
+
+        :param relative_paths: Paths relative to the sync root.
+        """
+        try:
+            self._run_pipeline(lambda: self.walk_paths(relative_paths))
+        finally:
+            self._flush()
+        self._finish_journal()
+
+    def plan(self, writer: PlanWriter) -> None:
+        """
+        Walk and diff the sync root like start_synchronization(), but write the
+        upload, update and delete tasks to a manifest instead of running them.
+        Nothing is written to S3 or the metadata table. Uploads are listed with
+        their full size, even those apply() will turn into server-side copies.
+
+        :param writer: Manifest the tasks are written to.
+        """
+        self._planning = True
+        try:
+            self._load_snapshot()
+            self.content_index = None
+            self._run_pipeline(self.walk_files, writer)
+        finally:
+            self._planning = False
+
+    def apply(self, records: Iterable[FileMetadata]) -> None:
+        """
+        Run the tasks of a manifest written by plan(), e.g. one shard of it.
+        Uploads of files that changed since the plan send the current content;
+        files removed since are skipped. Deletes run after the uploads, as in
+        start_synchronization().
+
+        :param records: Tasks read from the manifest.
+        """
+        try:
+            self._recover()
+            self._load_snapshot()
+            self._build_content_index()
+            self._run_pipeline(lambda: self._enqueue_plan(records))
+            self._abort_orphaned_uploads()
+        finally:
+            self._flush()
+        self._finish_journal()
+
+    def _enqueue_plan(self, records: Iterable[FileMetadata]) -> None:
+        """
+        Walk stage of apply: enqueue uploads and updates, and plan deletes.
+        """
+        sync_root = self.config_manager.get_sync_root_path()
+        deletions = []
+        try:
+            records = list(records)
+            if self.content_index is not None:
+                # Objects this run overwrites must not be copied from, whichever task runs first.
+                for file_metadata in records:
+                    if file_metadata.upload_status == 'upload_pending':
+                        stored = self._lookup_metadata(file_metadata.relative_path)
+                        if stored is not None:
+                            self.content_index.discard(stored)
+            for file_metadata in records:
+                if file_metadata.upload_status == 'delete_pending':
+                    deletions.append(file_metadata)
+                    continue
+                if file_metadata.upload_status == 'upload_pending':
+                    file_path = os.path.join(sync_root, file_metadata.relative_path)
+                    try:
+                        stat = os.stat(file_path)
+                    except FileNotFoundError:
+                        logger.warning("Skipping %s, removed since it was planned", file_metadata.relative_path)
+                        continue
+                    if stat.st_size != file_metadata.size or stat.st_mtime_ns != file_metadata.mtime_ns:
+                        # Hashed again while uploading.
+                        file_metadata.sha256 = ''
+                        file_metadata.size = stat.st_size
+                        file_metadata.mtime_ns = stat.st_mtime_ns
+                        file_metadata.last_modified = self._format_mtime(stat)
+                        file_metadata = self.config_manager.cache_control(file_metadata)
+                self._enqueue(file_metadata)
+            self._planned_deletions = deletions
+        finally:
+            self.task_queue.close()
+
+    def refresh_headers(self, all_records: bool = False) -> None:
+        """
+        Update the Cache-Control headers that aged into a new rule threshold,
+        without walking the sync root. Only records whose cache_control_transition
+        has passed are fetched, unless all_records is set, e.g. after the
+        cache_control rules were edited.
+
+        :param all_records: Re-evaluate every record instead of only the due ones.
+        """
+        self._recover()
+        segments = self.config_manager.get_scan_segments()
+        with self.metrics.phase('snapshot'):
+            if all_records:
+                records = self.metadata_client.fetch_all_records(segments)
+            else:
+                records = self.metadata_client.fetch_due_transitions(int(time.time()), segments)
+        try:
+            self._run_pipeline(lambda: self._enqueue_header_refreshes(records))
+        finally:
+            self._flush()
+        self._finish_journal()
+
+    def _flush(self) -> None:
+        """
+        Flush buffered metadata writes.
+        """
+        with self.metrics.phase('metadata_write'):
+            self.metadata_client.flush()
+
+    def _recover(self) -> None:
+        """
+        Write the metadata of the tasks an interrupted run completed in S3, so
+        they are not redone, and keep its open multipart uploads for resuming.
+        """
+        if self.journal is None or self.journal.recovered is None:
+            return
+        state = self.journal.recovered
+        self.journal.recovered = None
+        logger.warning(
+            "Resuming an interrupted run: %d completed and %d unfinished tasks, %d open multipart uploads",
+            len(state.completed) + len(state.deleted), len(state.planned), len(state.multipart)
+        )
+        with self.metrics.phase('metadata_write'):
+            for record in state.completed.values():
+                self.metadata_client.add_batched(FileMetadata(**record))
+            for record in state.deleted.values():
+                self.metadata_client.delete_batched(FileMetadata(**record))
+            self.metadata_client.flush()
+        self.metrics.increment('journal_records_recovered_total', len(state.completed) + len(state.deleted))
+        self._resumable = dict(state.multipart)
+
+    def _finish_journal(self) -> None:
+        """
+        Mark the run complete in the journal once its metadata is flushed.
+        """
+        if self.journal is not None:
+            self.journal.finish()
+
+    def _take_resumable(self, file_metadata: FileMetadata) -> Optional[MultipartUpload]:
+        """
+        Return the open multipart upload of a file, if it still sends the same
+        file; an upload of a file that changed since is aborted.
+        """
+        entry = self._resumable.pop(file_metadata.relative_path, None)
+        if entry is None:
+            return None
+        if entry['size'] == file_metadata.size and entry['mtime_ns'] == file_metadata.mtime_ns:
+            self.metrics.increment('multipart_uploads_resumed_total')
+            return MultipartUpload(entry['upload_id'], entry['part_size'])
+        self._abort_upload(file_metadata.relative_path, entry)
+        return None
+
+    def _abort_orphaned_uploads(self) -> None:
+        """
+        Abort the open multipart uploads no file of the walk resumed, e.g. of files deleted since.
+        """
+        resumable, self._resumable = self._resumable, {}
+        for relative_path, entry in resumable.items():
+            self._abort_upload(relative_path, entry)
+
+    def _abort_upload(self, relative_path: str, entry: Dict[str, Any]) -> None:
+        # An upload that could not be aborted stays in the journal for the next run.
+        if not self.s3_client.abort_multipart_upload(relative_path, entry['upload_id']):
+            return
+        if self.journal is not None:
+            self.journal.record_multipart_closed(relative_path)
+        self.metrics.increment('multipart_uploads_aborted_total')
+
+    def _enqueue_header_refreshes(self, records: List[FileMetadata]) -> None:
         """
-        self._update_metadata_statuses()
+        Walk stage of refresh_headers: enqueue updates for uploaded records whose header changed.
+        """
+        try:
+            for record in records:
+                if record.upload_status == 'uploaded':
+                    self._refresh_cache_control(record)
+        finally:
+            self.task_queue.close()
+
+    def watch(self, watcher: ChangeWatcher, rescan_interval: float = 60.0) -> None:
+        """
+        Synchronize the whole tree, then synchronize changed paths as the watcher
+        reports them, until stop() is called. The watches are set up before the
+        full pass so no change made during it is missed.
+
+        When the watcher loses events, the watches are re-established and the whole
+        tree is rescanned. When the tree cannot be watched, e.g. because the inotify
+        watch limit is reached, or a pass fails, the whole tree is rescanned every
+        rescan_interval seconds until watching works again.
+
+        :param watcher: Watcher for the sync root.
+        :param rescan_interval: Seconds between full rescans while changes cannot be watched.
+        """
+        self._stop.clear()
+        needs_rescan = True
+        try:
+            while not self._stop.is_set():
+                if needs_rescan:
+                    watching = self._start_watcher(watcher)
+                    synchronized = self._run_watch_pass(self.start_synchronization)
+                    needs_rescan = not (watching and synchronized)
+                    if needs_rescan:
+                        self._stop.wait(rescan_interval)
+                    continue
+                changes = watcher.wait_for_changes(timeout=WATCH_POLL_INTERVAL)
+                if changes is None:
+                    logger.warning("Watch events were lost, rescanning the whole tree")
+                    needs_rescan = True
+                elif changes:
+                    needs_rescan = not self._run_watch_pass(lambda: self.synchronize_paths(changes))
+        finally:
+            watcher.close()
+
+    def stop(self) -> None:
+        """
+        Make watch() return after the pass in progress.
+        """
+        self._stop.set()
+
+    def _start_watcher(self, watcher: ChangeWatcher) -> bool:
+        """
+        (Re)start watching the tree.
 
-        # Event to signal when walk_files is done
-        self.walk_files_done = threading.Event()
+        :return: True if every directory is watched.
+        """
+        try:
+            watcher.start()
+            return True
+        except OSError as e:
+            logger.warning("Cannot watch %s, falling back to periodic rescans: %s", watcher.sync_root, e)
+            watcher.close()
+            return False
+
+    def _run_watch_pass(self, synchronize: Callable[[], None]) -> bool:
+        """
+        Run one synchronization pass of watch mode, reporting instead of raising errors.
 
-        # Start walk_files and process_queues in separate threads
-        walk_thread = threading.Thread(target=self.walk_files)
-        process_thread = threading.Thread(target=self.process_queues)
+        :return: True if the pass succeeded.
+        """
+        try:
+            synchronize()
+            return True
+        except Exception:
+            logger.exception("Synchronization failed")
+            return False
+
+    def _run_pipeline(self, walk: Callable[[], None], writer: Optional[PlanWriter] = None) -> None:
+        """
+        Run a walk stage and process_queues concurrently, then delete the records
+        the walk planned for deletion. With a writer, the tasks and deletions are
+        written to it instead.
+
+        :param walk: Stage that enqueues tasks, plans deletions and closes the task queue.
+        :param writer: Manifest to write the tasks to instead of running them.
+        """
+        self.deletion_planner = DeletionPlanner()
+        self._planned_deletions = []
+        self.task_queue.reopen()
+
+        # Run the walk and process_queues in separate threads; the walk closes
+        # the task queue when it is done, which lets process_queues finish.
+        errors: List[BaseException] = []
+        walk_thread = threading.Thread(target=self._run_stage, args=(self._timed_walk(walk), errors))
+        process: Callable[[], None] = self.process_queues if writer is None else lambda: self._write_plan(writer)
+        process_thread = threading.Thread(target=self._run_stage, args=(process, errors))
 
         walk_thread.start()
         process_thread.start()
 
         walk_thread.join()
-        self.walk_files_done.set()
         process_thread.join()
+        if errors:
+            raise errors[0]
+
+        if writer is not None:
+            for file_metadata in self._planned_deletions:
+                writer.add(file_metadata)
+            return
+        # Deletes run after every upload has finished, so a failed run never
+        # removes objects before their replacements exist.
+        self._delete_pending_files(self._planned_deletions)
 
-    def _update_metadata_statuses(self) -> None:
+    def _write_plan(self, writer: PlanWriter) -> None:
         """
-        Update all upload_status to delete_pending.
+        Process stage of plan: write every task to the manifest as it is dequeued.
         """
-        records = self.metadata_client.fetch_all_records()
-        for record in records:
-            record.upload_status = 'delete_pending'
-            self.metadata_client.update(record)
+        try:
+            while True:
+                file_metadata = self.task_queue.dequeue()
+                if file_metadata is None:
+                    return
+                writer.add(file_metadata)
+        finally:
+            self.task_queue.close()
 
-    def _delete_pending_files(self) -> None:
+    def _timed_walk(self, walk: Callable[[], None]) -> Callable[[], None]:
         """
-        Delete all files with upload_status 'delete_pending'.
+        Wrap a walk stage so its wall-clock time is recorded as the walk phase.
         """
-        records = self.metadata_client.fetch_all_records()
-        for record in records:
-            if record.upload_status == 'delete_pending':
-                self.s3_client.delete_file(record)
-                self.metadata_client.delete(record)
+        def timed() -> None:
+            with self.metrics.phase('walk'):
+                walk()
+        return timed
+
+    def _run_stage(self, stage: Callable[[], None], errors: List[BaseException]) -> None:
+        """
+        Run a pipeline stage in a thread, collecting its exception for the caller.
+        """
+        try:
+            stage()
+        except Exception as e:
+            errors.append(e)
+
+    def _load_snapshot(self) -> None:
+        """
+        Preload all metadata records into memory, keyed by relative path.
+        """
+        with self.metrics.phase('snapshot'):
+            if self.config_manager.is_snapshot_enabled():
+                self._snapshot = self.metadata_client.fetch_snapshot(self.config_manager.get_scan_segments())
+            else:
+                self._snapshot = None
+
+    def _build_content_index(self) -> None:
+        """
+        Index the content already in the bucket, so duplicates and renamed files
+        are copied server-side instead of uploaded.
+        """
+        if not self.config_manager.is_dedup_enabled():
+            self.content_index = None
+        elif self._snapshot is not None:
+            self.content_index = ContentIndex(self._snapshot.values())
+        else:
+            self.content_index = ContentIndex(
+                self.metadata_client.fetch_all_records(self.config_manager.get_scan_segments())
+            )
+
+    def _lookup_metadata(self, relative_path: str) -> Optional[FileMetadata]:
+        """
+        Find the metadata record of a file, from the snapshot when one is loaded.
+        """
+        if self._snapshot is not None:
+            return self._snapshot.get(relative_path)
+        with self.metrics.phase('lookup'):
+            return self.metadata_client.get_file_metadata(relative_path)
+
+    def _plan_deletions(self) -> None:
+        """
+        Plan deletes for every record whose file was not seen during the walk.
+        """
+        records: Iterable[FileMetadata]
+        if self._snapshot is not None:
+            records = self._snapshot.values()
+        else:
+            records = self.metadata_client.fetch_all_records(self.config_manager.get_scan_segments())
+        self._planned_deletions = self.deletion_planner.plan(records)
+
+    def _delete_pending_files(self, records: List[FileMetadata]) -> None:
+        """
+        Delete files and their metadata in batches of DELETE_BATCH_SIZE. Each batch
+        is one S3 DeleteObjects request followed by batched metadata deletes for
+        the objects S3 confirmed; records of keys that failed are kept.
+
+        :param records: FileMetadata with upload_status 'delete_pending'.
+        """
+        for start in range(0, len(records), DELETE_BATCH_SIZE):
+            batch = records[start:start + DELETE_BATCH_SIZE]
+            with self.metrics.phase('delete'):
+                deleted = self.s3_client.delete_files(batch)
+            with self.metrics.phase('metadata_write'):
+                for record in deleted:
+                    if self.journal is not None:
+                        self.journal.record_deleted(record)
+                    self.metadata_client.delete_batched(record)
+                    self._forget(record)
+            self.metrics.increment('tasks_total', len(deleted), operation='delete')
 
     def walk_files(self) -> None:
         """
         Enumerate local files in the sync root and identify which need actions.
+        Paths are streamed through a bounded queue to the workers as directories
+        are read, so work starts immediately and memory stays flat.
+        Once every file has been processed, plan deletes for files that are gone.
         """
-        files_to_process = []
-        for root, _, files in os.walk(self.config_manager.get_sync_root_path()):
-            for file in files:
-                file_path = os.path.join(root, file)
-                files_to_process.append(file_path)
-        
-        with ThreadPoolExecutor(max_workers=self.config_manager.get_workers()) as executor:
-            futures = [executor.submit(self._process_file, file_path) for file_path in files_to_process]
-            for future in as_completed(futures):
-                future.result()
+        sync_root = self.config_manager.get_sync_root_path()
+        try:
+            if not os.path.isdir(sync_root):
+                # An empty walk would otherwise plan the deletion of every tracked file.
+                raise FileNotFoundError(f"Sync root {sync_root} is not a directory")
+            self._walk_and_plan(sync_root)
+        finally:
+            # End of stream: process_queues drains what is left and returns.
+            self.task_queue.close()
 
-    def _process_file(self, file_path: str) -> None:
+    def walk_paths(self, relative_paths: Iterable[str]) -> None:
+        """
+        Like walk_files, but only for the given paths: files are processed,
+        directories walked, and records at or below missing paths planned for deletion.
+
+        :param relative_paths: Paths relative to the sync root.
+        """
+        sync_root = self.config_manager.get_sync_root_path()
+        try:
+            if not os.path.isdir(sync_root):
+                raise FileNotFoundError(f"Sync root {sync_root} is not a directory")
+            missing: List[str] = []
+            self._process_files(self._iter_paths(sync_root, relative_paths, missing))
+            self._plan_missing(missing)
+        finally:
+            self.task_queue.close()
+
+    def _walk_and_plan(self, sync_root: str) -> None:
+        """
+        Feed every file below sync_root to the workers, then plan deletions.
+        """
+        self._process_files(self._iter_files(sync_root))
+        self._plan_deletions()
+
+    def _process_files(self, file_paths: Iterable[str]) -> None:
+        """
+        Run _process_file for each path on the configured number of worker threads,
+        reading paths lazily through a bounded queue.
+        """
+        workers = self.config_manager.get_workers()
+        paths: queue.Queue[Optional[str]] = queue.Queue(maxsize=workers * WALK_QUEUE_DEPTH)
+        errors: List[BaseException] = []
+
+        def consume() -> None:
+            while True:
+                file_path = paths.get()
+                if file_path is None:
+                    return
+                if errors:
+                    # Keep draining so the walker never blocks on a full queue.
+                    continue
+                try:
+                    self._process_file(file_path)
+                except Exception as e:
+                    errors.append(e)
+
+        consumers = [threading.Thread(target=consume) for _ in range(workers)]
+        for consumer in consumers:
+            consumer.start()
+        try:
+            for file_path in file_paths:
+                if errors:
+                    break
+                paths.put(file_path)
+        finally:
+            for _ in consumers:
+                paths.put(None)
+            for consumer in consumers:
+                consumer.join()
+        if errors:
+            raise errors[0]
+
+    def _iter_files(self, root: str, relative_root: str = '') -> Iterator[str]:
+        """
+        Lazily yield every non-excluded file below root using os.scandir, without
+        following directory symlinks. Excluded directories are pruned before they
+        are listed. Unreadable directories raise instead of being skipped, since
+        skipped files would otherwise be planned for deletion.
+
+        :param root: Directory to walk.
+        :param relative_root: Path of root relative to the sync root, ending in '/', or '' for the sync root.
+        """
+        directories = [(root, relative_root)]
+        while directories:
+            directory, relative_directory = directories.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = relative_directory + entry.name
+                    if self._should_exclude(relative_path):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append((entry.path, relative_path + '/'))
+                    elif entry.is_file():
+                        yield entry.path
+
+    def _iter_paths(self, sync_root: str, relative_paths: Iterable[str], missing: List[str]) -> Iterator[str]:
+        """
+        Yield the files at or below each non-excluded path, each once. Paths that
+        are gone, or that the full walk would not sync, are appended to missing.
+        """
+        selected = set(relative_paths)
+        for relative_path in sorted(selected):
+            parts = relative_path.split(os.sep)
+            if any(os.sep.join(parts[:index]) in selected for index in range(1, len(parts))):
+                # Covered by the walk of a parent directory.
+                continue
+            if self._should_exclude(relative_path):
+                continue
+            path = os.path.join(sync_root, relative_path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                yield from self._iter_files(path, relative_path + '/')
+            elif os.path.isfile(path):
+                yield path
+            else:
+                missing.append(relative_path)
+
+    def _plan_missing(self, missing: List[str]) -> None:
         """
-        Process a single file to determine if it should be excluded or enqueued for a task.
+        Plan deletes for the records at or below paths that no longer exist.
         """
-        if self._should_exclude(file_path):
+        if not missing:
             return
+        records: Iterable[FileMetadata]
+        if self._snapshot is not None:
+            records = self._snapshot.values()
+        else:
+            records = self.metadata_client.fetch_all_records(self.config_manager.get_scan_segments())
+        exact = set(missing)
+        prefixes = tuple(path + os.sep for path in missing)
+        candidates = [
+            record for record in records
+            if record.relative_path in exact or record.relative_path.startswith(prefixes)
+        ]
+        self._planned_deletions = self.deletion_planner.plan(candidates)
 
+    def _process_file(self, file_path: str) -> None:
+        """
+        Process a single, non-excluded file to determine whether it should be enqueued for a task.
+        """
         relative_path = os.path.relpath(file_path, self.config_manager.get_sync_root_path())
-        file_metadata = self.metadata_client.get_file_metadata(relative_path)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            # Removed after the directory was listed; it is planned for deletion like any other missing file.
+            return
+        self.deletion_planner.mark_seen(relative_path)
+        self.metrics.increment('files_scanned_total')
+        file_metadata = self._lookup_metadata(relative_path)
         if file_metadata:
-            self._compare_and_enqueue(file_path, file_metadata)
+            self._compare_and_enqueue(file_path, file_metadata, stat)
         else:
             file_metadata = FileMetadata(
                 uuid=str(uuid.uuid4()),
                 relative_path=relative_path,
-                last_modified=datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%dT%H:%M:%S"),
+                last_modified=self._format_mtime(stat),
                 upload_status='upload_pending',
-                sha256=self._calculate_sha256(file_path),
+                # Hashed while uploading unless the hash cache already knows it.
+                sha256=self._cached_sha256(stat),
                 cache_control='',
-                content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+                content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream',
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns
             )
             file_metadata = self.config_manager.cache_control(file_metadata)
-            self.task_queue.enqueue(file_metadata)
+            self._enqueue(file_metadata)
 
-    def _should_exclude(self, file_path: str) -> bool:
+    def _should_exclude(self, relative_path: str) -> bool:
         """
-        Check if the file should be excluded based on the exclude patterns.
+        Check if a path relative to the sync root matches the exclude patterns.
         """
-        for pattern in self.config_manager.get_exclude_patterns():
-            try:
-                if isinstance(pattern, str):
-                    # Treat pattern as literal string if it's not a valid regex
-                    escaped_pattern = re.escape(pattern)
-                    if re.search(escaped_pattern, file_path):
-                        return True
-            except re.error:
-                continue
-        return False
+        return self.config_manager.get_exclude_matcher().matches(relative_path.replace(os.sep, '/'))
 
-    def _compare_and_enqueue(self, file_path: str, file_metadata: FileMetadata) -> None:
+    def _compare_and_enqueue(self, file_path: str, file_metadata: FileMetadata, stat: os.stat_result) -> None:
         """
         Compare the local file with its metadata and enqueue tasks based on the comparison.
+        The file is only hashed when its size or mtime differ from the record, or in paranoid mode.
+        Unchanged files are never enqueued.
         """
-        local_sha256 = self._calculate_sha256(file_path)
+        stat_unchanged = stat.st_size == file_metadata.size and stat.st_mtime_ns == file_metadata.mtime_ns
+        if stat_unchanged and not self.paranoid:
+            local_sha256 = file_metadata.sha256
+        else:
+            local_sha256 = self._calculate_sha256(file_path, stat)
+        file_metadata.size = stat.st_size
+        file_metadata.mtime_ns = stat.st_mtime_ns
+
         if local_sha256 != file_metadata.sha256:
+            if self.content_index is not None:
+                # The object at this key is about to be replaced; stop copying from it.
+                self.content_index.discard(file_metadata)
             file_metadata.upload_status = 'upload_pending'
-            file_metadata.last_modified = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%dT%H:%M:%S")
+            file_metadata.sha256 = local_sha256
+            file_metadata.last_modified = self._format_mtime(stat)
             file_metadata = self.config_manager.cache_control(file_metadata)
-            self.task_queue.enqueue(file_metadata)
+            self._enqueue(file_metadata)
+        elif stat_unchanged and file_metadata.cache_control_transition > time.time():
+            # Same content and age bucket as when the header was computed: it is still current.
+            self._mark_synchronized(file_metadata)
         else:
-            checked_file = self.config_manager.cache_control(file_metadata)
-            if checked_file.cache_control != file_metadata.cache_control:
-                checked_file.upload_status = 'update_pending'
-                self.task_queue.enqueue(checked_file)
-            else:
-                file_metadata.upload_status = 'uploaded'
-                self.task_queue.enqueue(file_metadata)
-    
-    def _calculate_sha256(self, file_path: str) -> str:
+            self._refresh_cache_control(file_metadata)
+
+    def _enqueue(self, file_metadata: FileMetadata) -> None:
+        """
+        Journal a task and enqueue it.
         """
-        Calculate the SHA-256 hash of the file.
+        if self.journal is not None:
+            self.journal.record_planned(file_metadata)
+        self.task_queue.enqueue(file_metadata)
+
+    def _refresh_cache_control(self, file_metadata: FileMetadata) -> None:
+        """
+        Recompute the Cache-Control header of an uploaded file and enqueue an
+        update when it changed.
         """
-        sha256 = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+        stored_cache_control = file_metadata.cache_control
+        checked_file = self.config_manager.cache_control(file_metadata)
+        if checked_file.cache_control != stored_cache_control:
+            checked_file.upload_status = 'update_pending'
+            self._enqueue(checked_file)
+        else:
+            self._mark_synchronized(file_metadata)
+
+    def _mark_synchronized(self, file_metadata: FileMetadata) -> None:
+        """
+        Nothing to do in S3. Only a refreshed size, mtime or transition (or a stale
+        status) needs persisting, as a partial write; clean records are left alone.
+        """
+        file_metadata.upload_status = 'uploaded'
+        self.metrics.increment('files_unchanged_total')
+        if file_metadata.is_dirty() and not self._planning:
+            with self.metrics.phase('metadata_write'):
+                self.metadata_client.update(file_metadata)
+
+    def _format_mtime(self, stat: os.stat_result) -> str:
+        """
+        Format a file's modification time the way it is stored in last_modified.
+        """
+        return datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%dT%H:%M:%S")
+
+    def _cached_sha256(self, stat: os.stat_result) -> str:
+        """
+        Return the cached hash of a file, or '' so the upload computes it in the
+        same read that sends the file.
+        """
+        if self.hash_cache is not None and not self.paranoid:
+            return self.hash_cache.get(stat) or ''
+        return ''
+
+    def _remember_sha256(self, file_metadata: FileMetadata, sha256: str) -> None:
+        """
+        Store a hash computed during upload in the hash cache, provided the file
+        still has the size and mtime it was walked with.
+        """
+        if self.hash_cache is None:
+            return
+        file_path = os.path.join(self.config_manager.get_sync_root_path(), file_metadata.relative_path)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return
+        if stat.st_size == file_metadata.size and stat.st_mtime_ns == file_metadata.mtime_ns:
+            self.hash_cache.put(stat, sha256)
+
+    def _calculate_sha256(self, file_path: str, stat: Optional[os.stat_result] = None) -> str:
+        """
+        Calculate the SHA-256 hash of the file, reusing the hash cache when the
+        file's identity and stat are unchanged. Paranoid mode bypasses cached hashes.
+        """
+        if self.hash_cache is not None and stat is not None and not self.paranoid:
+            cached = self.hash_cache.get(stat)
+            if cached is not None:
+                return cached
+
+        size = stat.st_size if stat is not None else os.path.getsize(file_path)
+        with self.metrics.phase('hash'):
+            digest = self.hash_engine.hash_file(file_path, size)
+        self.metrics.increment('bytes_hashed_total', size)
+
+        if self.hash_cache is not None and stat is not None:
+            self.hash_cache.put(stat, digest)
+        return digest
 
     def process_queues(self) -> None:
         """
-        Process all pending tasks (upload, delete, update) until all tasks are done.
+        Process all pending tasks (upload, delete, update) until the task queue is
+        closed and drained. Blocks on the queue instead of polling, and bounds the
+        number of tasks in flight so futures are released as they complete.
+
+        A task failing with a retryable error, i.e. one the rate control of the
+        clients already retried, goes back to the end of the queue (see
+        _retry_later), so the other tasks keep flowing while the service recovers.
         """
-        with ThreadPoolExecutor(max_workers=self.config_manager.get_workers()) as executor:
-            futures = []
-            while not (self.task_queue.is_empty() and self.walk_files_done.is_set()):
-                if not self.task_queue.is_empty():
+        workers = self.config_manager.get_workers()
+        in_flight = threading.BoundedSemaphore(workers * 2)
+        errors: List[BaseException] = []
+        running: Set[Future[None]] = set()
+        running_lock = threading.Lock()
+        with self._task_attempts_lock:
+            self._task_attempts = {}
+
+        def task_done(future: Future[None]) -> None:
+            in_flight.release()
+            with running_lock:
+                running.discard(future)
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                while True:
                     file_metadata = self.task_queue.dequeue()
-                    if file_metadata:
-                        futures.append(executor.submit(self._process_task, file_metadata))
-            for future in as_completed(futures):
-                future.result()
+                    if file_metadata is None:
+                        # The running tasks may still put failed tasks back.
+                        with running_lock:
+                            pending = list(running)
+                        wait(pending)
+                        if self.task_queue.is_empty():
+                            break
+                        continue
+                    self.metrics.observe('task_queue_depth', self.task_queue.qsize(), buckets=DEPTH_BUCKETS)
+                    in_flight.acquire()
+                    future = executor.submit(self._process_task, file_metadata)
+                    with running_lock:
+                        running.add(future)
+                    future.add_done_callback(task_done)
+        finally:
+            # If processing stops early, make producers fail instead of blocking on a full queue.
+            self.task_queue.close()
+        if errors:
+            raise errors[0]
 
     def _process_task(self, file_metadata: FileMetadata) -> None:
         """
-        Process a single task based on its operation type.
+        Process a single task based on its operation type. Deletions are not
+        tasks: they are batched by _delete_pending_files().
         """
         action_map = {
             'upload_pending': self._handle_upload,
-            'delete_pending': self._handle_delete,
-            'update_pending': self._handle_update,
-            'uploaded': self._handle_uploaded
+            'update_pending': self._handle_update
         }
 
         handler = action_map.get(file_metadata.upload_status)
-        if handler:
+        if not handler:
+            return
+        operation = OPERATIONS[file_metadata.upload_status]
+        try:
             handler(file_metadata)
+        except (BotoCoreError, ClientError) as e:
+            if is_retryable(e) and self._retry_later(file_metadata, e):
+                return
+            self.metrics.increment('tasks_failed_total', operation=operation)
+            raise
+
+    def _retry_later(self, file_metadata: FileMetadata, error: Exception) -> bool:
+        """
+        Put a failed task back in the queue, unless it already ran task_attempts times.
+
+        :return: True if the task was requeued.
+        """
+        with self._task_attempts_lock:
+            attempts = self._task_attempts.get(file_metadata.relative_path, 1)
+            if attempts >= self.task_attempts:
+                return False
+            self._task_attempts[file_metadata.relative_path] = attempts + 1
+        operation = OPERATIONS[file_metadata.upload_status]
+        logger.warning("Retrying the %s of %s later: %s", operation, file_metadata.relative_path, error)
+        self.metrics.increment('tasks_retried_total', operation=operation)
+        self.task_queue.requeue(file_metadata)
+        return True
 
     def _handle_upload(self, file_metadata: FileMetadata) -> None:
-        self.s3_client.upload_file(file_metadata, self.config_manager.get_sync_root_path())
+        if self._copy_duplicate(file_metadata):
+            return
+        resume = self._take_resumable(file_metadata)
+        # The multipart upload of the file while it is open.
+        open_upload = [resume] if resume is not None else []
+
+        def on_multipart_start(upload: MultipartUpload) -> None:
+            open_upload[:] = [upload]
+            if self.journal is not None:
+                self.journal.record_multipart(file_metadata, upload)
+
+        def on_multipart_closed(upload: MultipartUpload) -> None:
+            open_upload.clear()
+            if self.journal is not None:
+                self.journal.record_multipart_closed(file_metadata.relative_path)
+
+        try:
+            with self.metrics.phase('upload'):
+                sha256 = self.s3_client.upload_file(
+                    file_metadata,
+                    self.config_manager.get_sync_root_path(),
+                    resume=resume,
+                    on_multipart_start=on_multipart_start,
+                    on_multipart_closed=on_multipart_closed
+                )
+        finally:
+            if open_upload:
+                # Neither completed nor aborted: a retry of the task resumes it, and
+                # the journal keeps it for the next run otherwise.
+                self._resumable[file_metadata.relative_path] = {
+                    'upload_id': open_upload[0].upload_id,
+                    'part_size': open_upload[0].part_size,
+                    'size': file_metadata.size,
+                    'mtime_ns': file_metadata.mtime_ns
+                }
+        if sha256 is None:
+            # Leave the record as it was so the next run retries the upload.
+            self.metrics.increment('tasks_failed_total', operation='upload')
+            return
+        if sha256 != file_metadata.sha256:
+            file_metadata.sha256 = sha256
+            self._remember_sha256(file_metadata, sha256)
         file_metadata.upload_status = 'uploaded'
-        self.metadata_client.update(file_metadata)
+        self._track(file_metadata)
+        self._journal_completed(file_metadata)
+        with self.metrics.phase('metadata_write'):
+            self.metadata_client.add_batched(file_metadata)
+        self.metrics.increment('tasks_total', operation='upload')
 
-    def _handle_delete(self, file_metadata: FileMetadata) -> None:
-        self.s3_client.delete_file(file_metadata)
-        self.metadata_client.delete(file_metadata)
+    def _copy_duplicate(self, file_metadata: FileMetadata) -> bool:
+        """
+        Create the file with a server-side copy when its content is already in
+        the bucket under another key. New files are only hashed up front when an
+        object of the same size exists; otherwise they are hashed while uploading.
 
-    def _handle_update(self, file_metadata: FileMetadata) -> None:
-        self.s3_client.update_file_metadata(file_metadata)
+        :return: True if the file was copied, False if it still needs uploading.
+        """
+        if self.content_index is None:
+            return False
+        if not file_metadata.sha256:
+            if not self.content_index.has_size(file_metadata.size):
+                return False
+            file_path = os.path.join(self.config_manager.get_sync_root_path(), file_metadata.relative_path)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                return False
+            file_metadata.sha256 = self._calculate_sha256(file_path, stat)
+        source = self.content_index.find_stored(file_metadata.sha256, exclude_key=file_metadata.relative_path)
+        if source is None:
+            return False
+        # The copy holds the same bytes as its source, encoded or not.
+        file_metadata.content_encoding = source.content_encoding
+        file_metadata.encoded_size = source.encoded_size
+        file_metadata.encoded_sha256 = source.encoded_sha256
+        with self.metrics.phase('copy'):
+            copied = self.s3_client.copy_file(source.key, file_metadata)
+        if not copied:
+            return False
         file_metadata.upload_status = 'uploaded'
-        self.metadata_client.update(file_metadata)
+        self._track(file_metadata)
+        self._journal_completed(file_metadata)
+        with self.metrics.phase('metadata_write'):
+            self.metadata_client.add_batched(file_metadata)
+        self.metrics.increment('tasks_total', operation='copy')
+        return True
 
-    def _handle_uploaded(self, file_metadata: FileMetadata) -> None:
-        self.metadata_client.update(file_metadata)
+    def _journal_completed(self, file_metadata: FileMetadata) -> None:
+        """
+        Record a task completed in S3 before its metadata write is buffered,
+        so a crash before the flush does not lose it.
+        """
+        if self.journal is not None:
+            self.journal.record_completed(file_metadata)
+
+    def _track(self, file_metadata: FileMetadata) -> None:
+        """
+        Add an uploaded file to the snapshot and content index, so later
+        incremental passes see it without reloading the table.
+        """
+        if self._snapshot is not None:
+            self._snapshot[file_metadata.relative_path] = file_metadata
+        if self.content_index is not None:
+            self.content_index.add(file_metadata)
+
+    def _forget(self, file_metadata: FileMetadata) -> None:
+        """
+        Remove a deleted file from the snapshot and content index.
+        """
+        if self._snapshot is not None:
+            self._snapshot.pop(file_metadata.relative_path, None)
+        if self.content_index is not None:
+            self.content_index.discard(file_metadata)
+
+    def _handle_update(self, file_metadata: FileMetadata) -> None:
+        with self.metrics.phase('header_update'):
+            self.s3_client.update_file_metadata(file_metadata)
+        file_metadata.upload_status = 'uploaded'
+        self._journal_completed(file_metadata)
+        with self.metrics.phase('metadata_write'):
+            self.metadata_client.add_batched(file_metadata)
+        self.metrics.increment('tasks_total', operation='update')
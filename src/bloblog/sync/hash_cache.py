@@ -0,0 +1,144 @@
+"""
+Persistent local cache of SHA-256 hashes keyed by file identity.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from bloblog.metrics.metrics import Metrics
+
+# Number of cache writes buffered in the open transaction before committing.
+COMMIT_INTERVAL = 1000
+
+class HashCache:
+    """
+    SQLite-backed cache mapping (device, inode, size, mtime_ns) to a SHA-256 hash.
+
+    A file whose identity and stat are unchanged is assumed to have unchanged
+    content, so its hash can be reused without reading the file. Entries are
+    evicted least-recently-used first once the cache holds more than max_entries.
+    """
+    def __init__(self, path: str, max_entries: int = 1000000, metrics: Optional[Metrics] = None):
+        """
+        :param path: Path of the SQLite database file.
+        :param max_entries: Maximum number of cached hashes to keep.
+        :param metrics: Registry for the cache hits and misses.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.metrics = metrics or Metrics()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " device INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (device, inode, size, mtime_ns))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    @staticmethod
+    def default_path(sync_root: str) -> str:
+        """
+        Return the default cache location, a hidden file next to the sync root
+        so it is never walked or uploaded itself.
+
+        :param sync_root: The local directory being synchronized.
+        :return: Path of the cache file.
+        """
+        sync_root = os.path.abspath(sync_root)
+        return os.path.join(os.path.dirname(sync_root), f".{os.path.basename(sync_root)}.bloblog-hashes.sqlite")
+
+    def get(self, stat: os.stat_result) -> Optional[str]:
+        """
+        Look up the hash of a file by its stat result.
+
+        :param stat: The os.stat_result of the file.
+        :return: The cached SHA-256 hex digest, or None on a miss.
+        """
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha256 FROM hashes WHERE device=? AND inode=? AND size=? AND mtime_ns=?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                self.metrics.increment('hash_cache_misses_total')
+                return None
+            self.hits += 1
+            self.metrics.increment('hash_cache_hits_total')
+            self._connection.execute(
+                "UPDATE hashes SET last_used=? WHERE device=? AND inode=? AND size=? AND mtime_ns=?",
+                (time.time_ns(),) + key
+            )
+            self._written()
+            return str(row[0])
+
+    def put(self, stat: os.stat_result, sha256: str) -> None:
+        """
+        Store the hash of a file.
+
+        :param stat: The os.stat_result the hash was computed for.
+        :param sha256: The SHA-256 hex digest of the file content.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR REPLACE INTO hashes (device, inode, size, mtime_ns, sha256, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, sha256, time.time_ns())
+            )
+            # Replacing an existing key is counted too; the count is only a trigger and
+            # _evict() recounts exactly.
+            self._entries += cursor.rowcount
+            if self._entries > self.max_entries:
+                self._evict()
+            self._written()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the cache counters.
+
+        :return: A dict with hits, misses and entries.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self._entries}
+
+    def close(self) -> None:
+        """
+        Commit pending writes and close the database.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def _evict(self) -> None:
+        """
+        Drop the least recently used tenth of the cache. Must hold the lock.
+        """
+        target = max(int(self.max_entries * 0.9), 0)
+        self._connection.execute(
+            "DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY last_used LIMIT ?)",
+            (self._entries - target,)
+        )
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def _written(self) -> None:
+        """
+        Commit once enough writes have accumulated. Must hold the lock.
+        """
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_INTERVAL:
+            self._connection.commit()
+            self._uncommitted = 0
@@ -0,0 +1,119 @@
+"""
+Minimal binding to the Linux inotify API using ctypes.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from typing import List, NamedTuple, NoReturn, Optional
+
+# Event masks from <sys/inotify.h>.
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len].
+EVENT_HEADER = struct.Struct('iIII')
+
+# Bytes read from the inotify descriptor at a time.
+READ_SIZE = 64 * 1024
+
+class InotifyEvent(NamedTuple):
+    """
+    One inotify event. name is empty for events on the watched directory itself.
+    """
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+class Inotify:
+    """
+    An inotify instance: a non-blocking descriptor with watches added per directory.
+    """
+    def __init__(self) -> None:
+        """
+        :raises OSError: If inotify is not available on this platform.
+        """
+        library = ctypes.util.find_library('c')
+        try:
+            self._libc = ctypes.CDLL(library, use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise OSError("inotify is not available on this platform") from e
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self._raise_errno()
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """
+        Watch a path, or update the mask of an existing watch on it.
+
+        :param path: Path to watch.
+        :param mask: Bitwise OR of the IN_* events to report.
+        :return: The watch descriptor.
+        :raises OSError: If the watch cannot be added, e.g. ENOSPC when the watch limit is reached.
+        """
+        wd: int = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise_errno(path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        """
+        Remove a watch. Watches the kernel already dropped are ignored.
+
+        :param wd: The watch descriptor.
+        """
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: Optional[float] = None) -> List[InotifyEvent]:
+        """
+        Wait for events and return every event currently queued.
+
+        :param timeout: Maximum seconds to wait, None to wait indefinitely.
+        :return: The events, empty if the timeout expired.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, name))
+        return events
+
+    def close(self) -> None:
+        """
+        Close the descriptor, which removes every watch.
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    @staticmethod
+    def _raise_errno(path: Optional[str] = None) -> NoReturn:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), path)
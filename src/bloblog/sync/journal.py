@@ -0,0 +1,170 @@
+"""
+Append-only local journal of a synchronization run, so an interrupted run can be resumed.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.storage.s3_client import MultipartUpload
+
+class JournalState:
+    """
+    What an interrupted run left behind, by relative path.
+
+    :param planned: Status of tasks that were enqueued but never completed.
+    :param completed: Records of uploads, copies and header updates that completed in S3.
+    :param deleted: Records whose objects were deleted from S3.
+    :param multipart: Multipart uploads still open, with the size and mtime_ns of the file they send.
+    """
+    def __init__(self) -> None:
+        self.planned: Dict[str, str] = {}
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        self.deleted: Dict[str, Dict[str, Any]] = {}
+        self.multipart: Dict[str, Dict[str, Any]] = {}
+
+    def is_empty(self) -> bool:
+        return not (self.planned or self.completed or self.deleted or self.multipart)
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        """
+        Replay one journal entry onto the state.
+        """
+        event = entry['event']
+        path = entry['path']
+        if event == 'planned':
+            self.planned[path] = entry['status']
+        elif event == 'completed':
+            self.planned.pop(path, None)
+            self.deleted.pop(path, None)
+            self.completed[path] = entry['record']
+        elif event == 'deleted':
+            self.planned.pop(path, None)
+            self.completed.pop(path, None)
+            self.deleted[path] = entry['record']
+        elif event == 'multipart':
+            self.multipart[path] = {key: value for key, value in entry.items() if key not in ('event', 'path')}
+        elif event == 'multipart_closed':
+            self.multipart.pop(path, None)
+
+class SyncJournal:
+    """
+    Records, one JSON line per event, the tasks a run planned, the tasks that
+    completed in S3 and the multipart uploads it opened.
+
+    Metadata writes are buffered, so a run that dies can leave objects in S3
+    without their records. Opening the journal of such a run returns what it
+    left behind (see JournalState): the records to write again, and the open
+    multipart uploads to resume or abort. Once a run has flushed its metadata,
+    finish() empties the journal except for multipart uploads still open.
+
+    Every entry is flushed to the operating system as it is written, which
+    survives the process being killed; multipart entries, which refer to state
+    kept in S3, are also synced to disk. Only one process can hold the journal.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Path of the journal file.
+        :raises RuntimeError: If another process holds the journal.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+', encoding='utf-8')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise RuntimeError(f"Journal {path} is in use by another bloblog process")
+        self._file.seek(0)
+        state = JournalState()
+        for line in self._file:
+            try:
+                state.apply(json.loads(line))
+            except (ValueError, KeyError):
+                # The last line of a killed run can be incomplete.
+                continue
+        self._open_multipart = dict(state.multipart)
+        self.recovered: Optional[JournalState] = None if state.is_empty() else state
+
+    @staticmethod
+    def default_path(sync_root: str) -> str:
+        """
+        Return the default journal location, a hidden file next to the sync root.
+
+        :param sync_root: The local directory being synchronized.
+        :return: Path of the journal file.
+        """
+        sync_root = os.path.abspath(sync_root)
+        return os.path.join(os.path.dirname(sync_root), f".{os.path.basename(sync_root)}.bloblog-journal")
+
+    def record_planned(self, file_metadata: FileMetadata) -> None:
+        """
+        Record a task as it is enqueued.
+        """
+        self._write({'event': 'planned', 'path': file_metadata.relative_path, 'status': file_metadata.upload_status})
+
+    def record_completed(self, file_metadata: FileMetadata) -> None:
+        """
+        Record a task that completed in S3, with the record to write for it.
+        """
+        self._write({'event': 'completed', 'path': file_metadata.relative_path, 'record': file_metadata.to_item()})
+
+    def record_deleted(self, file_metadata: FileMetadata) -> None:
+        """
+        Record a file whose object was deleted from S3, with the record to delete for it.
+        """
+        self._write({'event': 'deleted', 'path': file_metadata.relative_path, 'record': file_metadata.to_item()})
+
+    def record_multipart(self, file_metadata: FileMetadata, upload: MultipartUpload) -> None:
+        """
+        Record a multipart upload before its first part is sent.
+        """
+        entry = {
+            'upload_id': upload.upload_id,
+            'part_size': upload.part_size,
+            'size': file_metadata.size,
+            'mtime_ns': file_metadata.mtime_ns
+        }
+        with self._lock:
+            self._open_multipart[file_metadata.relative_path] = entry
+        self._write(dict(entry, event='multipart', path=file_metadata.relative_path), sync=True)
+
+    def record_multipart_closed(self, relative_path: str) -> None:
+        """
+        Record that the multipart upload of a file completed or was aborted.
+        """
+        with self._lock:
+            if self._open_multipart.pop(relative_path, None) is None:
+                return
+        self._write({'event': 'multipart_closed', 'path': relative_path})
+
+    def finish(self) -> None:
+        """
+        Mark the run complete: its metadata is written, so only the multipart
+        uploads still open are kept. The journal is rewritten in place.
+        """
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            for path, entry in self._open_multipart.items():
+                self._file.write(json.dumps(dict(entry, event='multipart', path=path)) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.recovered = None
+
+    def close(self) -> None:
+        """
+        Close the journal, releasing it for other processes.
+        """
+        with self._lock:
+            self._file.close()
+
+    def _write(self, entry: Dict[str, Any], sync: bool = False) -> None:
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
@@ -0,0 +1,96 @@
+"""
+NDJSON manifest of the tasks a synchronization would run, so the diff can be
+computed once and executed in shards by several processes or hosts.
+"""
+
+import hashlib
+import json
+import threading
+from typing import IO, Dict, Iterator, Tuple
+from bloblog.metadata.file_metadata import FileMetadata
+
+# Format version written in the manifest header.
+MANIFEST_VERSION = 1
+
+# Manifest operation of each task status.
+OPERATIONS = {'upload_pending': 'upload', 'update_pending': 'update', 'delete_pending': 'delete'}
+
+def shard_of(relative_path: str, shards: int) -> int:
+    """
+    Return the shard a path belongs to. The partition is a stable hash of the
+    path, so every process splitting a manifest agrees on it.
+
+    :param relative_path: Path relative to the sync root.
+    :param shards: Number of shards.
+    :return: The shard index, from 0 to shards - 1.
+    """
+    digest = hashlib.sha256(relative_path.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parse a shard written as "i/N", with 0 <= i < N.
+
+    :return: The shard index and the number of shards.
+    :raises ValueError: If the value is malformed or out of range.
+    """
+    try:
+        index, shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}, expected i/N")
+    if shards < 1 or not 0 <= index < shards:
+        raise ValueError(f"Invalid shard {value!r}, expected 0 <= i < N")
+    return index, shards
+
+class PlanWriter:
+    """
+    Writes tasks to a manifest, one JSON object per line after a header line,
+    and totals the files and bytes of each operation.
+    """
+    def __init__(self, stream: IO[str]):
+        """
+        :param stream: Text stream the manifest is written to.
+        """
+        self._stream = stream
+        self._lock = threading.Lock()
+        self.totals: Dict[str, Dict[str, int]] = {
+            operation: {'files': 0, 'bytes': 0} for operation in OPERATIONS.values()
+        }
+        self._stream.write(json.dumps({'manifest': MANIFEST_VERSION}) + '\n')
+
+    def add(self, file_metadata: FileMetadata) -> None:
+        """
+        Write one task.
+
+        :param file_metadata: FileMetadata with upload_status upload_pending, update_pending or delete_pending.
+        """
+        operation = OPERATIONS[file_metadata.upload_status]
+        line = json.dumps({'op': operation, 'record': file_metadata.to_item()}, separators=(',', ':'))
+        with self._lock:
+            self._stream.write(line + '\n')
+            self.totals[operation]['files'] += 1
+            self.totals[operation]['bytes'] += file_metadata.size
+
+def read_plan(stream: IO[str], index: int = 0, shards: int = 1) -> Iterator[FileMetadata]:
+    """
+    Read the tasks of one shard of a manifest.
+
+    :param stream: Text stream the manifest is read from.
+    :param index: Shard to read.
+    :param shards: Number of shards the manifest is split into.
+    :return: The tasks of the shard, with their upload_status set.
+    :raises ValueError: If the stream is not a manifest of a supported version.
+    """
+    try:
+        header = json.loads(next(stream))
+    except (StopIteration, ValueError):
+        raise ValueError("Not a bloblog plan manifest")
+    if not isinstance(header, dict) or header.get('manifest') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported plan manifest version: {header}")
+    for line in stream:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        record = entry['record']
+        if shard_of(record['relative_path'], shards) == index:
+            yield FileMetadata(**record)
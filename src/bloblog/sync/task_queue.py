@@ -2,37 +2,104 @@
 Implements tasks and task queues for the synchronization process.
 """
 
-from typing import Optional
+import threading
+import time
+from typing import Deque, Optional
 from collections import deque
 from bloblog.metadata.file_metadata import FileMetadata
 
 class TaskQueue:
     """
-    In-memory queue for managing a collection of tasks.
+    Thread-safe, optionally bounded, blocking queue of tasks.
+
+    Producers block in enqueue() while the queue is full, which keeps the walk
+    from running far ahead of the workers. The producer calls close() once it
+    has nothing more to add; dequeue() then returns None after the remaining
+    tasks have been handed out.
     """
-    def __init__(self):
+    def __init__(self, maxsize: int = 0) -> None:
         """
         Initialize an empty task queue.
+
+        :param maxsize: Maximum number of queued tasks, 0 for unbounded.
         """
-        self._queue = deque()
+        self.maxsize = maxsize
+        self._queue: Deque[FileMetadata] = deque()
+        self._closed = False
+        self._condition = threading.Condition()
 
     def enqueue(self, file_metadata: FileMetadata) -> None:
         """
-        Add a file metadata to the queue.
+        Add a file metadata to the queue, blocking while the queue is full.
 
         :param file_metadata: FileMetadata instance to add.
+        :raises RuntimeError: If the queue has been closed.
+        """
+        with self._condition:
+            while self.maxsize and len(self._queue) >= self.maxsize and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                raise RuntimeError("Cannot enqueue a task on a closed TaskQueue")
+            self._queue.append(file_metadata)
+            self._condition.notify_all()
+
+    def requeue(self, file_metadata: FileMetadata) -> None:
         """
-        self._queue.append(file_metadata)
+        Put a task back at the end of the queue, e.g. to retry it after a
+        failure. Unlike enqueue(), it never blocks and is accepted after close(),
+        so a worker can return a task while the queue is being drained.
 
-    def dequeue(self) -> Optional[FileMetadata]:
+        :param file_metadata: FileMetadata instance to add.
         """
-        Remove and return the next file metadata in the queue, if any.
+        with self._condition:
+            self._queue.append(file_metadata)
+            self._condition.notify_all()
 
-        :return: A FileMetadata or None if empty.
+    def dequeue(self, timeout: Optional[float] = None) -> Optional[FileMetadata]:
         """
-        if self._queue:
-            return self._queue.popleft()
-        return None
+        Remove and return the next file metadata in the queue, blocking until one
+        is available.
+
+        :param timeout: Maximum seconds to wait, None to wait indefinitely.
+        :return: A FileMetadata, or None if the queue is closed and drained or the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._queue and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if not self._queue:
+                return None
+            file_metadata = self._queue.popleft()
+            self._condition.notify_all()
+            return file_metadata
+
+    def close(self) -> None:
+        """
+        Signal that no more tasks will be added. Blocked producers are woken and
+        fail; consumers drain the remaining tasks and then receive None.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def reopen(self) -> None:
+        """
+        Accept tasks again after close(), so the queue can serve another run.
+        """
+        with self._condition:
+            self._closed = False
+
+    def is_closed(self) -> bool:
+        """
+        Check whether the queue has been closed.
+
+        :return: True if closed, False otherwise.
+        """
+        with self._condition:
+            return self._closed
 
     def is_empty(self) -> bool:
         """
@@ -40,4 +107,14 @@ class TaskQueue:
 
         :return: True if empty, False otherwise.
         """
-        return not self._queue
+        with self._condition:
+            return not self._queue
+
+    def qsize(self) -> int:
+        """
+        Return the number of queued tasks.
+
+        :return: The queue depth.
+        """
+        with self._condition:
+            return len(self._queue)
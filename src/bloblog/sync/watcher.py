@@ -0,0 +1,155 @@
+"""
+Watches the sync root with inotify and reports changed paths in coalesced batches.
+"""
+
+import errno
+import os
+import time
+from typing import Dict, Optional, Set
+from bloblog.config.exclude_matcher import ExcludeMatcher
+from .inotify import (
+    Inotify, InotifyEvent, IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_EXCL_UNLINK,
+    IN_IGNORED, IN_ISDIR, IN_MOVED_FROM, IN_MOVED_TO, IN_ONLYDIR, IN_Q_OVERFLOW
+)
+
+# Events that can change what should be in the bucket.
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_ONLYDIR | IN_EXCL_UNLINK
+)
+
+class ChangeWatcher:
+    """
+    Watches every non-excluded directory below the sync root and collects the
+    relative paths of files and directories that were created, written, moved
+    or deleted.
+
+    Events are coalesced: wait_for_changes() returns once no event arrived for
+    `debounce` seconds, or `max_delay` seconds after the first event of a burst,
+    so a burst of writes becomes one batch with each path listed once. When the
+    kernel event queue overflows, events were lost and the caller must rescan
+    the whole tree.
+    """
+    def __init__(self, sync_root: str, exclude_matcher: ExcludeMatcher, debounce: float = 0.5, max_delay: float = 5.0):
+        """
+        :param sync_root: Directory to watch.
+        :param exclude_matcher: Paths it matches are neither watched nor reported.
+        :param debounce: Seconds without events that end a batch.
+        :param max_delay: Maximum seconds a batch is held back by a continuous burst.
+        """
+        self.sync_root = sync_root
+        self.exclude_matcher = exclude_matcher
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._inotify: Optional[Inotify] = None
+        # Relative directory of each watch descriptor, '' for the sync root.
+        self._directories: Dict[int, str] = {}
+
+    def start(self) -> None:
+        """
+        Start watching the tree, replacing any previous watches.
+
+        :raises OSError: If inotify is unavailable or the watch limit is reached.
+        """
+        self.close()
+        self._inotify = Inotify()
+        self._watch_tree('')
+
+    def close(self) -> None:
+        """
+        Stop watching.
+        """
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._directories = {}
+
+    def wait_for_changes(self, timeout: Optional[float] = None) -> Optional[Set[str]]:
+        """
+        Block until a batch of changes is complete.
+
+        :param timeout: Maximum seconds to wait for the first event, None to wait indefinitely.
+        :return: Changed paths relative to the sync root (empty if the timeout expired),
+                 or None if events were lost and the whole tree must be rescanned.
+        """
+        inotify = self._started()
+        changes: Set[str] = set()
+        overflow = False
+        events = inotify.read_events(timeout)
+        if not events:
+            return changes
+        deadline = time.monotonic() + self.max_delay
+        while events:
+            for event in events:
+                if event.mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif not overflow:
+                    self._handle_event(event, changes)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            events = inotify.read_events(min(self.debounce, remaining))
+        return None if overflow else changes
+
+    def _handle_event(self, event: InotifyEvent, changes: Set[str]) -> None:
+        """
+        Record the path of one event, keeping the watches in step with directory changes.
+        """
+        if event.mask & IN_IGNORED:
+            self._directories.pop(event.wd, None)
+            return
+        directory = self._directories.get(event.wd)
+        if directory is None or not event.name:
+            return
+        relative_path = directory + event.name
+        if self.exclude_matcher.matches(relative_path):
+            return
+        if event.mask & IN_ISDIR:
+            if event.mask & IN_MOVED_FROM:
+                self._unwatch_tree(relative_path + '/')
+            elif event.mask & (IN_CREATE | IN_MOVED_TO):
+                # Files created before the watch existed are found when the directory is walked.
+                self._watch_tree(relative_path + '/')
+        changes.add(relative_path)
+
+    def _watch_tree(self, relative_directory: str) -> None:
+        """
+        Watch a directory and every non-excluded directory below it.
+        """
+        inotify = self._started()
+        directories = [relative_directory]
+        while directories:
+            relative_directory = directories.pop()
+            path = os.path.join(self.sync_root, relative_directory)
+            try:
+                wd = inotify.add_watch(path, WATCH_MASK)
+                self._directories[wd] = relative_directory
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        relative_path = relative_directory + entry.name
+                        if entry.is_dir(follow_symlinks=False) and not self.exclude_matcher.matches(relative_path):
+                            directories.append(relative_path + '/')
+            except OSError as e:
+                # Directories removed while being watched are reported by their parent.
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+
+    def _unwatch_tree(self, relative_directory: str) -> None:
+        """
+        Remove the watches of a directory moved away, whose paths are no longer valid.
+        """
+        inotify = self._started()
+        for wd, directory in list(self._directories.items()):
+            if directory.startswith(relative_directory):
+                inotify.rm_watch(wd)
+                del self._directories[wd]
+
+    def _started(self) -> Inotify:
+        """
+        Return the inotify instance of start().
+
+        :raises RuntimeError: If the watcher is not started.
+        """
+        if self._inotify is None:
+            raise RuntimeError("ChangeWatcher is not started")
+        return self._inotify
@@ -0,0 +1,278 @@
+"""
+Throughput benchmarks of FileSynchronizer against in-process S3 and metadata
+stand-ins, on a synthetic tree:
+
+- cold: every file is new and uploaded.
+- no_change: a second run over the same tree.
+- partial_change: after a fraction of the files was rewritten, duplicated or deleted.
+
+The metadata table is an in-process stand-in, or a real SQLite database with
+--metadata-backend sqlite.
+
+Usage:
+    python -m tests.benchmarks.bench --files 5000 --s3-latency 0.02 --output results.json
+    python -m tests.benchmarks.bench --files 5000 --compare results.json
+    python -m tests.benchmarks.bench --files 5000 --metadata-backend sqlite
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+import yaml
+from bloblog.config.config_manager import ConfigManager
+from bloblog.metadata.metadata_client import MetadataClient
+from bloblog.metadata.sqlite_client import SQLiteClient
+from bloblog.sync.file_synchronizer import FileSynchronizer
+from bloblog.sync.hash_cache import HashCache
+from bloblog.sync.hashing import HashEngine
+from bloblog.sync.task_queue import TaskQueue
+from .fakes import FakeMetadataClient, FakeS3Client
+from .synthetic_tree import DEFAULT_SIZES, generate_tree, list_files, mutate_tree, parse_sizes
+
+SCENARIOS = ['cold', 'no_change', 'partial_change']
+
+METADATA_BACKENDS = ['fake', 'sqlite']
+
+CACHE_CONTROL = {
+    'default': {'max-age': 3600, 'settings': 'public,must-revalidate'},
+    'rules': [
+        {
+            'mimetype': ['text/html', 'text/css', 'application/javascript'],
+            'settings': 'public,must-revalidate',
+            'age': [{'item': '1w', 'max': '1d'}, {'item': '1m', 'max': '1w'}]
+        },
+        {
+            'mimetype': ['image/*', 'font/*'],
+            'settings': 'public,immutable',
+            'age': [{'item': '1w', 'max': '1m'}]
+        }
+    ]
+}
+
+def build_config(workdir: str, sync_root: str, workers: int) -> ConfigManager:
+    """
+    Write a configuration for the benchmark tree and load it.
+    """
+    config = {
+        'cache_control': CACHE_CONTROL,
+        'sync': {'root_path': sync_root, 'exclude_patterns': [], 'snapshot': True},
+        'workers': workers
+    }
+    config_file = os.path.join(workdir, 'config.yaml')
+    with open(config_file, 'w') as f:
+        yaml.safe_dump(config, f)
+    return ConfigManager(config_file)
+
+def tree_size(root: str) -> tuple:
+    """
+    Return the number of files below root and their total size.
+    """
+    paths = list_files(root)
+    return len(paths), sum(os.path.getsize(path) for path in paths)
+
+def run_sync(
+    config_manager: ConfigManager,
+    s3_client: FakeS3Client,
+    metadata_client: MetadataClient,
+    hash_cache: Optional[HashCache],
+    hash_engine: HashEngine
+) -> dict:
+    """
+    Run one full synchronization and measure it.
+
+    :return: Timings, throughput and request counts of the run.
+    """
+    files, nbytes = tree_size(config_manager.get_sync_root_path())
+    s3_before = dict(s3_client.counters)
+    db_before = metadata_counters(metadata_client)
+    synchronizer = FileSynchronizer(
+        metadata_client=metadata_client,
+        s3_client=s3_client,
+        config_manager=config_manager,
+        task_queue=TaskQueue(maxsize=config_manager.get_workers() * 16),
+        hash_cache=hash_cache,
+        hash_engine=hash_engine
+    )
+    started = time.perf_counter()
+    synchronizer.start_synchronization()
+    seconds = time.perf_counter() - started
+    s3 = {name: value - s3_before[name] for name, value in s3_client.counters.items()}
+    db = {name: value - db_before[name] for name, value in metadata_counters(metadata_client).items()}
+    return {
+        'seconds': seconds,
+        'files': files,
+        'bytes': nbytes,
+        'files_per_second': files / seconds if seconds else 0.0,
+        'bytes_per_second': nbytes / seconds if seconds else 0.0,
+        'uploads': s3['uploads'],
+        'uploaded_bytes': s3['bytes_uploaded'],
+        'copies': s3['copies'],
+        'deletes': s3['deletes'],
+        'header_updates': s3['updates'],
+        's3_requests': s3['requests'],
+        'metadata_requests': db['requests'],
+        'metadata_writes': db['writes']
+    }
+
+def metadata_counters(metadata_client: MetadataClient) -> dict:
+    """
+    Return the requests and record writes made so far by a metadata client.
+    """
+    if isinstance(metadata_client, FakeMetadataClient):
+        return dict(metadata_client.counters)
+    counters = metadata_client.metrics.summary()['counters']
+    return {
+        'requests': sum(counters.get('sqlite_requests_total', {}).values()),
+        'writes': sum(counters.get('sqlite_rows_written_total', {}).values())
+    }
+
+def run_benchmarks(
+    files: int = 1000,
+    sizes: List[tuple] = DEFAULT_SIZES,
+    depth: int = 3,
+    fanout: int = 8,
+    change_ratio: float = 0.05,
+    workers: int = 8,
+    s3_latency: float = 0.0,
+    metadata_latency: float = 0.0,
+    bandwidth: Optional[float] = None,
+    hash_cache: bool = True,
+    seed: int = 0,
+    metadata_backend: str = 'fake'
+) -> dict:
+    """
+    Generate a tree and measure the cold, no-change and partial-change scenarios.
+
+    :return: The results document, with parameters and one entry per scenario.
+    """
+    parameters = {
+        'files': files, 'sizes': sizes, 'depth': depth, 'fanout': fanout,
+        'change_ratio': change_ratio, 'workers': workers, 's3_latency': s3_latency,
+        'metadata_latency': metadata_latency, 'bandwidth': bandwidth,
+        'hash_cache': hash_cache, 'seed': seed, 'metadata_backend': metadata_backend
+    }
+    with tempfile.TemporaryDirectory(prefix='bloblog-bench-') as workdir:
+        sync_root = os.path.join(workdir, 'site')
+        os.makedirs(sync_root)
+        generate_tree(sync_root, files, sizes, depth, fanout, seed)
+        config_manager = build_config(workdir, sync_root, workers)
+        s3_client = FakeS3Client(latency=s3_latency, bandwidth=bandwidth)
+        if metadata_backend == 'sqlite':
+            metadata_client = SQLiteClient(os.path.join(workdir, 'metadata.sqlite'))
+        else:
+            metadata_client = FakeMetadataClient(latency=metadata_latency)
+        cache = HashCache(os.path.join(workdir, 'hashes.sqlite')) if hash_cache else None
+        engine = HashEngine(**config_manager.get_hashing_config())
+        try:
+            results = {'cold': run_sync(config_manager, s3_client, metadata_client, cache, engine)}
+            results['no_change'] = run_sync(config_manager, s3_client, metadata_client, cache, engine)
+            mutate_tree(sync_root, change_ratio, seed + 1)
+            results['partial_change'] = run_sync(config_manager, s3_client, metadata_client, cache, engine)
+        finally:
+            engine.close()
+            metadata_client.close()
+            if cache is not None:
+                cache.close()
+    return {
+        'commit': _git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'parameters': parameters,
+        'scenarios': results
+    }
+
+def compare(previous: dict, current: dict) -> List[str]:
+    """
+    Describe the throughput change of each scenario between two results documents.
+
+    :return: One line per scenario present in both.
+    """
+    lines = []
+    for scenario in SCENARIOS:
+        before = previous.get('scenarios', {}).get(scenario)
+        after = current['scenarios'].get(scenario)
+        if not before or not after or not before['files_per_second']:
+            continue
+        change = after['files_per_second'] / before['files_per_second'] - 1
+        lines.append(
+            f"{scenario}: {before['files_per_second']:.1f} -> {after['files_per_second']:.1f} files/s ({change:+.1%})"
+        )
+    return lines
+
+def format_results(results: dict) -> List[str]:
+    """
+    Format a results document as one line per scenario.
+    """
+    return [
+        f"{scenario}: {result['seconds']:.2f}s, {result['files_per_second']:.1f} files/s, "
+        f"{result['bytes_per_second'] / 1024 ** 2:.1f} MB/s, {result['uploads']} uploads, "
+        f"{result['copies']} copies, {result['deletes']} deletes, {result['s3_requests']} S3 requests, "
+        f"{result['metadata_requests']} metadata requests"
+        for scenario, result in results['scenarios'].items()
+    ]
+
+def _git_commit() -> Optional[str]:
+    """
+    Return the commit being benchmarked, if run from a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark bloblog synchronization on a synthetic tree.")
+    parser.add_argument("--files", type=int, default=1000, help="Number of files in the tree.")
+    parser.add_argument("--sizes", default="70:4KB,25:256KB,5:4MB", help="Size distribution as weight:size buckets.")
+    parser.add_argument("--depth", type=int, default=3, help="Maximum directory depth.")
+    parser.add_argument("--fanout", type=int, default=8, help="Directories per level.")
+    parser.add_argument("--change-ratio", type=float, default=0.05, help="Fraction of files changed before the partial-change run.")
+    parser.add_argument("--workers", type=int, default=8, help="Synchronizer workers.")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="Seconds added to every S3 request.")
+    parser.add_argument("--metadata-latency", type=float, default=0.0, help="Seconds added to every metadata request.")
+    parser.add_argument(
+        "--metadata-backend", choices=METADATA_BACKENDS, default="fake",
+        help="In-process metadata stand-in, or a SQLite database (ignores --metadata-latency)."
+    )
+    parser.add_argument("--bandwidth", type=float, default=None, help="Simulated upload bandwidth in bytes per second.")
+    parser.add_argument("--no-hash-cache", action="store_true", help="Run without the local hash cache.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the tree.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Compare with the results JSON of an earlier run.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        files=args.files,
+        sizes=parse_sizes(args.sizes),
+        depth=args.depth,
+        fanout=args.fanout,
+        change_ratio=args.change_ratio,
+        workers=args.workers,
+        s3_latency=args.s3_latency,
+        metadata_latency=args.metadata_latency,
+        bandwidth=args.bandwidth,
+        hash_cache=not args.no_hash_cache,
+        seed=args.seed,
+        metadata_backend=args.metadata_backend
+    )
+    for line in format_results(results):
+        print(line)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), results):
+                print(line)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+In-process stand-ins for S3Client and MetadataClient with configurable latency.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.storage.s3_client import MultipartUpload
+from bloblog.metadata.metadata_client import MetadataClient
+
+# Items per simulated BatchWriteItem call, as in DynamoDBClient.
+BATCH_WRITE_SIZE = 25
+
+# Records per simulated Scan page.
+SCAN_PAGE_SIZE = 4000
+
+class FakeS3Client:
+    """
+    Stores objects in memory. Every request sleeps for `latency` seconds, and
+    transfers additionally for size / bandwidth seconds when a bandwidth is set.
+    """
+    def __init__(self, latency: float = 0.0, bandwidth: Optional[float] = None):
+        """
+        :param latency: Seconds added to every request.
+        :param bandwidth: Simulated transfer rate in bytes per second, None for unlimited.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.objects: Dict[str, dict] = {}
+        self.counters = {'requests': 0, 'uploads': 0, 'copies': 0, 'deletes': 0, 'updates': 0, 'bytes_uploaded': 0}
+        self._lock = threading.Lock()
+
+    def upload_file(
+        self,
+        metadata: FileMetadata,
+        sync_root: str,
+        resume: Optional[MultipartUpload] = None,
+        on_multipart_start: Optional[Callable[[MultipartUpload], None]] = None,
+        on_multipart_closed: Optional[Callable[[MultipartUpload], None]] = None
+    ) -> Optional[str]:
+        # Uploads complete in one request, so there are no multipart uploads to journal.
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(os.path.join(sync_root, metadata.relative_path), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+                size += len(chunk)
+        self._request(size)
+        with self._lock:
+            self.objects[metadata.relative_path] = self._object(metadata, sha256.hexdigest())
+            self.counters['uploads'] += 1
+            self.counters['bytes_uploaded'] += size
+        return sha256.hexdigest()
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> bool:
+        self._request()
+        return True
+
+    def copy_file(self, source_key: str, metadata: FileMetadata) -> bool:
+        self._request()
+        with self._lock:
+            if source_key not in self.objects:
+                return False
+            self.objects[metadata.relative_path] = self._object(metadata, self.objects[source_key]['sha256'])
+            self.counters['copies'] += 1
+        return True
+
+    def delete_file(self, metadata: FileMetadata) -> None:
+        self.delete_files([metadata])
+
+    def delete_files(self, metadata_list: List[FileMetadata]) -> List[FileMetadata]:
+        self._request()
+        with self._lock:
+            for metadata in metadata_list:
+                self.objects.pop(metadata.relative_path, None)
+            self.counters['deletes'] += len(metadata_list)
+        return list(metadata_list)
+
+    def update_file_metadata(self, metadata: FileMetadata) -> None:
+        self._request()
+        with self._lock:
+            stored = self.objects.get(metadata.relative_path)
+            if stored is not None:
+                stored.update(cache_control=metadata.cache_control, content_type=metadata.content_type)
+            self.counters['updates'] += 1
+
+    def _object(self, metadata: FileMetadata, sha256: str) -> dict:
+        return {
+            'sha256': sha256,
+            'cache_control': metadata.cache_control,
+            'content_type': metadata.content_type,
+            'uuid': metadata.uuid
+        }
+
+    def _request(self, nbytes: int = 0) -> None:
+        delay = self.latency + (nbytes / self.bandwidth if self.bandwidth else 0.0)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.counters['requests'] += 1
+
+class FakeMetadataClient(MetadataClient):
+    """
+    Keeps records in memory. Single-record calls sleep for `latency` seconds;
+    batched writes are buffered and cost one latency per BATCH_WRITE_SIZE items.
+    Records are returned as copies, as a real table would.
+    """
+    def __init__(self, latency: float = 0.0):
+        """
+        :param latency: Seconds added to every request.
+        """
+        self.latency = latency
+        self.records: Dict[str, dict] = {}
+        self.counters = {'requests': 0, 'writes': 0}
+        self._pending: Dict[str, Optional[dict]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, item: FileMetadata) -> None:
+        self._request()
+        with self._lock:
+            self.records[item.uuid] = item.to_item()
+            self.counters['writes'] += 1
+        item.mark_clean()
+
+    def update(self, item: FileMetadata) -> None:
+        if not item.is_dirty():
+            return
+        self.add(item)
+
+    def add_batched(self, item: FileMetadata) -> None:
+        with self._lock:
+            self._pending[item.uuid] = item.to_item()
+        item.mark_clean()
+        self._drain(force=False)
+
+    def delete_batched(self, item: FileMetadata) -> None:
+        with self._lock:
+            self._pending[item.uuid] = None
+        self._drain(force=False)
+
+    def flush(self) -> None:
+        self._drain(force=True)
+
+    def get_file_metadata(self, relative_path: str) -> Optional[FileMetadata]:
+        self._request()
+        with self._lock:
+            for record in self.records.values():
+                if record['relative_path'] == relative_path:
+                    return FileMetadata(**record)
+        return None
+
+    def fetch_all_records(self, segments: int = 1) -> List[FileMetadata]:
+        # One request per 1MB page of about SCAN_PAGE_SIZE records, with segments scanned in parallel.
+        with self._lock:
+            records = [FileMetadata(**record) for record in self.records.values()]
+        pages = -(-len(records) // SCAN_PAGE_SIZE) or 1
+        for _ in range(-(-pages // max(1, segments))):
+            self._request()
+        return records
+
+    def delete(self, item: FileMetadata) -> None:
+        self._request()
+        with self._lock:
+            self._pending.pop(item.uuid, None)
+            self.records.pop(item.uuid, None)
+            self.counters['writes'] += 1
+
+    def _drain(self, force: bool) -> None:
+        while True:
+            with self._lock:
+                if not self._pending or (len(self._pending) < BATCH_WRITE_SIZE and not force):
+                    return
+                keys = list(self._pending)[:BATCH_WRITE_SIZE]
+                batch = {key: self._pending.pop(key) for key in keys}
+            self._request()
+            with self._lock:
+                for key, record in batch.items():
+                    if record is None:
+                        self.records.pop(key, None)
+                    else:
+                        self.records[key] = record
+                self.counters['writes'] += len(batch)
+
+    def _request(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.counters['requests'] += 1
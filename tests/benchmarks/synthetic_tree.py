@@ -0,0 +1,116 @@
+"""
+Generates and mutates synthetic directory trees for benchmarks.
+"""
+
+import os
+import random
+from typing import List, Tuple
+
+# File extensions drawn for generated files, so MIME-based cache rules are exercised.
+EXTENSIONS = ['.html', '.css', '.js', '.png', '.jpg', '.woff2', '.json']
+
+# Default size distribution: (weight, size in bytes) buckets.
+DEFAULT_SIZES = [(70, 4 * 1024), (25, 256 * 1024), (5, 4 * 1024 ** 2)]
+
+UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'B': 1}
+
+def parse_sizes(spec: str) -> List[Tuple[int, int]]:
+    """
+    Parse a size distribution such as "70:4KB,25:256KB,5:4MB".
+
+    :param spec: Comma separated weight:size buckets.
+    :return: A list of (weight, size in bytes) pairs.
+    """
+    buckets = []
+    for part in spec.split(','):
+        weight, size = part.split(':')
+        size = size.strip().upper()
+        for unit, multiplier in UNITS.items():
+            if size.endswith(unit):
+                buckets.append((int(weight), int(float(size[:-len(unit)]) * multiplier)))
+                break
+        else:
+            buckets.append((int(weight), int(size)))
+    return buckets
+
+def generate_tree(
+    root: str,
+    files: int,
+    sizes: List[Tuple[int, int]] = DEFAULT_SIZES,
+    depth: int = 3,
+    fanout: int = 8,
+    seed: int = 0
+) -> Tuple[int, int]:
+    """
+    Fill root with random files. Each file is placed at a random depth up to
+    `depth`, in one of `fanout` directories per level, and gets a size between
+    half and all of a bucket drawn from `sizes`.
+
+    :param root: Directory to create the files in.
+    :param files: Number of files.
+    :param sizes: (weight, size in bytes) buckets.
+    :param depth: Maximum directory depth.
+    :param fanout: Directories per level.
+    :param seed: Random seed, so trees are reproducible.
+    :return: The number of files and their total size in bytes.
+    """
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in sizes]
+    total_bytes = 0
+    for index in range(files):
+        levels = rng.randint(0, depth)
+        directory = os.path.join(root, *[f"d{rng.randrange(fanout)}" for _ in range(levels)])
+        os.makedirs(directory, exist_ok=True)
+        bucket = rng.choices(sizes, weights)[0][1]
+        size = rng.randint(bucket // 2, bucket)
+        path = os.path.join(directory, f"f{index}{rng.choice(EXTENSIONS)}")
+        with open(path, 'wb') as f:
+            f.write(_random_bytes(rng, size))
+        total_bytes += size
+    return files, total_bytes
+
+def list_files(root: str) -> List[str]:
+    """
+    Return every file below root, sorted.
+    """
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names
+    )
+
+def mutate_tree(root: str, ratio: float, seed: int = 1) -> Tuple[int, int]:
+    """
+    Change a fraction of the files below root: a tenth of them are deleted, a
+    tenth duplicated to new paths, and the rest rewritten with new content of the same size.
+
+    :param root: Directory of the tree.
+    :param ratio: Fraction of files to change, between 0 and 1.
+    :param seed: Random seed.
+    :return: The number of changed files and the bytes of new or rewritten content.
+    """
+    rng = random.Random(seed)
+    paths = list_files(root)
+    changed = rng.sample(paths, int(len(paths) * ratio))
+    changed_bytes = 0
+    for index, path in enumerate(changed):
+        action = index % 10
+        if action == 0:
+            os.remove(path)
+            continue
+        if action == 1:
+            with open(path, 'rb') as f:
+                content = f.read()
+            path = f"{path}.copy{os.path.splitext(path)[1]}"
+        else:
+            content = _random_bytes(rng, os.path.getsize(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+        changed_bytes += len(content)
+    return len(changed), changed_bytes
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    """
+    Return size reproducible random bytes.
+    """
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
@@ -0,0 +1,52 @@
+"""
+Tests for the benchmark harness in tests.benchmarks.
+"""
+
+import json
+from tests.benchmarks.bench import compare, main, run_benchmarks
+from tests.benchmarks.synthetic_tree import generate_tree, list_files, mutate_tree, parse_sizes
+
+
+def test_parse_sizes():
+    assert parse_sizes("70:4KB,30:1MB") == [(70, 4096), (30, 1024 ** 2)]
+
+
+def test_mutate_tree_changes_the_requested_ratio(tmp_path):
+    generate_tree(str(tmp_path), 100, sizes=[(1, 64)])
+
+    changed, _ = mutate_tree(str(tmp_path), 0.2)
+
+    assert changed == 20
+    # Two of the twenty changes delete a file and two add a duplicate.
+    assert len(list_files(str(tmp_path))) == 100
+
+
+def test_run_benchmarks_reports_every_scenario():
+    results = run_benchmarks(files=40, sizes=[(1, 1024)], workers=2, change_ratio=0.5)
+
+    scenarios = results['scenarios']
+    assert scenarios['cold']['uploads'] == 40
+    assert scenarios['no_change']['uploads'] == 0
+    assert scenarios['partial_change']['deletes'] == 2
+    assert scenarios['partial_change']['copies'] == 2
+    assert all(result['files_per_second'] > 0 for result in scenarios.values())
+
+
+def test_run_benchmarks_against_sqlite():
+    results = run_benchmarks(files=40, sizes=[(1, 1024)], workers=2, change_ratio=0.5, metadata_backend='sqlite')
+
+    scenarios = results['scenarios']
+    assert scenarios['cold']['uploads'] == 40
+    assert scenarios['cold']['metadata_writes'] == 40
+    assert scenarios['no_change']['uploads'] == 0
+    assert scenarios['partial_change']['deletes'] == 2
+
+
+def test_results_are_saved_and_compared(tmp_path, capsys):
+    output = tmp_path / 'results.json'
+
+    main(['--files', '10', '--sizes', '1:512', '--workers', '1', '--output', str(output)])
+    previous = json.loads(output.read_text())
+
+    assert set(previous['scenarios']) == {'cold', 'no_change', 'partial_change'}
+    assert [line.split(':')[0] for line in compare(previous, previous)] == ['cold', 'no_change', 'partial_change']
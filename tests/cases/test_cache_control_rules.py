@@ -0,0 +1,68 @@
+"""
+Tests for the CacheControlRules class in bloblog.config.cache_control_rules.
+"""
+
+from datetime import timedelta
+from bloblog.config.cache_control_rules import CacheControlRules, NO_TRANSITION
+
+DAY = 24 * 3600
+
+CACHE_CONTROL = {
+    'default': {'max-age': 3600, 'settings': 'public'},
+    'rules': [
+        {
+            'mimetype': ['text/html', 'image/svg+xml'],
+            'settings': 'public,must-revalidate',
+            'age': [{'item': 7, 'max': 1}, {'item': 30, 'max': 7}]
+        },
+        {
+            'mimetype': ['image/*'],
+            'settings': 'public,immutable',
+            'age': [{'item': 1, 'max': 365}]
+        }
+    ]
+}
+
+
+def _rules():
+    return CacheControlRules(CACHE_CONTROL, lambda days: timedelta(days=days))
+
+
+def test_age_thresholds_select_max_age():
+    rules = _rules()
+
+    assert rules.header('text/html', 3 * DAY) == 'max-age=3600,public'
+    assert rules.header('text/html', 10 * DAY) == 'max-age=86400,public,must-revalidate'
+    assert rules.header('text/html', 100 * DAY) == 'max-age=604800,public,must-revalidate'
+
+
+def test_wildcard_major_type_matches():
+    rules = _rules()
+
+    assert rules.header('image/png', 2 * DAY) == 'max-age=31536000,public,immutable'
+
+
+def test_exact_mime_type_wins_over_wildcard():
+    rules = _rules()
+
+    assert rules.header('image/svg+xml', 2 * DAY) == 'max-age=3600,public'
+
+
+def test_unmatched_type_gets_default():
+    rules = _rules()
+
+    assert rules.header('application/pdf', 1000 * DAY) == 'max-age=3600,public'
+
+
+def test_next_transition_is_the_next_threshold():
+    rules = _rules()
+
+    assert rules.next_transition('text/html', 1000.0, 3 * DAY) == 1000 + 7 * DAY + 1
+    assert rules.next_transition('text/html', 1000.0, 10 * DAY) == 1000 + 30 * DAY + 1
+
+
+def test_headers_that_never_change_have_no_transition():
+    rules = _rules()
+
+    assert rules.next_transition('text/html', 1000.0, 100 * DAY) == NO_TRANSITION
+    assert rules.next_transition('application/pdf', 1000.0, DAY) == NO_TRANSITION
@@ -0,0 +1,27 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from bloblog.metadata.client_factory import MetadataClientFactory
+from bloblog.metadata.dynamodb_client import DynamoDBClient
+from bloblog.metadata.sqlite_client import SQLiteClient
+
+
+def test_dynamodb_client_uses_session_factory():
+    session_factory = MagicMock()
+
+    client = MetadataClientFactory().get_client({'type': 'dynamodb', 'name': 'test-table'}, session_factory)
+
+    assert isinstance(client, DynamoDBClient)
+    session_factory.resource.assert_called_once_with('dynamodb')
+    session_factory.resource.return_value.Table.assert_called_once_with('test-table')
+
+
+def test_unsupported_db_type():
+    with pytest.raises(ValueError):
+        MetadataClientFactory().get_client({'type': 'simpledb', 'name': 'test-table'})
+
+
+def test_sqlite_client(tmp_path):
+    client = MetadataClientFactory().get_client({'type': 'sqlite', 'name': str(tmp_path / 'metadata.sqlite')})
+
+    assert isinstance(client, SQLiteClient)
+    client.close()
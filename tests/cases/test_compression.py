@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import os
+import pytest
+from unittest.mock import patch
+from bloblog.storage.compression import CompressionCache, CompressionRule, CompressionRules, Compressor
+
+TEXT = b'body { color: red; }\n' * 200
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_rules_match_exact_type_then_major_type():
+    rules = CompressionRules([
+        {'mimetype': ['application/json'], 'encoding': 'gzip', 'level': 6},
+        {'mimetype': ['text/*'], 'encoding': 'gzip'}
+    ])
+
+    assert rules.rule_for('application/json') == CompressionRule('gzip', 6)
+    assert rules.rule_for('text/css') == CompressionRule('gzip', 9)
+    assert rules.rule_for('image/png') is None
+
+
+def test_rules_reject_unknown_encoding():
+    with pytest.raises(ValueError):
+        CompressionRules([{'mimetype': ['text/*'], 'encoding': 'zstd'}])
+
+
+def test_small_files_are_not_compressed():
+    compressor = Compressor(CompressionRules([{'mimetype': ['text/*']}]), min_size=1024)
+
+    assert compressor.rule_for('text/css', 100) is None
+    assert compressor.rule_for('text/css', 4096) == CompressionRule('gzip', 9)
+
+
+def test_gzip_round_trip():
+    compressor = Compressor(CompressionRules([{'mimetype': ['text/*']}]))
+
+    encoded = compressor.encode(TEXT, _sha(TEXT), CompressionRule('gzip', 9))
+
+    assert encoded.encoding == 'gzip'
+    assert gzip.decompress(encoded.data) == TEXT
+    assert encoded.sha256 == _sha(encoded.data)
+
+
+def test_content_that_does_not_shrink_is_not_encoded():
+    compressor = Compressor(CompressionRules([{'mimetype': ['image/*']}]))
+    data = os.urandom(4096)
+
+    assert compressor.encode(data, _sha(data), CompressionRule('gzip', 9)) is None
+
+
+def test_cached_artifact_is_not_compressed_again(tmp_path):
+    cache = CompressionCache(str(tmp_path / 'cache'))
+    rule = CompressionRule('gzip', 9)
+    first = Compressor(CompressionRules([{'mimetype': ['text/*']}]), cache=cache)
+    encoded = first.encode(TEXT, _sha(TEXT), rule)
+
+    second = Compressor(CompressionRules([{'mimetype': ['text/*']}]), cache=CompressionCache(str(tmp_path / 'cache')))
+    with patch.object(Compressor, '_compress') as compress:
+        assert second.encode(TEXT, _sha(TEXT), rule) == encoded
+    compress.assert_not_called()
+    assert second.metrics.summary()['counters']['compression_cache_hits_total'] == {'encoding=gzip': 1}
+
+
+def test_close_evicts_least_recently_used_artifacts(tmp_path):
+    cache = CompressionCache(str(tmp_path / 'cache'), max_size=150)
+    rule = CompressionRule('gzip', 9)
+    for index, sha in enumerate(['aa' * 32, 'bb' * 32, 'cc' * 32]):
+        cache.put(sha, rule, b'x' * 60)
+        path = cache._artifact_path(sha, rule)
+        os.utime(path, ns=(index * 10 ** 9, index * 10 ** 9))
+
+    cache.close()
+
+    assert cache.get('aa' * 32, rule) is None
+    assert cache.get('bb' * 32, rule) == b'x' * 60
+    assert cache.get('cc' * 32, rule) == b'x' * 60
+
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip('brotli')
+    compressor = Compressor(CompressionRules([{'mimetype': ['text/*'], 'encoding': 'br'}]))
+
+    encoded = compressor.encode(TEXT, _sha(TEXT), compressor.rule_for('text/css', len(TEXT)))
+
+    assert encoded.encoding == 'br'
+    assert brotli.decompress(encoded.data) == TEXT
@@ -1,4 +1,8 @@
+import os
+import time
+from datetime import datetime
 from bloblog.config.config_manager import ConfigManager
+from bloblog.metadata.file_metadata import FileMetadata
 from pytest import fixture
 
 @fixture
@@ -41,3 +45,60 @@ def test_sync_settings(config):
 
 def test_workers(config):
     assert config.get_workers() == 5
+
+@fixture
+def local_config():
+    return ConfigManager(os.path.join(os.path.dirname(__file__), '..', 'data', 'test-config.yaml'))
+
+def test_transfer_defaults(local_config):
+    transfer = local_config.get_transfer_config()
+    assert transfer['multipart_threshold'] == 64 * 1024 ** 2
+    assert transfer['multipart_chunksize'] == 16 * 1024 ** 2
+    assert transfer['max_concurrency'] == 8
+    assert transfer['max_inflight_bytes'] == 1024 ** 3
+
+def test_transfer_sizes_are_parsed(local_config):
+    local_config.config['transfer'] = {'multipart_threshold': '512KB', 'multipart_chunksize': 1048576}
+    transfer = local_config.get_transfer_config()
+    assert transfer['multipart_threshold'] == 512 * 1024
+    assert transfer['multipart_chunksize'] == 1048576
+
+def test_cache_control_matches_wildcard_rules(local_config):
+    old = time.time() - 400 * 24 * 3600
+    file_metadata = FileMetadata('uuid', 'logo.png', '', 'upload_pending', '', '', 'image/png', mtime_ns=int(old * 1e9))
+
+    assert local_config.cache_control(file_metadata).cache_control == 'max-age=2592000,public,must-revalidate'
+
+def test_cache_control_falls_back_to_last_modified(local_config):
+    recent = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    file_metadata = FileMetadata('uuid', 'index.html', recent, 'upload_pending', '', '', 'text/html')
+
+    assert local_config.cache_control(file_metadata).cache_control == 'max-age=3600,public,must-revalidate'
+
+def test_logging_and_metrics_defaults(local_config):
+    local_config.config['logging'] = {'level': 'DEBUG', 'metrics': {'prometheus_path': '/tmp/bloblog.prom'}}
+
+    assert local_config.get_logging_config() == {
+        'level': 'DEBUG', 'format': 'text', 'output': 'stdout', 'file_path': None
+    }
+    assert local_config.get_metrics_config() == {'json_path': None, 'prometheus_path': '/tmp/bloblog.prom'}
+
+def test_journal_defaults(local_config):
+    assert local_config.get_journal_config() == {'enabled': True, 'path': None}
+
+def test_rate_control_defaults(local_config):
+    local_config.config['aws'] = {'rate_control': {'max_attempts': 4, 'services': {'s3': {'max_rate': 500}}}}
+
+    assert local_config.get_rate_control_config() == {
+        'max_attempts': 4, 'base_delay': 0.1, 'max_delay': 20, 'task_attempts': 3,
+        'services': {'s3': {'max_rate': 500}}
+    }
+
+def test_compression_defaults(local_config):
+    local_config.config['compression'] = {'rules': [{'mimetype': ['text/*'], 'encoding': 'gzip'}], 'min_size': '2KB'}
+
+    assert local_config.get_compression_config() == {
+        'rules': [{'mimetype': ['text/*'], 'encoding': 'gzip'}],
+        'min_size': 2048,
+        'cache': {'enabled': True, 'path': None, 'max_size': 1024 ** 3}
+    }
@@ -0,0 +1,56 @@
+"""
+Tests for the ContentIndex class in bloblog.sync.content_index.
+"""
+
+from bloblog.sync.content_index import ContentIndex
+from bloblog.metadata.file_metadata import FileMetadata
+
+def _record(relative_path, sha256, upload_status='uploaded', size=10):
+    return FileMetadata(
+        uuid=f'uuid-{relative_path}',
+        relative_path=relative_path,
+        last_modified='2023-10-10T10:00:00',
+        upload_status=upload_status,
+        sha256=sha256,
+        cache_control='',
+        content_type='text/html',
+        size=size
+    )
+
+
+def test_find_returns_existing_key_for_hash():
+    index = ContentIndex([_record('a.png', 'sha-a'), _record('b.png', 'sha-b', upload_status='upload_pending')])
+
+    assert index.find('sha-a') == 'a.png'
+    assert index.find('sha-b') is None
+    assert index.has_size(10)
+    assert not index.has_size(11)
+
+
+def test_find_never_returns_the_excluded_key():
+    index = ContentIndex([_record('a.png', 'sha-a')])
+
+    assert index.find('sha-a', exclude_key='a.png') is None
+
+
+def test_discard_removes_replaced_content():
+    record = _record('a.png', 'sha-a')
+    index = ContentIndex([record])
+
+    index.discard(_record('other.png', 'sha-a'))
+    assert index.find('sha-a') == 'a.png'
+    index.discard(record)
+    assert index.find('sha-a') is None
+
+
+def test_find_stored_returns_encoding_of_the_object():
+    record = _record('a.css', 'sha-a')
+    record.content_encoding = 'gzip'
+    record.encoded_size = 4
+    record.encoded_sha256 = 'sha-gz'
+    index = ContentIndex([record])
+
+    stored = index.find_stored('sha-a')
+
+    assert stored == ('a.css', 'gzip', 4, 'sha-gz')
+    assert index.find('sha-a') == 'a.css'
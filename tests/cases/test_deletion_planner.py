@@ -0,0 +1,34 @@
+from bloblog.sync.deletion_planner import DeletionPlanner
+from bloblog.metadata.file_metadata import FileMetadata
+
+
+def _record(relative_path):
+    return FileMetadata(
+        uuid=f'uuid-{relative_path}',
+        relative_path=relative_path,
+        last_modified='2023-10-10T10:00:00',
+        upload_status='uploaded',
+        sha256='abc',
+        cache_control='max-age=3600,public',
+        content_type='text/html'
+    )
+
+
+def test_plan_returns_unseen_records():
+    planner = DeletionPlanner()
+    planner.mark_seen('kept.html')
+
+    deletions = planner.plan([_record('kept.html'), _record('gone.html')])
+
+    assert [record.relative_path for record in deletions] == ['gone.html']
+    assert deletions[0].upload_status == 'delete_pending'
+
+
+def test_plan_with_everything_seen_is_empty():
+    planner = DeletionPlanner()
+    records = [_record('a.html'), _record('b/c.css')]
+    for record in records:
+        planner.mark_seen(record.relative_path)
+
+    assert planner.plan(records) == []
+    assert all(record.upload_status == 'uploaded' for record in records)
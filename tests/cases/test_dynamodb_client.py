@@ -0,0 +1,209 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+from bloblog.aws.rate_control import RateControl, is_retryable
+from bloblog.metadata.dynamodb_client import DynamoDBClient
+from bloblog.metadata.file_metadata import FileMetadata
+
+
+def _item(relative_path, sha256='abc'):
+    return {
+        'uuid': f'uuid-{relative_path}',
+        'relative_path': relative_path,
+        'last_modified': '2023-10-10T10:00:00',
+        'upload_status': 'uploaded',
+        'sha256': sha256,
+        'cache_control': 'max-age=3600,public',
+        'content_type': 'text/html'
+    }
+
+
+class TestDynamoDBClient:
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_fetch_all_records_single_scan(self, mock_boto3_resource):
+        paginator = MagicMock()
+        paginator.paginate.return_value = [{'Items': [_item('a.html')]}, {'Items': [_item('b.html')]}]
+        mock_boto3_resource.return_value.meta.client.get_paginator.return_value = paginator
+        client = DynamoDBClient('test-table')
+
+        records = client.fetch_all_records()
+
+        paginator.paginate.assert_called_once_with(TableName='test-table')
+        assert [record.relative_path for record in records] == ['a.html', 'b.html']
+        assert records[0].sha256 == 'abc'
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_fetch_all_records_segmented_scan(self, mock_boto3_resource):
+        paginator = MagicMock()
+        paginator.paginate.side_effect = lambda **kwargs: [
+            {'Items': [_item(f"segment-{kwargs['Segment']}.html")]}
+        ]
+        mock_boto3_resource.return_value.meta.client.get_paginator.return_value = paginator
+        client = DynamoDBClient('test-table')
+
+        records = client.fetch_all_records(segments=3)
+
+        assert sorted(record.relative_path for record in records) == [
+            'segment-0.html', 'segment-1.html', 'segment-2.html'
+        ]
+        for segment in range(3):
+            paginator.paginate.assert_any_call(TableName='test-table', Segment=segment, TotalSegments=3)
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_fetch_snapshot_keyed_by_relative_path(self, mock_boto3_resource):
+        paginator = MagicMock()
+        paginator.paginate.return_value = [{'Items': [_item('a.html', 'sha-a'), _item('b/c.css', 'sha-c')]}]
+        mock_boto3_resource.return_value.meta.client.get_paginator.return_value = paginator
+        client = DynamoDBClient('test-table')
+
+        snapshot = client.fetch_snapshot()
+
+        assert set(snapshot) == {'a.html', 'b/c.css'}
+        assert snapshot['b/c.css'].sha256 == 'sha-c'
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_add_batched_flushes_in_groups_of_25(self, mock_boto3_resource):
+        mock_dynamodb = mock_boto3_resource.return_value
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        client = DynamoDBClient('test-table')
+
+        for index in range(60):
+            client.add_batched(FileMetadata(**_item(f'file-{index}.html')))
+        assert mock_dynamodb.batch_write_item.call_count == 2
+
+        client.flush()
+
+        sizes = [len(call.kwargs['RequestItems']['test-table']) for call in mock_dynamodb.batch_write_item.call_args_list]
+        assert sizes == [25, 25, 10]
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_flush_retries_unprocessed_items(self, mock_boto3_resource):
+        mock_dynamodb = mock_boto3_resource.return_value
+        unprocessed = {'test-table': [{'PutRequest': {'Item': _item('a.html')}}]}
+        mock_dynamodb.batch_write_item.side_effect = [
+            {'UnprocessedItems': unprocessed},
+            {'UnprocessedItems': {}}
+        ]
+        delays = []
+        client = DynamoDBClient('test-table', rate_control=RateControl(sleep=delays.append))
+
+        client.add_batched(FileMetadata(**_item('a.html')))
+        client.add_batched(FileMetadata(**_item('b.html')))
+        client.flush()
+
+        assert mock_dynamodb.batch_write_item.call_count == 2
+        assert len(delays) == 1
+        mock_dynamodb.batch_write_item.assert_called_with(RequestItems=unprocessed)
+        counters = client.metrics.summary()['counters']
+        assert counters['dynamodb_items_written_total'] == {'': 2}
+        assert counters['dynamodb_unprocessed_items_total'] == {'': 1}
+        assert counters['dynamodb_requests_total'] == {'operation=batch_write_item,outcome=ok': 2}
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_failed_batch_is_buffered_again(self, mock_boto3_resource):
+        mock_dynamodb = mock_boto3_resource.return_value
+        mock_dynamodb.batch_write_item.side_effect = [
+            ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'BatchWriteItem'),
+            {'UnprocessedItems': {}}
+        ]
+        client = DynamoDBClient('test-table', rate_control=RateControl(max_attempts=1))
+        client.add_batched(FileMetadata(**_item('a.html')))
+
+        with pytest.raises(ClientError):
+            client.flush()
+        client.flush()
+
+        assert mock_dynamodb.batch_write_item.call_count == 2
+        assert mock_dynamodb.batch_write_item.call_args.kwargs['RequestItems']['test-table'] == [
+            {'PutRequest': {'Item': FileMetadata(**_item('a.html')).to_item()}}
+        ]
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_items_left_unprocessed_raise_a_retryable_error(self, mock_boto3_resource):
+        mock_dynamodb = mock_boto3_resource.return_value
+        mock_dynamodb.batch_write_item.return_value = {
+            'UnprocessedItems': {'test-table': [{'PutRequest': {'Item': _item('a.html')}}]}
+        }
+        client = DynamoDBClient('test-table', rate_control=RateControl(sleep=lambda seconds: None))
+        item = FileMetadata(**_item('a.html'))
+        item.sha256 = 'changed'
+        client.add_batched(item)
+
+        with pytest.raises(ClientError) as raised:
+            client.flush()
+
+        assert is_retryable(raised.value)
+        # The record stays dirty and buffered until a flush writes it.
+        assert item.is_dirty()
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        client.flush()
+        assert not item.is_dirty()
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_delete_discards_buffered_write(self, mock_boto3_resource):
+        mock_dynamodb = mock_boto3_resource.return_value
+        client = DynamoDBClient('test-table')
+        item = FileMetadata(**_item('a.html'))
+
+        client.add_batched(item)
+        client.delete(item)
+        client.flush()
+
+        mock_dynamodb.batch_write_item.assert_not_called()
+        mock_dynamodb.Table.return_value.delete_item.assert_called_once_with(Key={'uuid': 'uuid-a.html'})
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_update_writes_only_dirty_fields(self, mock_boto3_resource):
+        table = mock_boto3_resource.return_value.Table.return_value
+        client = DynamoDBClient('test-table')
+        item = FileMetadata(**_item('a.html'))
+        item.mtime_ns = 42
+
+        client.update(item)
+
+        kwargs = table.update_item.call_args.kwargs
+        assert kwargs['Key'] == {'uuid': 'uuid-a.html'}
+        assert kwargs['UpdateExpression'] == 'set #f0=:v0'
+        assert kwargs['ExpressionAttributeNames'] == {'#f0': 'mtime_ns', '#uuid': 'uuid'}
+        assert kwargs['ExpressionAttributeValues'] == {':v0': 42}
+        assert kwargs['ConditionExpression'] == 'attribute_exists(#uuid)'
+        assert not item.is_dirty()
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_update_skips_clean_record(self, mock_boto3_resource):
+        table = mock_boto3_resource.return_value.Table.return_value
+        client = DynamoDBClient('test-table')
+
+        client.update(FileMetadata(**_item('a.html')))
+
+        table.update_item.assert_not_called()
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_delete_batched_replaces_buffered_put(self, mock_boto3_resource):
+        mock_dynamodb = mock_boto3_resource.return_value
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        client = DynamoDBClient('test-table')
+        item = FileMetadata(**_item('a.html'))
+
+        client.add_batched(item)
+        client.delete_batched(item)
+        client.add_batched(FileMetadata(**_item('b.html')))
+        client.flush()
+
+        requests = mock_dynamodb.batch_write_item.call_args.kwargs['RequestItems']['test-table']
+        assert requests[0] == {'DeleteRequest': {'Key': {'uuid': 'uuid-a.html'}}}
+        assert requests[1]['PutRequest']['Item']['relative_path'] == 'b.html'
+        mock_dynamodb.Table.return_value.delete_item.assert_not_called()
+
+    @patch('bloblog.metadata.dynamodb_client.boto3.resource')
+    def test_fetch_due_transitions_filters_in_the_scan(self, mock_boto3_resource):
+        paginator = mock_boto3_resource.return_value.meta.client.get_paginator.return_value
+        paginator.paginate.return_value = [{'Items': [_item('a.html')]}]
+        client = DynamoDBClient('test-table')
+
+        records = client.fetch_due_transitions(1700000000)
+
+        assert [record.relative_path for record in records] == ['a.html']
+        kwargs = paginator.paginate.call_args.kwargs
+        assert kwargs['FilterExpression'] == 'attribute_not_exists(#transition) OR #transition <= :now'
+        assert kwargs['ExpressionAttributeValues'] == {':now': 1700000000}
@@ -0,0 +1,59 @@
+import pytest
+from bloblog.config.exclude_matcher import ExcludeMatcher
+
+
+def test_no_patterns_match_nothing():
+    assert not ExcludeMatcher([]).matches('index.html')
+
+
+def test_glob_without_slash_matches_any_component():
+    matcher = ExcludeMatcher(['*.tmp'])
+
+    assert matcher.matches('draft.tmp')
+    assert matcher.matches('posts/draft.tmp')
+    assert matcher.matches('cache.tmp/index.html')
+    assert not matcher.matches('draft.tmp.html')
+
+
+def test_glob_with_slash_is_anchored_at_root():
+    matcher = ExcludeMatcher(['drafts/*.md'])
+
+    assert matcher.matches('drafts/post.md')
+    assert not matcher.matches('drafts/2024/post.md')
+    assert not matcher.matches('blog/drafts/post.md')
+
+
+def test_double_star_crosses_directories():
+    matcher = ExcludeMatcher(['drafts/**/*.md'])
+
+    assert matcher.matches('drafts/2024/01/post.md')
+
+
+def test_character_class_glob():
+    matcher = ExcludeMatcher(['file[0-9].txt', 'v[!0-9].txt'])
+
+    assert matcher.matches('file7.txt')
+    assert not matcher.matches('filex.txt')
+    assert matcher.matches('va.txt')
+    assert not matcher.matches('v1.txt')
+
+
+def test_literal_matches_substring():
+    matcher = ExcludeMatcher(['node_modules'])
+
+    assert matcher.matches('node_modules')
+    assert matcher.matches('app/node_modules/pkg/index.js')
+    assert not matcher.matches('app/index.js')
+
+
+def test_regex_forms():
+    matcher = ExcludeMatcher(['re:\\.bak$', 'r"tmp"'])
+
+    assert matcher.matches('notes.bak')
+    assert matcher.matches('tmp/file.txt')
+    assert not matcher.matches('notes.bak.html')
+
+
+def test_invalid_regex_raises():
+    with pytest.raises(ValueError):
+        ExcludeMatcher(['re:('])
@@ -0,0 +1,57 @@
+from decimal import Decimal
+from bloblog.metadata.file_metadata import FileMetadata
+
+
+def _record(**overrides):
+    values = dict(
+        uuid='123',
+        relative_path='index.html',
+        last_modified='2023-10-10T10:00:00',
+        upload_status='uploaded',
+        sha256='abc',
+        cache_control='max-age=3600,public',
+        content_type='text/html',
+        size=Decimal(10),
+        mtime_ns=Decimal(1000)
+    )
+    values.update(overrides)
+    return FileMetadata(**values)
+
+
+def test_new_record_is_clean():
+    record = _record()
+
+    assert not record.is_dirty()
+    assert record.size == 10 and isinstance(record.size, int)
+
+
+def test_changed_fields_are_dirty():
+    record = _record()
+    record.mtime_ns = 2000
+    record.sha256 = 'abc'
+
+    assert record.dirty_fields == {'mtime_ns'}
+
+
+def test_field_set_back_to_original_is_clean():
+    record = _record()
+    record.upload_status = 'upload_pending'
+    record.upload_status = 'uploaded'
+
+    assert not record.is_dirty()
+
+
+def test_mark_clean_resets_dirty_fields():
+    record = _record()
+    record.sha256 = 'def'
+    record.mark_clean()
+
+    assert not record.is_dirty()
+
+
+def test_to_item_contains_only_persisted_fields():
+    assert set(_record().to_item()) == {
+        'uuid', 'relative_path', 'last_modified', 'upload_status', 'sha256',
+        'cache_control', 'content_type', 'size', 'mtime_ns', 'cache_control_transition',
+        'content_encoding', 'encoded_size', 'encoded_sha256'
+    }
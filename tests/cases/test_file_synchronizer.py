@@ -2,27 +2,746 @@
 Tests for the FileSynchronizer class in bloblog.sync.file_synchronizer.
 """
 
+import hashlib
+import io
+import os
+import time
 import pytest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError, EndpointConnectionError
 from bloblog.sync.file_synchronizer import FileSynchronizer
+from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.config.exclude_matcher import ExcludeMatcher
+from bloblog.sync.content_index import ContentIndex
+from bloblog.sync.journal import SyncJournal
+from bloblog.sync.plan_manifest import PlanWriter, read_plan
+from bloblog.storage.s3_client import MultipartUpload
+from bloblog.sync.task_queue import TaskQueue
+from tests.benchmarks.bench import build_config
+from tests.benchmarks.fakes import FakeMetadataClient, FakeS3Client
+from tests.benchmarks.synthetic_tree import generate_tree, list_files
 
 class TestFileSynchronizer:
     """
     Test suite for FileSynchronizer.
     """
-    def test_start_synchronization(self):
+    def test_start_synchronization(self, tmp_path):
         """
         Ensure start_synchronization initiates the workflow correctly.
         """
-        pass
+        sync_root = tmp_path / 'site'
+        generate_tree(str(sync_root), 30, sizes=[(1, 2048)], depth=2, fanout=3)
+        s3_client = FakeS3Client()
+        metadata_client = FakeMetadataClient()
+        synchronizer = FileSynchronizer(
+            metadata_client, s3_client, build_config(str(tmp_path), str(sync_root), 4), TaskQueue()
+        )
 
-    def test_walk_files(self):
+        synchronizer.start_synchronization()
+        assert s3_client.counters['uploads'] == 30
+        assert len(metadata_client.records) == 30
+
+        synchronizer.start_synchronization()
+        assert s3_client.counters['uploads'] == 30
+
+    def test_walk_files(self, tmp_path):
         """
         Ensure walk_files enumerates files properly.
         """
-        pass
+        sync_root = tmp_path / 'site'
+        generate_tree(str(sync_root), 10, sizes=[(1, 128)], depth=2, fanout=2)
+        task_queue = TaskQueue()
+        synchronizer = FileSynchronizer(
+            FakeMetadataClient(), FakeS3Client(), build_config(str(tmp_path), str(sync_root), 2), task_queue
+        )
+        synchronizer._snapshot = {}
+
+        synchronizer.walk_files()
 
-    def test_process_queues(self):
+        tasks = iter(task_queue.dequeue, None)
+        expected = {os.path.relpath(path, sync_root) for path in list_files(str(sync_root))}
+        assert {task.relative_path for task in tasks} == expected
+        assert task_queue.is_closed()
+
+    def test_process_queues(self, tmp_path):
         """
         Ensure process_queues handles queued tasks properly.
         """
-        pass
+        sync_root = tmp_path / 'site'
+        generate_tree(str(sync_root), 5, sizes=[(1, 128)], depth=0)
+        task_queue = TaskQueue()
+        s3_client = FakeS3Client()
+        metadata_client = FakeMetadataClient()
+        synchronizer = FileSynchronizer(
+            metadata_client, s3_client, build_config(str(tmp_path), str(sync_root), 2), task_queue
+        )
+        synchronizer._snapshot = {}
+        synchronizer.walk_files()
+
+        synchronizer.process_queues()
+        metadata_client.flush()
+
+        assert sorted(s3_client.objects) == sorted(os.listdir(sync_root))
+        assert {record['upload_status'] for record in metadata_client.records.values()} == {'uploaded'}
+
+
+@pytest.fixture
+def sync_root(tmp_path):
+    root = tmp_path / 'site'
+    root.mkdir()
+    (root / 'index.html').write_text('<html></html>')
+    return root
+
+
+def _synchronizer(sync_root, paranoid=False):
+    config_manager = MagicMock()
+    config_manager.get_sync_root_path.return_value = str(sync_root)
+    config_manager.get_exclude_matcher.return_value = ExcludeMatcher([])
+    config_manager.cache_control.side_effect = lambda file_metadata: file_metadata
+    return FileSynchronizer(
+        metadata_client=MagicMock(),
+        s3_client=MagicMock(),
+        config_manager=config_manager,
+        task_queue=MagicMock(),
+        paranoid=paranoid
+    )
+
+
+def _record(file_path, sha256='stored-sha'):
+    stat = os.stat(file_path)
+    return FileMetadata(
+        uuid='123',
+        relative_path='index.html',
+        last_modified='2023-10-10T10:00:00',
+        upload_status='uploaded',
+        sha256=sha256,
+        cache_control='max-age=3600,public',
+        content_type='text/html',
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns
+    )
+
+
+class TestStatFastPath:
+    """
+    Tests for skipping SHA-256 when size and mtime match the stored record.
+    """
+    def test_unchanged_stat_skips_hashing(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        synchronizer = _synchronizer(sync_root)
+        record = _record(file_path)
+
+        with patch.object(synchronizer, '_calculate_sha256') as mock_hash:
+            synchronizer._compare_and_enqueue(file_path, record, os.stat(file_path))
+
+        mock_hash.assert_not_called()
+        assert record.upload_status == 'uploaded'
+        synchronizer.task_queue.enqueue.assert_not_called()
+        synchronizer.metadata_client.update.assert_not_called()
+        synchronizer.metadata_client.add_batched.assert_not_called()
+
+    def test_paranoid_always_hashes(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        synchronizer = _synchronizer(sync_root, paranoid=True)
+        record = _record(file_path)
+
+        with patch.object(synchronizer, '_calculate_sha256', return_value='new-sha') as mock_hash:
+            synchronizer._compare_and_enqueue(file_path, record, os.stat(file_path))
+
+        mock_hash.assert_called_once_with(file_path, os.stat(file_path))
+        assert record.upload_status == 'upload_pending'
+        assert record.sha256 == 'new-sha'
+
+    def test_changed_mtime_rehashes_and_records_stat(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        synchronizer = _synchronizer(sync_root)
+        record = _record(file_path)
+        record.mtime_ns -= 1
+        record.mark_clean()
+
+        with patch.object(synchronizer, '_calculate_sha256', return_value='stored-sha') as mock_hash:
+            synchronizer._compare_and_enqueue(file_path, record, os.stat(file_path))
+
+        mock_hash.assert_called_once_with(file_path, os.stat(file_path))
+        assert record.upload_status == 'uploaded'
+        assert record.mtime_ns == os.stat(file_path).st_mtime_ns
+        synchronizer.task_queue.enqueue.assert_not_called()
+        synchronizer.metadata_client.update.assert_called_once_with(record)
+
+
+class TestHashCache:
+    """
+    Tests for reusing hashes from the local hash cache.
+    """
+    def test_cache_hit_does_not_read_file(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        stat = os.stat(file_path)
+        hash_cache = MagicMock()
+        hash_cache.get.return_value = 'cached-sha'
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.hash_cache = hash_cache
+
+        with patch('builtins.open') as mock_open:
+            assert synchronizer._calculate_sha256(file_path, stat) == 'cached-sha'
+
+        mock_open.assert_not_called()
+        hash_cache.get.assert_called_once_with(stat)
+
+    def test_cache_miss_stores_hash(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        stat = os.stat(file_path)
+        hash_cache = MagicMock()
+        hash_cache.get.return_value = None
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.hash_cache = hash_cache
+
+        digest = synchronizer._calculate_sha256(file_path, stat)
+
+        hash_cache.put.assert_called_once_with(stat, digest)
+
+
+class TestStreamingWalk:
+    """
+    Tests for the scandir-based walk and its bounded worker pipeline.
+    """
+    def test_iter_files_yields_nested_files(self, sync_root):
+        (sync_root / 'posts' / '2024').mkdir(parents=True)
+        (sync_root / 'posts' / '2024' / 'a.html').write_text('a')
+        (sync_root / 'posts' / 'b.css').write_text('b')
+        synchronizer = _synchronizer(sync_root)
+
+        relative_paths = sorted(
+            os.path.relpath(path, sync_root) for path in synchronizer._iter_files(str(sync_root))
+        )
+
+        assert relative_paths == ['index.html', os.path.join('posts', '2024', 'a.html'), os.path.join('posts', 'b.css')]
+
+    def test_iter_files_prunes_excluded_directories(self, sync_root):
+        (sync_root / 'node_modules' / 'pkg').mkdir(parents=True)
+        (sync_root / 'node_modules' / 'pkg' / 'index.js').write_text('x')
+        (sync_root / 'draft.tmp').write_text('x')
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.config_manager.get_exclude_matcher.return_value = ExcludeMatcher(['node_modules', '*.tmp'])
+
+        with patch('bloblog.sync.file_synchronizer.os.scandir', wraps=os.scandir) as mock_scandir:
+            files = list(synchronizer._iter_files(str(sync_root)))
+
+        assert [os.path.relpath(path, sync_root) for path in files] == ['index.html']
+        mock_scandir.assert_called_once_with(str(sync_root))
+
+    def test_walk_files_processes_every_file(self, sync_root):
+        for index in range(50):
+            (sync_root / f'{index}.txt').write_text(str(index))
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.config_manager.get_workers.return_value = 2
+        synchronizer._snapshot = {}
+
+        with patch('bloblog.sync.file_synchronizer.WALK_QUEUE_DEPTH', 1):
+            synchronizer.walk_files()
+
+        assert synchronizer.task_queue.enqueue.call_count == 51
+
+    def test_walk_files_raises_worker_errors(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.config_manager.get_workers.return_value = 2
+
+        with patch.object(synchronizer, '_process_file', side_effect=OSError('boom')):
+            with pytest.raises(OSError):
+                synchronizer.walk_files()
+
+        synchronizer.task_queue.enqueue.assert_not_called()
+
+
+class TestSinglePassUpload:
+    """
+    Tests for hashing new files during their upload instead of before it.
+    """
+    def test_new_file_is_not_hashed_before_upload(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer._snapshot = {}
+
+        with patch.object(synchronizer, '_calculate_sha256') as mock_hash:
+            synchronizer._process_file(str(sync_root / 'index.html'))
+
+        mock_hash.assert_not_called()
+        task = synchronizer.task_queue.enqueue.call_args.args[0]
+        assert task.upload_status == 'upload_pending'
+        assert task.sha256 == ''
+
+    def test_upload_records_streamed_hash(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.hash_cache = MagicMock()
+        synchronizer.s3_client.upload_file.return_value = 'streamed-sha'
+        record = _record(file_path, sha256='')
+
+        synchronizer._handle_upload(record)
+
+        assert record.sha256 == 'streamed-sha'
+        assert record.upload_status == 'uploaded'
+        synchronizer.hash_cache.put.assert_called_once_with(os.stat(file_path), 'streamed-sha')
+        synchronizer.metadata_client.add_batched.assert_called_once_with(record)
+
+    def test_failed_upload_leaves_record_unwritten(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.s3_client.upload_file.return_value = None
+        record = _record(str(sync_root / 'index.html'), sha256='')
+
+        synchronizer._handle_upload(record)
+
+        synchronizer.metadata_client.add_batched.assert_not_called()
+        assert synchronizer.metrics.summary()['counters']['tasks_failed_total'] == {'operation=upload': 1}
+
+
+class TestBatchedDeletes:
+    """
+    Tests for deleting removed files in batches after the uploads.
+    """
+    def test_missing_files_are_planned_not_enqueued(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        gone = _record(str(sync_root / 'index.html'))
+        gone.relative_path = 'gone.html'
+        synchronizer._snapshot = {'gone.html': gone}
+
+        synchronizer._plan_deletions()
+
+        assert synchronizer._planned_deletions == [gone]
+        synchronizer.task_queue.enqueue.assert_not_called()
+
+    def test_only_confirmed_deletes_remove_metadata(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        records = [_record(str(sync_root / 'index.html')) for _ in range(3)]
+        synchronizer.s3_client.delete_files.return_value = records[:2]
+
+        synchronizer._delete_pending_files(records)
+
+        synchronizer.s3_client.delete_files.assert_called_once_with(records)
+        assert synchronizer.metadata_client.delete_batched.call_count == 2
+
+
+class TestDedup:
+    """
+    Tests for copying files whose content is already in the bucket.
+    """
+    def test_duplicate_is_copied_instead_of_uploaded(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        synchronizer = _synchronizer(sync_root)
+        existing = _record(file_path, sha256=hashlib.sha256(b'<html></html>').hexdigest())
+        existing.relative_path = 'old/index.html'
+        synchronizer.content_index = ContentIndex([existing])
+        synchronizer.s3_client.copy_file.return_value = True
+        record = _record(file_path, sha256='')
+        record.upload_status = 'upload_pending'
+
+        synchronizer._handle_upload(record)
+
+        synchronizer.s3_client.copy_file.assert_called_once_with('old/index.html', record)
+        synchronizer.s3_client.upload_file.assert_not_called()
+        assert record.sha256 == existing.sha256
+        synchronizer.metadata_client.add_batched.assert_called_once_with(record)
+
+    def test_unknown_size_is_uploaded_without_hashing_first(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.content_index = ContentIndex()
+        synchronizer.s3_client.upload_file.return_value = 'streamed-sha'
+        record = _record(str(sync_root / 'index.html'), sha256='')
+
+        with patch.object(synchronizer, '_calculate_sha256') as mock_hash:
+            synchronizer._handle_upload(record)
+
+        mock_hash.assert_not_called()
+        synchronizer.s3_client.copy_file.assert_not_called()
+        assert synchronizer.content_index.find('streamed-sha') == 'index.html'
+
+    def test_failed_copy_falls_back_to_upload(self, sync_root):
+        file_path = str(sync_root / 'index.html')
+        synchronizer = _synchronizer(sync_root)
+        existing = _record(file_path, sha256='same-sha')
+        existing.relative_path = 'old/index.html'
+        synchronizer.content_index = ContentIndex([existing])
+        synchronizer.s3_client.copy_file.return_value = False
+        synchronizer.s3_client.upload_file.return_value = 'same-sha'
+
+        synchronizer._handle_upload(_record(file_path, sha256='same-sha'))
+
+        synchronizer.s3_client.upload_file.assert_called_once()
+
+
+class TestWatchMode:
+    """
+    Tests for incremental synchronization of changed paths.
+    """
+    def test_walk_paths_processes_files_and_walks_directories(self, sync_root):
+        (sync_root / 'blog').mkdir()
+        (sync_root / 'blog' / 'post.html').write_text('<p></p>')
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.config_manager.get_workers.return_value = 2
+
+        with patch.object(synchronizer, '_process_file') as mock_process:
+            synchronizer.walk_paths(['index.html', 'blog', os.path.join('blog', 'post.html')])
+
+        processed = sorted(call.args[0] for call in mock_process.call_args_list)
+        assert processed == [str(sync_root / 'blog' / 'post.html'), str(sync_root / 'index.html')]
+        synchronizer.task_queue.close.assert_called_once()
+
+    def test_walk_paths_plans_deletes_below_missing_paths(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.config_manager.get_workers.return_value = 1
+        records = {}
+        for relative_path in ('index.html', 'gone/a.html', 'gone/b/c.html', 'gone.html'):
+            record = _record(str(sync_root / 'index.html'))
+            record.relative_path = relative_path
+            records[relative_path] = record
+        synchronizer._snapshot = records
+
+        synchronizer.walk_paths(['gone'])
+
+        planned = sorted(record.relative_path for record in synchronizer._planned_deletions)
+        assert planned == ['gone/a.html', 'gone/b/c.html']
+
+    def test_uploads_and_deletes_keep_snapshot_current(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer._snapshot = {}
+        synchronizer.s3_client.upload_file.return_value = 'sha'
+        record = _record(str(sync_root / 'index.html'), sha256='')
+
+        synchronizer._handle_upload(record)
+        assert synchronizer._snapshot == {'index.html': record}
+
+        synchronizer.s3_client.delete_files.return_value = [record]
+        synchronizer._delete_pending_files([record])
+        assert synchronizer._snapshot == {}
+
+    def test_watch_rescans_after_lost_events(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        watcher = MagicMock()
+        results = iter([{'index.html'}, None, set()])
+
+        def wait_for_changes(timeout=None):
+            result = next(results, set())
+            if not result and result is not None:
+                synchronizer.stop()
+            return result
+
+        watcher.wait_for_changes.side_effect = wait_for_changes
+        with patch.object(synchronizer, 'start_synchronization') as mock_full, \
+                patch.object(synchronizer, 'synchronize_paths') as mock_paths:
+            synchronizer.watch(watcher)
+
+        assert watcher.start.call_count == 2
+        assert mock_full.call_count == 2
+        mock_paths.assert_called_once_with({'index.html'})
+        watcher.close.assert_called_once()
+
+
+class TestCacheControlTransitions:
+    """
+    Tests for re-evaluating Cache-Control headers only when they are due.
+    """
+    def test_unchanged_file_before_transition_skips_cache_control(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        file_path = str(sync_root / 'index.html')
+        record = _record(file_path)
+        record.cache_control_transition = int(time.time()) + 3600
+        record.mark_clean()
+
+        synchronizer._compare_and_enqueue(file_path, record, os.stat(file_path))
+
+        synchronizer.config_manager.cache_control.assert_not_called()
+        synchronizer.task_queue.enqueue.assert_not_called()
+
+    def test_due_transition_enqueues_header_update(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        file_path = str(sync_root / 'index.html')
+        record = _record(file_path)
+        record.cache_control_transition = int(time.time()) - 1
+
+        def cache_control(file_metadata):
+            file_metadata.cache_control = 'max-age=86400,public'
+            return file_metadata
+
+        synchronizer.config_manager.cache_control.side_effect = cache_control
+        synchronizer._compare_and_enqueue(file_path, record, os.stat(file_path))
+
+        task = synchronizer.task_queue.enqueue.call_args.args[0]
+        assert task.upload_status == 'update_pending'
+        assert task.cache_control == 'max-age=86400,public'
+
+    def test_refresh_headers_only_fetches_due_records(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.task_queue = TaskQueue()
+        synchronizer.config_manager.get_workers.return_value = 1
+        record = _record(str(sync_root / 'index.html'))
+        synchronizer.metadata_client.fetch_due_transitions.return_value = [record]
+        synchronizer.config_manager.cache_control.side_effect = lambda file_metadata: setattr(
+            file_metadata, 'cache_control', 'max-age=86400,public') or file_metadata
+
+        synchronizer.refresh_headers()
+
+        synchronizer.metadata_client.fetch_all_records.assert_not_called()
+        synchronizer.s3_client.update_file_metadata.assert_called_once_with(record)
+        synchronizer.metadata_client.add_batched.assert_called_once_with(record)
+
+
+class TestMetrics:
+    """
+    Tests for the phase timings and counters of a run.
+    """
+    def test_run_records_phases_counters_and_queue_depth(self, tmp_path):
+        sync_root = tmp_path / 'site'
+        sync_root.mkdir()
+        generate_tree(str(sync_root), 20, [(1, 1024)], depth=2, fanout=2, seed=0)
+        synchronizer = FileSynchronizer(
+            metadata_client=FakeMetadataClient(),
+            s3_client=FakeS3Client(),
+            config_manager=build_config(str(tmp_path), str(sync_root), workers=2),
+            task_queue=TaskQueue(maxsize=8)
+        )
+
+        synchronizer.start_synchronization()
+        synchronizer.start_synchronization()
+
+        summary = synchronizer.metrics.summary()
+        assert {'snapshot', 'walk', 'upload', 'metadata_write'} <= set(summary['phases'])
+        assert summary['phases']['walk']['count'] == 2
+        assert summary['counters']['files_scanned_total'] == {'': 40}
+        assert summary['counters']['files_unchanged_total'] == {'': 20}
+        assert summary['counters']['tasks_total'] == {'operation=upload': 20}
+        assert summary['histograms']['task_queue_depth']['']['count'] == 20
+
+
+class TestTaskRetries:
+    """
+    Tests for tasks that fail once the rate control of the clients gave up.
+    """
+    def _run(self, tmp_path, error, failures):
+        sync_root = tmp_path / 'site'
+        generate_tree(str(sync_root), 6, [(1, 128)], depth=0)
+        s3_client = FakeS3Client()
+        upload_file = s3_client.upload_file
+        attempts = {}
+
+        def flaky_upload(metadata, *args, **kwargs):
+            attempts[metadata.relative_path] = attempts.get(metadata.relative_path, 0) + 1
+            if metadata.relative_path == sorted(os.listdir(sync_root))[0] and attempts[metadata.relative_path] <= failures:
+                raise ClientError({'Error': {'Code': error}}, 'PutObject')
+            return upload_file(metadata, *args, **kwargs)
+
+        s3_client.upload_file = flaky_upload
+        synchronizer = FileSynchronizer(
+            metadata_client=FakeMetadataClient(),
+            s3_client=s3_client,
+            config_manager=build_config(str(tmp_path), str(sync_root), workers=2),
+            task_queue=TaskQueue(maxsize=2),
+            task_attempts=3
+        )
+        return synchronizer, s3_client, attempts
+
+    def test_throttled_task_is_requeued(self, tmp_path):
+        synchronizer, s3_client, attempts = self._run(tmp_path, 'SlowDown', failures=2)
+
+        synchronizer.start_synchronization()
+
+        assert len(s3_client.objects) == 6
+        assert sorted(attempts.values()) == [1, 1, 1, 1, 1, 3]
+        assert synchronizer.metrics.summary()['counters']['tasks_retried_total'] == {'operation=upload': 2}
+
+    def test_task_fails_the_run_after_its_attempts(self, tmp_path):
+        synchronizer, s3_client, attempts = self._run(tmp_path, 'AccessDenied', failures=1)
+
+        with pytest.raises(ClientError):
+            synchronizer.start_synchronization()
+
+        assert len(s3_client.objects) == 5
+        assert sorted(attempts.values()) == [1, 1, 1, 1, 1, 1]
+        assert synchronizer.metrics.summary()['counters']['tasks_failed_total'] == {'operation=upload': 1}
+
+
+def _interrupted_journal(tmp_path, record):
+    journal = SyncJournal(str(tmp_path / 'journal'))
+    journal.record_multipart(record, MultipartUpload('upload-1', 300))
+    journal.close()
+
+
+class TestJournal:
+    """
+    Tests for resuming a run that was interrupted before its metadata was flushed.
+    """
+    def test_restart_writes_completed_records_instead_of_uploading_again(self, tmp_path):
+        sync_root = tmp_path / 'site'
+        sync_root.mkdir()
+        generate_tree(str(sync_root), 20, [(1, 1024)], depth=2, fanout=2, seed=0)
+        config_manager = build_config(str(tmp_path), str(sync_root), workers=2)
+        s3_client = FakeS3Client()
+        journal = SyncJournal(str(tmp_path / 'journal'))
+        crashed = FileSynchronizer(
+            metadata_client=FakeMetadataClient(),
+            s3_client=s3_client,
+            config_manager=config_manager,
+            task_queue=TaskQueue(maxsize=8),
+            journal=journal
+        )
+        # The run dies after its uploads but before its metadata reaches the table.
+        with patch.object(journal, 'finish'):
+            crashed.start_synchronization()
+        journal.close()
+
+        metadata_client = FakeMetadataClient()
+        journal = SyncJournal(str(tmp_path / 'journal'))
+        FileSynchronizer(
+            metadata_client=metadata_client,
+            s3_client=s3_client,
+            config_manager=config_manager,
+            task_queue=TaskQueue(maxsize=8),
+            journal=journal
+        ).start_synchronization()
+        journal.close()
+
+        assert s3_client.counters['uploads'] == 20
+        assert len(metadata_client.records) == 20
+        assert SyncJournal(str(tmp_path / 'journal')).recovered is None
+
+    def test_open_multipart_upload_is_resumed_for_unchanged_file(self, sync_root, tmp_path):
+        file_path = sync_root / 'index.html'
+        record = _record(str(file_path))
+        _interrupted_journal(tmp_path, record)
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.journal = journal = SyncJournal(str(tmp_path / 'journal'))
+
+        def complete(metadata, sync_root, resume, on_multipart_start, on_multipart_closed):
+            on_multipart_closed(resume)
+            return 'sha'
+
+        synchronizer.s3_client.upload_file.side_effect = complete
+        synchronizer._recover()
+
+        synchronizer._handle_upload(_record(str(file_path), sha256=''))
+        synchronizer._abort_orphaned_uploads()
+
+        assert synchronizer.s3_client.upload_file.call_args.kwargs['resume'] == MultipartUpload('upload-1', 300)
+        synchronizer.s3_client.abort_multipart_upload.assert_not_called()
+        journal.close()
+        assert not SyncJournal(str(tmp_path / 'journal')).recovered.multipart
+
+    def test_open_multipart_upload_of_changed_file_is_aborted(self, sync_root, tmp_path):
+        record = _record(str(sync_root / 'index.html'))
+        _interrupted_journal(tmp_path, record)
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.journal = journal = SyncJournal(str(tmp_path / 'journal'))
+        synchronizer.s3_client.upload_file.return_value = 'sha'
+        synchronizer._recover()
+        changed = _record(str(sync_root / 'index.html'), sha256='')
+        changed.size += 1
+
+        synchronizer._handle_upload(changed)
+
+        assert synchronizer.s3_client.upload_file.call_args.kwargs['resume'] is None
+        synchronizer.s3_client.abort_multipart_upload.assert_called_once_with('index.html', 'upload-1')
+        journal.close()
+        assert not SyncJournal(str(tmp_path / 'journal')).recovered.multipart
+
+    def test_upload_left_open_by_a_failed_abort_is_resumed_by_the_retry(self, sync_root, tmp_path):
+        synchronizer = _synchronizer(sync_root)
+        synchronizer.journal = journal = SyncJournal(str(tmp_path / 'journal'))
+        record = _record(str(sync_root / 'index.html'), sha256='')
+
+        def fail(metadata, sync_root, resume, on_multipart_start, on_multipart_closed):
+            on_multipart_start(MultipartUpload('upload-1', 300))
+            raise EndpointConnectionError(endpoint_url='https://s3.amazonaws.com')
+
+        def complete(metadata, sync_root, resume, on_multipart_start, on_multipart_closed):
+            on_multipart_closed(resume)
+            return 'sha'
+
+        synchronizer.s3_client.upload_file.side_effect = fail
+        with pytest.raises(EndpointConnectionError):
+            synchronizer._handle_upload(record)
+        synchronizer.s3_client.upload_file.side_effect = complete
+        synchronizer._handle_upload(record)
+        journal.close()
+
+        assert synchronizer.s3_client.upload_file.call_args.kwargs['resume'] == MultipartUpload('upload-1', 300)
+        assert not SyncJournal(str(tmp_path / 'journal')).recovered.multipart
+
+
+class TestPlanAndApply:
+    """
+    Tests for writing the tasks of a run to a manifest and applying it in shards.
+    """
+    def test_plan_writes_nothing_and_shards_apply_every_task(self, tmp_path):
+        sync_root = tmp_path / 'site'
+        sync_root.mkdir()
+        generate_tree(str(sync_root), 30, [(1, 1024)], depth=2, fanout=2, seed=0)
+        config_manager = build_config(str(tmp_path), str(sync_root), workers=2)
+        s3_client = FakeS3Client()
+        metadata_client = FakeMetadataClient()
+
+        def synchronizer():
+            return FileSynchronizer(
+                metadata_client=metadata_client,
+                s3_client=s3_client,
+                config_manager=config_manager,
+                task_queue=TaskQueue(maxsize=8)
+            )
+
+        synchronizer().start_synchronization()
+        paths = list_files(str(sync_root))
+        os.remove(paths[0])
+        with open(paths[1], 'a') as f:
+            f.write('changed')
+        (sync_root / 'new.html').write_text('<html>new</html>')
+        before = dict(s3_client.counters)
+        manifest = io.StringIO()
+        writer = PlanWriter(manifest)
+
+        synchronizer().plan(writer)
+
+        assert s3_client.counters == before
+        assert writer.totals['upload']['files'] == 2
+        assert writer.totals['delete']['files'] == 1
+
+        for shard in range(2):
+            synchronizer().apply(read_plan(io.StringIO(manifest.getvalue()), shard, 2))
+
+        assert s3_client.counters['uploads'] == before['uploads'] + 2
+        assert s3_client.counters['deletes'] == before['deletes'] + 1
+        assert set(record['relative_path'] for record in metadata_client.records.values()) == {
+            os.path.relpath(path, str(sync_root)) for path in list_files(str(sync_root))
+        }
+
+    def test_apply_never_copies_from_a_key_it_overwrites(self, tmp_path):
+        sync_root = tmp_path / 'site'
+        sync_root.mkdir()
+        (sync_root / 'a.bin').write_bytes(b'x' * 100)
+        config_manager = build_config(str(tmp_path), str(sync_root), workers=1)
+        s3_client = FakeS3Client()
+        metadata_client = FakeMetadataClient()
+
+        def synchronizer():
+            return FileSynchronizer(
+                metadata_client=metadata_client,
+                s3_client=s3_client,
+                config_manager=config_manager,
+                task_queue=TaskQueue(maxsize=8)
+            )
+
+        synchronizer().start_synchronization()
+        (sync_root / 'a.bin').write_bytes(b'y' * 100)
+        (sync_root / 'b.bin').write_bytes(b'x' * 100)
+        manifest = io.StringIO()
+        synchronizer().plan(PlanWriter(manifest))
+
+        synchronizer().apply(read_plan(io.StringIO(manifest.getvalue())))
+
+        assert s3_client.objects['a.bin']['sha256'] == hashlib.sha256(b'y' * 100).hexdigest()
+        assert s3_client.objects['b.bin']['sha256'] == hashlib.sha256(b'x' * 100).hexdigest()
+
+    def test_apply_skips_files_removed_since_the_plan(self, sync_root):
+        synchronizer = _synchronizer(sync_root)
+        record = _record(str(sync_root / 'index.html'), sha256='')
+        record.upload_status = 'upload_pending'
+        os.remove(sync_root / 'index.html')
+
+        synchronizer._enqueue_plan([record])
+
+        synchronizer.task_queue.enqueue.assert_not_called()
@@ -0,0 +1,81 @@
+import os
+from bloblog.metrics.metrics import Metrics
+from bloblog.sync.hash_cache import HashCache
+
+
+def _touch(path, content):
+    path.write_text(content)
+    return os.stat(path)
+
+
+def test_miss_then_hit(tmp_path):
+    cache = HashCache(str(tmp_path / 'hashes.sqlite'))
+    stat = _touch(tmp_path / 'a.txt', 'a')
+
+    assert cache.get(stat) is None
+    cache.put(stat, 'sha-a')
+
+    assert cache.get(stat) == 'sha-a'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+    cache.close()
+
+
+def test_hits_and_misses_are_recorded_in_metrics(tmp_path):
+    metrics = Metrics()
+    cache = HashCache(str(tmp_path / 'hashes.sqlite'), metrics=metrics)
+    stat = _touch(tmp_path / 'a.txt', 'a')
+
+    cache.get(stat)
+    cache.put(stat, 'sha-a')
+    cache.get(stat)
+    cache.get(stat)
+
+    counters = metrics.summary()['counters']
+    assert counters['hash_cache_misses_total'] == {'': 1}
+    assert counters['hash_cache_hits_total'] == {'': 2}
+    cache.close()
+
+
+def test_changed_mtime_is_a_miss(tmp_path):
+    cache = HashCache(str(tmp_path / 'hashes.sqlite'))
+    path = tmp_path / 'a.txt'
+    stat = _touch(path, 'a')
+    cache.put(stat, 'sha-a')
+
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    assert cache.get(os.stat(path)) is None
+    cache.close()
+
+
+def test_entries_persist_across_instances(tmp_path):
+    db_path = str(tmp_path / 'hashes.sqlite')
+    stat = _touch(tmp_path / 'a.txt', 'a')
+    cache = HashCache(db_path)
+    cache.put(stat, 'sha-a')
+    cache.close()
+
+    reopened = HashCache(db_path)
+
+    assert reopened.get(stat) == 'sha-a'
+    reopened.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = HashCache(str(tmp_path / 'hashes.sqlite'), max_entries=10)
+    stats = [_touch(tmp_path / f'{index}.txt', str(index)) for index in range(11)]
+    for index, stat in enumerate(stats[:10]):
+        cache.put(stat, f'sha-{index}')
+    cache.get(stats[0])
+
+    cache.put(stats[10], 'sha-10')
+
+    assert cache.stats()['entries'] == 9
+    assert cache.get(stats[0]) == 'sha-0'
+    assert cache.get(stats[1]) is None
+    assert cache.get(stats[10]) == 'sha-10'
+    cache.close()
+
+
+def test_default_path_is_next_to_sync_root(tmp_path):
+    assert HashCache.default_path(str(tmp_path / 'site')) == str(tmp_path / '.site.bloblog-hashes.sqlite')
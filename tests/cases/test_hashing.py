@@ -0,0 +1,68 @@
+import hashlib
+import pytest
+from bloblog.sync.hashing import HashEngine, hash_path
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(bytes(range(256)) * 5000)
+    return path
+
+
+@pytest.mark.parametrize('use_mmap', [True, False])
+def test_hash_path_matches_hashlib(data_file, use_mmap):
+    expected = hashlib.sha256(data_file.read_bytes()).hexdigest()
+
+    assert hash_path(str(data_file), chunk_size=4096, use_mmap=use_mmap) == expected
+
+
+def test_hash_path_empty_file(tmp_path):
+    path = tmp_path / 'empty'
+    path.write_bytes(b'')
+
+    assert hash_path(str(path)) == hashlib.sha256(b'').hexdigest()
+
+
+def test_small_files_hash_on_thread(data_file):
+    engine = HashEngine(process_threshold=10 ** 9, processes=2)
+
+    engine.hash_file(str(data_file), data_file.stat().st_size)
+
+    stats = engine.stats()
+    assert stats['thread']['files'] == 1
+    assert stats['thread']['bytes'] == data_file.stat().st_size
+    assert stats['process']['files'] == 0
+    engine.close()
+
+
+def test_large_files_hash_in_process_pool(data_file):
+    engine = HashEngine(process_threshold=1024, processes=1)
+    expected = hashlib.sha256(data_file.read_bytes()).hexdigest()
+
+    assert engine.hash_file(str(data_file), data_file.stat().st_size) == expected
+
+    stats = engine.stats()
+    assert stats['process']['files'] == 1
+    assert stats['process']['bytes_per_second'] > 0
+    engine.close()
+
+
+def test_throughput_of_each_path_is_recorded_in_metrics(tmp_path):
+    small = tmp_path / 'small.bin'
+    small.write_bytes(b'a' * 100)
+    large = tmp_path / 'large.bin'
+    large.write_bytes(b'b' * 4096)
+    engine = HashEngine(process_threshold=1024, processes=1)
+
+    engine.hash_file(str(small), 100)
+    engine.hash_file(str(large), 4096)
+    engine.close()
+
+    counters = engine.metrics.summary()['counters']
+    assert counters['hash_bytes_total'] == {'path=thread': 100, 'path=process': 4096}
+    assert set(counters['hash_seconds_total']) == {'path=thread', 'path=process'}
+
+
+def test_process_pool_does_not_fork():
+    assert HashEngine._mp_context().get_start_method() in ('forkserver', 'spawn')
@@ -0,0 +1,41 @@
+import hashlib
+import pytest
+from bloblog.storage.hashing_reader import HashingReader
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(b'0123456789' * 100)
+    return path
+
+
+def test_sequential_read_hashes_whole_file(data_file):
+    with open(data_file, 'rb') as f:
+        reader = HashingReader(f)
+        while reader.read(64):
+            pass
+
+        assert reader.hexdigest() == hashlib.sha256(data_file.read_bytes()).hexdigest()
+
+
+def test_rereads_after_seek_are_not_hashed_twice(data_file):
+    with open(data_file, 'rb') as f:
+        reader = HashingReader(f)
+        reader.read(300)
+        reader.seek(100)
+        reader.read(500)
+        reader.seek(0)
+        reader.read()
+
+        assert reader.hexdigest() == hashlib.sha256(data_file.read_bytes()).hexdigest()
+
+
+def test_partial_read_has_no_digest(data_file):
+    with open(data_file, 'rb') as f:
+        reader = HashingReader(f)
+        reader.read(10)
+
+        assert not reader.complete
+        with pytest.raises(ValueError):
+            reader.hexdigest()
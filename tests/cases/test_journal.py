@@ -0,0 +1,75 @@
+"""
+Tests for the SyncJournal class in bloblog.sync.journal.
+"""
+
+import pytest
+from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.storage.s3_client import MultipartUpload
+from bloblog.sync.journal import SyncJournal
+
+
+def _record(relative_path, status='upload_pending'):
+    return FileMetadata('uuid-' + relative_path, relative_path, '', status, 'sha', '', 'text/html', size=10, mtime_ns=5)
+
+
+def test_fresh_journal_has_nothing_to_recover(tmp_path):
+    journal = SyncJournal(str(tmp_path / 'journal'))
+
+    assert journal.recovered is None
+    journal.close()
+
+
+def test_reopened_journal_recovers_unfinished_run(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = SyncJournal(path)
+    for name in ('a.html', 'b.html', 'c.html'):
+        journal.record_planned(_record(name))
+    journal.record_completed(_record('a.html', 'uploaded'))
+    journal.record_deleted(_record('old.html', 'delete_pending'))
+    journal.record_multipart(_record('b.html'), MultipartUpload('upload-b', 300))
+    journal.close()
+
+    state = SyncJournal(path).recovered
+
+    assert state.completed['a.html']['upload_status'] == 'uploaded'
+    assert set(state.deleted) == {'old.html'}
+    assert state.planned == {'b.html': 'upload_pending', 'c.html': 'upload_pending'}
+    assert state.multipart == {'b.html': {'upload_id': 'upload-b', 'part_size': 300, 'size': 10, 'mtime_ns': 5}}
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'journal'
+    journal = SyncJournal(str(path))
+    journal.record_completed(_record('a.html', 'uploaded'))
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"event": "completed", "path": "b.ht')
+
+    state = SyncJournal(str(path)).recovered
+
+    assert set(state.completed) == {'a.html'}
+
+
+def test_finish_keeps_only_open_multipart_uploads(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = SyncJournal(path)
+    journal.record_completed(_record('a.html', 'uploaded'))
+    journal.record_multipart(_record('b.html'), MultipartUpload('upload-b', 300))
+    journal.record_multipart(_record('c.html'), MultipartUpload('upload-c', 300))
+    journal.record_multipart_closed('c.html')
+    journal.finish()
+    journal.close()
+
+    state = SyncJournal(path).recovered
+
+    assert not state.completed
+    assert set(state.multipart) == {'b.html'}
+
+
+def test_journal_is_held_by_one_process(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = SyncJournal(path)
+
+    with pytest.raises(RuntimeError):
+        SyncJournal(path)
+    journal.close()
@@ -0,0 +1,59 @@
+"""
+Tests for configure_logging in bloblog.config.logging_config.
+"""
+
+import json
+import logging
+import sys
+import pytest
+from bloblog.config.logging_config import JsonFormatter, configure_logging
+
+
+@pytest.fixture
+def restore_root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_json_file_output(tmp_path, restore_root_logger):
+    log_file = tmp_path / 'bloblog.log'
+    configure_logging({'level': 'warning', 'format': 'json', 'output': 'file', 'file_path': str(log_file)})
+
+    logging.getLogger('bloblog.test').info("not logged")
+    logging.getLogger('bloblog.test').warning("Upload of %s failed", 'a.html')
+    for handler in restore_root_logger.handlers:
+        handler.flush()
+
+    entries = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert entries == [{
+        'time': entries[0]['time'],
+        'level': 'WARNING',
+        'logger': 'bloblog.test',
+        'message': 'Upload of a.html failed'
+    }]
+
+
+def test_file_output_requires_path(restore_root_logger):
+    with pytest.raises(ValueError):
+        configure_logging({'level': 'INFO', 'format': 'text', 'output': 'file', 'file_path': None})
+
+
+def test_stdout_text_output_replaces_handlers(restore_root_logger):
+    configure_logging({'level': 'INFO', 'format': 'text', 'output': 'stdout', 'file_path': None})
+
+    assert len(restore_root_logger.handlers) == 1
+    assert not isinstance(restore_root_logger.handlers[0].formatter, JsonFormatter)
+    assert restore_root_logger.level == logging.INFO
+
+
+def test_stderr_output(restore_root_logger):
+    configure_logging({'level': 'INFO', 'format': 'text', 'output': 'stderr', 'file_path': None})
+
+    assert restore_root_logger.handlers[0].stream is sys.stderr
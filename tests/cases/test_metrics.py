@@ -0,0 +1,110 @@
+"""
+Tests for the Metrics registry in bloblog.metrics.metrics.
+"""
+
+import json
+import os
+import stat
+import pytest
+from bloblog.metrics.metrics import DEPTH_BUCKETS, Metrics
+
+
+def test_counters_and_gauges_are_keyed_by_labels():
+    metrics = Metrics()
+    metrics.increment('s3_requests_total', operation='put_object', outcome='ok')
+    metrics.increment('s3_requests_total', 2, outcome='ok', operation='put_object')
+    metrics.increment('s3_requests_total', operation='copy_object', outcome='ok')
+    metrics.set_gauge('last_run_success', 1)
+
+    summary = metrics.summary()
+
+    assert summary['counters']['s3_requests_total'] == {
+        'operation=copy_object,outcome=ok': 1,
+        'operation=put_object,outcome=ok': 3
+    }
+    assert summary['gauges']['last_run_success'] == {'': 1}
+
+
+def test_phases_are_summarized_from_the_phase_histogram():
+    metrics = Metrics()
+    for _ in range(3):
+        with metrics.phase('hash'):
+            pass
+
+    phases = metrics.summary()['phases']
+
+    assert phases['hash']['count'] == 3
+    assert phases['hash']['seconds'] >= 0
+
+
+def test_request_counts_errors_and_reraises():
+    metrics = Metrics()
+    with pytest.raises(RuntimeError):
+        with metrics.request('dynamodb', 'query'):
+            raise RuntimeError("throttled")
+
+    summary = metrics.summary()
+
+    assert summary['counters']['dynamodb_requests_total'] == {'operation=query,outcome=error': 1}
+    assert summary['histograms']['dynamodb_request_seconds']['operation=query']['count'] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for depth in (0, 3, 3, 5000):
+        metrics.observe('task_queue_depth', depth, buckets=DEPTH_BUCKETS)
+
+    histogram = metrics.summary()['histograms']['task_queue_depth']['']
+
+    assert histogram['count'] == 4
+    assert histogram['max'] == 5000
+    assert histogram['buckets']['0'] == 1
+    assert histogram['buckets']['2'] == 1
+    assert histogram['buckets']['5'] == 3
+    assert histogram['buckets']['+Inf'] == 4
+
+
+def test_prometheus_textfile(tmp_path):
+    metrics = Metrics()
+    metrics.increment('s3_bytes_uploaded_total', 1024)
+    metrics.set_gauge('last_run_success', 1, command='sync')
+    metrics.observe('s3_request_seconds', 0.02, operation='put_object')
+    path = tmp_path / 'bloblog.prom'
+
+    metrics.write_prometheus(str(path))
+
+    lines = path.read_text().splitlines()
+    assert '# TYPE bloblog_s3_bytes_uploaded_total counter' in lines
+    assert 'bloblog_s3_bytes_uploaded_total 1024' in lines
+    assert 'bloblog_last_run_success{command="sync"} 1' in lines
+    assert 'bloblog_s3_request_seconds_bucket{operation="put_object",le="0.01"} 0' in lines
+    assert 'bloblog_s3_request_seconds_bucket{operation="put_object",le="0.025"} 1' in lines
+    assert 'bloblog_s3_request_seconds_count{operation="put_object"} 1' in lines
+    assert [entry.name for entry in tmp_path.iterdir()] == ['bloblog.prom']
+
+
+def test_exported_files_are_readable_by_other_users(tmp_path):
+    metrics = Metrics()
+    umask = os.umask(0o022)
+    try:
+        metrics.write_prometheus(str(tmp_path / 'bloblog.prom'))
+        metrics.write_json(str(tmp_path / 'bloblog.json'))
+    finally:
+        os.umask(umask)
+
+    assert stat.S_IMODE(os.stat(tmp_path / 'bloblog.prom').st_mode) == 0o644
+    assert stat.S_IMODE(os.stat(tmp_path / 'bloblog.json').st_mode) == 0o644
+
+
+def test_json_summary(tmp_path):
+    metrics = Metrics()
+    metrics.increment('files_scanned_total', 10)
+    path = tmp_path / 'run.json'
+
+    metrics.write_json(str(path), command='sync', status='ok')
+
+    summary = json.loads(path.read_text())
+    assert summary['command'] == 'sync'
+    assert summary['status'] == 'ok'
+    assert summary['counters']['files_scanned_total'] == {'': 10}
+    assert summary['duration_seconds'] >= 0
@@ -0,0 +1,59 @@
+"""
+Tests for the plan manifest in bloblog.sync.plan_manifest.
+"""
+
+import io
+import pytest
+from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.sync.plan_manifest import PlanWriter, parse_shard, read_plan, shard_of
+
+
+def _record(relative_path, status, size=10):
+    return FileMetadata('uuid-' + relative_path, relative_path, '', status, '', 'no-cache', 'text/html', size=size)
+
+
+def test_parse_shard():
+    assert parse_shard('0/1') == (0, 1)
+    assert parse_shard('3/4') == (3, 4)
+    for value in ('4/4', '-1/4', '1/0', '1', 'a/b'):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shards_partition_the_manifest():
+    records = [_record(f'dir/file-{index}.html', 'upload_pending') for index in range(200)]
+    manifest = io.StringIO()
+    writer = PlanWriter(manifest)
+    for record in records:
+        writer.add(record)
+
+    shards = [list(read_plan(io.StringIO(manifest.getvalue()), index, 3)) for index in range(3)]
+
+    paths = [record.relative_path for shard in shards for record in shard]
+    assert sorted(paths) == sorted(record.relative_path for record in records)
+    assert all(shard for shard in shards)
+    assert all(shard_of(record.relative_path, 3) == 1 for record in shards[1])
+
+
+def test_round_trip_keeps_records_and_totals():
+    manifest = io.StringIO()
+    writer = PlanWriter(manifest)
+    writer.add(_record('a.html', 'upload_pending', size=100))
+    writer.add(_record('b.html', 'update_pending', size=7))
+    writer.add(_record('c.html', 'delete_pending', size=3))
+
+    records = list(read_plan(io.StringIO(manifest.getvalue())))
+
+    assert [(record.relative_path, record.upload_status) for record in records] == [
+        ('a.html', 'upload_pending'), ('b.html', 'update_pending'), ('c.html', 'delete_pending')
+    ]
+    assert records[0].to_item() == _record('a.html', 'upload_pending', size=100).to_item()
+    assert writer.totals['upload'] == {'files': 1, 'bytes': 100}
+    assert writer.totals['delete'] == {'files': 1, 'bytes': 3}
+
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        list(read_plan(io.StringIO('{"op": "upload"}\n')))
+    with pytest.raises(ValueError):
+        list(read_plan(io.StringIO('')))
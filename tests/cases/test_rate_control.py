@@ -0,0 +1,113 @@
+import pytest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError, EndpointConnectionError
+from bloblog.aws.rate_control import AdaptiveTokenBucket, RateControl, is_retryable, is_throttling
+
+
+def _error(code, status=400):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'PutObject')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_error_classification():
+    assert is_throttling(_error('SlowDown', 503))
+    assert is_throttling(_error('ProvisionedThroughputExceededException'))
+    assert is_retryable(_error('InternalError', 500))
+    assert is_retryable(_error('Unknown', 503))
+    assert is_retryable(EndpointConnectionError(endpoint_url='https://s3.amazonaws.com'))
+    assert not is_retryable(_error('AccessDenied', 403))
+    assert not is_retryable(ValueError())
+
+
+def test_bucket_cuts_rate_once_per_cooldown_and_climbs_back():
+    clock = FakeClock()
+    bucket = AdaptiveTokenBucket(max_rate=100, min_rate=10, increase=20, clock=clock, sleep=clock.sleep)
+
+    assert bucket.on_throttle()
+    assert not bucket.on_throttle()
+    assert bucket.rate == 50
+    clock.now += 1
+    assert bucket.on_throttle()
+    clock.now += 1
+    bucket.on_throttle()
+    clock.now += 1
+    bucket.on_throttle()
+    assert bucket.rate == 10
+
+    # Ten successes at 10/s are about one second of traffic.
+    for _ in range(10):
+        bucket.on_success()
+    assert 20 < bucket.rate < 30
+    for _ in range(1000):
+        bucket.on_success()
+    assert bucket.rate == 100
+
+
+def test_bucket_paces_requests_at_its_rate():
+    clock = FakeClock()
+    bucket = AdaptiveTokenBucket(max_rate=10, clock=clock, sleep=clock.sleep)
+
+    waited = sum(bucket.acquire() for _ in range(30))
+
+    # The first ten tokens are in the bucket; the next twenty take two seconds.
+    assert waited == pytest.approx(2.0)
+
+
+def test_call_retries_throttled_requests_with_backoff():
+    delays = []
+    rate_control = RateControl(base_delay=1, max_delay=4, sleep=delays.append)
+    request = MagicMock(side_effect=[_error('SlowDown', 503), _error('SlowDown', 503), _error('SlowDown', 503), 'ok'])
+
+    assert rate_control.call('s3', 'put_object', request) == 'ok'
+
+    assert request.call_count == 4
+    assert len(delays) == 3
+    assert all(0 <= delay <= cap for delay, cap in zip(delays, [1, 2, 4]))
+    counters = rate_control.metrics.summary()['counters']
+    assert counters['aws_retries_total'] == {'operation=put_object,service=s3': 3}
+    assert counters['aws_throttles_total'] == {'service=s3': 3}
+    assert rate_control.bucket('s3').rate < 3500
+
+
+def test_call_raises_errors_that_are_not_retryable():
+    rate_control = RateControl(sleep=lambda seconds: None)
+    request = MagicMock(side_effect=_error('AccessDenied', 403))
+
+    with pytest.raises(ClientError):
+        rate_control.call('s3', 'put_object', request)
+
+    assert request.call_count == 1
+
+
+def test_call_gives_up_after_max_attempts():
+    rate_control = RateControl(max_attempts=3, sleep=lambda seconds: None)
+    request = MagicMock(side_effect=_error('InternalError', 500))
+
+    with pytest.raises(ClientError):
+        rate_control.call('dynamodb', 'put_item', request)
+
+    assert request.call_count == 3
+
+
+def test_observe_reports_attempts_botocore_retries():
+    rate_control = RateControl()
+    client = MagicMock()
+    rate_control.observe(client, 's3')
+    event, handler = client.meta.events.register_first.call_args.args
+
+    handler(response=(MagicMock(), {'Error': {'Code': 'SlowDown'}}), attempts=1)
+    handler(response=None, caught_exception=EndpointConnectionError(endpoint_url='https://s3.amazonaws.com'))
+
+    assert event == 'needs-retry'
+    assert rate_control.metrics.summary()['counters']['aws_throttles_total'] == {'service=s3': 1}
+    assert rate_control.bucket('s3').rate == 1750
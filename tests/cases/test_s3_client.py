@@ -1,5 +1,12 @@
+import base64
+import gzip
+import hashlib
+import pytest
 from unittest.mock import patch, MagicMock
-from bloblog.storage.s3_client import S3Client
+from botocore.exceptions import ClientError, EndpointConnectionError
+from bloblog.aws.rate_control import RateControl
+from bloblog.storage.compression import CompressionRules, Compressor
+from bloblog.storage.s3_client import MultipartUpload, S3Client
 from bloblog.metadata.file_metadata import FileMetadata
 
 class TestS3Client:  # Removed unittest.TestCase
@@ -108,4 +115,328 @@ class TestS3Client:  # Removed unittest.TestCase
             sha256='abcdef1234567890'
         )
 
-        client.delete_file(metadata)
\ No newline at end of file
+        client.delete_file(metadata)
+
+def _b64sha256(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+def _sized_metadata(size):
+    return FileMetadata(
+        relative_path='path/to/file.bin',
+        uuid='123',
+        cache_control='no-cache',
+        last_modified='2023-10-10T10:00:00',
+        upload_status='upload_pending',
+        sha256='abcdef1234567890',
+        content_type='application/octet-stream',
+        size=size
+    )
+
+
+class TestS3ClientTransferRouting:
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_small_file_uses_put_object(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'x' * 10)
+        mock_s3.put_object.side_effect = lambda **kwargs: kwargs['Body'].read() and {}
+        client = S3Client(bucket_name='test-bucket', transfer_config={'multipart_threshold': 100})
+
+        sha256 = client.upload_file(_sized_metadata(10), str(tmp_path))
+
+        mock_s3.upload_fileobj.assert_not_called()
+        kwargs = mock_s3.put_object.call_args.kwargs
+        assert kwargs['Bucket'] == 'test-bucket'
+        assert kwargs['Key'] == 'path/to/file.bin'
+        assert kwargs['CacheControl'] == 'no-cache'
+        assert kwargs['ContentType'] == 'application/octet-stream'
+        assert kwargs['ChecksumAlgorithm'] == 'SHA256'
+        assert sha256 == hashlib.sha256(b'x' * 10).hexdigest()
+        counters = client.metrics.summary()['counters']
+        assert counters['s3_requests_total'] == {'operation=put_object,outcome=ok': 1}
+        assert counters['s3_bytes_uploaded_total'] == {'': 10}
+
+    @patch('bloblog.storage.s3_client.MIN_PART_SIZE', 100)
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_large_file_uses_multipart_upload(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        mock_s3.upload_part.side_effect = lambda **kwargs: {'ETag': f"etag-{kwargs['PartNumber']}"}
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'y' * 1000)
+        client = S3Client(
+            bucket_name='test-bucket',
+            transfer_config={'multipart_threshold': 100, 'multipart_chunksize': 300, 'max_concurrency': 4}
+        )
+        started = []
+
+        sha256 = client.upload_file(_sized_metadata(1000), str(tmp_path), on_multipart_start=started.append)
+
+        mock_s3.put_object.assert_not_called()
+        assert started == [MultipartUpload('upload-1', 300)]
+        assert mock_s3.create_multipart_upload.call_args.kwargs['ChecksumAlgorithm'] == 'SHA256'
+        part_calls = sorted(mock_s3.upload_part.call_args_list, key=lambda call: call.kwargs['PartNumber'])
+        assert [len(call.kwargs['Body']) for call in part_calls] == [300, 300, 300, 100]
+        assert part_calls[0].kwargs['ChecksumSHA256'] == _b64sha256(b'y' * 300)
+        parts = mock_s3.complete_multipart_upload.call_args.kwargs['MultipartUpload']['Parts']
+        assert [part['ETag'] for part in parts] == ['etag-1', 'etag-2', 'etag-3', 'etag-4']
+        assert sha256 == hashlib.sha256(b'y' * 1000).hexdigest()
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_parts_are_never_smaller_than_s3_accepts(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        mock_s3.upload_part.side_effect = lambda **kwargs: {'ETag': f"etag-{kwargs['PartNumber']}"}
+        size = 6 * 1024 ** 2
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'z' * size)
+        client = S3Client(
+            bucket_name='test-bucket',
+            transfer_config={'multipart_threshold': 1024 ** 2, 'multipart_chunksize': 1024 ** 2}
+        )
+
+        client.upload_file(_sized_metadata(size), str(tmp_path))
+
+        part_calls = sorted(mock_s3.upload_part.call_args_list, key=lambda call: call.kwargs['PartNumber'])
+        assert [len(call.kwargs['Body']) for call in part_calls] == [5 * 1024 ** 2, 1024 ** 2]
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_resumed_upload_skips_parts_already_in_s3(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.get_paginator.return_value.paginate.return_value = [{'Parts': [
+            {'PartNumber': 1, 'ETag': 'etag-1', 'Size': 300, 'ChecksumSHA256': _b64sha256(b'y' * 300)},
+            {'PartNumber': 2, 'ETag': 'stale', 'Size': 300, 'ChecksumSHA256': 'bogus'}
+        ]}]
+        mock_s3.upload_part.side_effect = lambda **kwargs: {'ETag': f"etag-{kwargs['PartNumber']}"}
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'y' * 1000)
+        client = S3Client(bucket_name='test-bucket', transfer_config={'multipart_threshold': 100})
+
+        sha256 = client.upload_file(_sized_metadata(1000), str(tmp_path), resume=MultipartUpload('upload-1', 300))
+
+        mock_s3.create_multipart_upload.assert_not_called()
+        assert sorted(call.kwargs['PartNumber'] for call in mock_s3.upload_part.call_args_list) == [2, 3, 4]
+        kwargs = mock_s3.complete_multipart_upload.call_args.kwargs
+        assert kwargs['UploadId'] == 'upload-1'
+        assert [part['ETag'] for part in kwargs['MultipartUpload']['Parts']] == ['etag-1', 'etag-2', 'etag-3', 'etag-4']
+        assert sha256 == hashlib.sha256(b'y' * 1000).hexdigest()
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_failed_part_aborts_upload(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        mock_s3.upload_part.side_effect = ClientError({'Error': {'Code': 'AccessDenied'}}, 'UploadPart')
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'y' * 1000)
+        client = S3Client(bucket_name='test-bucket', transfer_config={'multipart_threshold': 100})
+
+        with pytest.raises(ClientError):
+            client.upload_file(_sized_metadata(1000), str(tmp_path))
+
+        mock_s3.abort_multipart_upload.assert_called_once_with(
+            Bucket='test-bucket', Key='path/to/file.bin', UploadId='upload-1'
+        )
+        mock_s3.complete_multipart_upload.assert_not_called()
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_dropped_connection_aborts_upload(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        mock_s3.upload_part.side_effect = EndpointConnectionError(endpoint_url='https://s3.amazonaws.com')
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'y' * 1000)
+        client = S3Client(
+            bucket_name='test-bucket',
+            transfer_config={'multipart_threshold': 100},
+            rate_control=RateControl(max_attempts=1)
+        )
+        closed = []
+
+        with pytest.raises(EndpointConnectionError):
+            client.upload_file(_sized_metadata(1000), str(tmp_path), on_multipart_closed=closed.append)
+        assert [upload.upload_id for upload in closed] == ['upload-1']
+
+        # An upload whose abort fails too is left open to be resumed.
+        closed.clear()
+        mock_s3.abort_multipart_upload.side_effect = EndpointConnectionError(endpoint_url='https://s3.amazonaws.com')
+        with pytest.raises(EndpointConnectionError):
+            client.upload_file(_sized_metadata(1000), str(tmp_path), on_multipart_closed=closed.append)
+        assert closed == []
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_checksum_mismatch_fails_upload(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.put_object.side_effect = lambda **kwargs: kwargs['Body'].read() and {'ChecksumSHA256': 'bogus'}
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'x' * 10)
+        client = S3Client(bucket_name='test-bucket')
+
+        assert client.upload_file(_sized_metadata(10), str(tmp_path)) is None
+        assert client.metrics.summary()['counters']['s3_checksum_mismatches_total'] == {'operation=put_object': 1}
+
+
+class TestS3ClientRetries:
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_throttled_put_is_resent_from_the_start(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        bodies = []
+
+        def put_object(**kwargs):
+            bodies.append(kwargs['Body'].read())
+            if len(bodies) == 1:
+                raise ClientError({'Error': {'Code': 'SlowDown'}}, 'PutObject')
+            return {'ChecksumSHA256': _b64sha256(b'x' * 10)}
+
+        mock_s3.put_object.side_effect = put_object
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(b'x' * 10)
+        client = S3Client(bucket_name='test-bucket', rate_control=RateControl(sleep=lambda seconds: None))
+
+        sha256 = client.upload_file(_sized_metadata(10), str(tmp_path))
+
+        assert bodies == [b'x' * 10, b'x' * 10]
+        assert sha256 == hashlib.sha256(b'x' * 10).hexdigest()
+        counters = client.metrics.summary()['counters']
+        assert counters['s3_requests_total'] == {'operation=put_object,outcome=error': 1, 'operation=put_object,outcome=ok': 1}
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_update_raises_once_retries_are_exhausted(self, mock_boto3_client):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.copy_object.side_effect = ClientError({'Error': {'Code': 'SlowDown'}}, 'CopyObject')
+        client = S3Client(bucket_name='test-bucket', rate_control=RateControl(max_attempts=3, sleep=lambda seconds: None))
+
+        with pytest.raises(ClientError):
+            client.update_file_metadata(_sized_metadata(10))
+
+        assert mock_s3.copy_object.call_count == 3
+
+
+class TestS3ClientBatchDelete:
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_delete_files_chunks_keys_by_1000(self, mock_boto3_client):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.delete_objects.return_value = {}
+        client = S3Client(bucket_name='test-bucket')
+        records = [FileMetadata('uuid', f'file-{index}', '', 'delete_pending', '', '', '') for index in range(2500)]
+
+        deleted = client.delete_files(records)
+
+        sizes = [len(call.kwargs['Delete']['Objects']) for call in mock_s3.delete_objects.call_args_list]
+        assert sizes == [1000, 1000, 500]
+        assert mock_s3.delete_objects.call_args.kwargs['Delete']['Quiet'] is True
+        assert deleted == records
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_delete_files_leaves_out_failed_keys(self, mock_boto3_client):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.delete_objects.return_value = {
+            'Errors': [{'Key': 'b.html', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]
+        }
+        client = S3Client(bucket_name='test-bucket')
+        records = [FileMetadata('uuid', path, '', 'delete_pending', '', '', '') for path in ('a.html', 'b.html')]
+
+        deleted = client.delete_files(records)
+
+        assert [record.relative_path for record in deleted] == ['a.html']
+
+
+class TestS3ClientCopy:
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_copy_file_replaces_headers(self, mock_boto3_client):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        metadata = _sized_metadata(10)
+        metadata.sha256 = hashlib.sha256(b'x' * 10).hexdigest()
+        mock_s3.copy_object.return_value = {
+            'CopyObjectResult': {'ChecksumSHA256': base64.b64encode(hashlib.sha256(b'x' * 10).digest()).decode()}
+        }
+        client = S3Client(bucket_name='test-bucket')
+
+        assert client.copy_file('other/file.bin', metadata)
+
+        kwargs = mock_s3.copy_object.call_args.kwargs
+        assert kwargs['CopySource'] == {'Bucket': 'test-bucket', 'Key': 'other/file.bin'}
+        assert kwargs['Key'] == 'path/to/file.bin'
+        assert kwargs['MetadataDirective'] == 'REPLACE'
+        assert kwargs['CacheControl'] == 'no-cache'
+        assert kwargs['Metadata'] == {'uuid': '123'}
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_copy_file_rejects_checksum_mismatch(self, mock_boto3_client):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        mock_s3.copy_object.return_value = {'CopyObjectResult': {'ChecksumSHA256': 'bogus'}}
+        client = S3Client(bucket_name='test-bucket')
+
+        assert not client.copy_file('other/file.bin', _sized_metadata(10))
+
+
+class TestS3ClientCompression:
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_compressible_file_is_uploaded_encoded(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        content = b'body { color: red; }\n' * 200
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(content)
+        mock_s3.put_object.side_effect = lambda **kwargs: {'ChecksumSHA256': kwargs['ChecksumSHA256']}
+        compressor = Compressor(CompressionRules([{'mimetype': ['application/*'], 'encoding': 'gzip'}]))
+        client = S3Client(bucket_name='test-bucket', transfer_config={'multipart_threshold': 1024 ** 2}, compressor=compressor)
+        metadata = _sized_metadata(len(content))
+
+        sha256 = client.upload_file(metadata, str(tmp_path))
+
+        kwargs = mock_s3.put_object.call_args.kwargs
+        assert kwargs['ContentEncoding'] == 'gzip'
+        assert gzip.decompress(kwargs['Body']) == content
+        assert sha256 == hashlib.sha256(content).hexdigest()
+        assert metadata.content_encoding == 'gzip'
+        assert metadata.encoded_size == len(kwargs['Body'])
+        assert metadata.encoded_sha256 == hashlib.sha256(kwargs['Body']).hexdigest()
+        assert client.metrics.summary()['counters']['s3_bytes_uploaded_total'] == {'': len(kwargs['Body'])}
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_encoded_upload_reserves_budget_before_reading(self, mock_boto3_client, tmp_path):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        content = b'body { color: red; }\n' * 200
+        (tmp_path / 'path' / 'to').mkdir(parents=True)
+        (tmp_path / 'path' / 'to' / 'file.bin').write_bytes(content)
+        mock_s3.put_object.side_effect = lambda **kwargs: {'ChecksumSHA256': kwargs['ChecksumSHA256']}
+        compressor = Compressor(CompressionRules([{'mimetype': ['application/*'], 'encoding': 'gzip'}]))
+        client = S3Client(
+            bucket_name='test-bucket',
+            transfer_config={'multipart_threshold': 1024 ** 2, 'max_inflight_bytes': 1024 ** 2},
+            compressor=compressor
+        )
+        encode = compressor.encode
+        inflight = []
+        compressor.encode = lambda *args: inflight.append(client._limiter._inflight_bytes) or encode(*args)
+
+        client.upload_file(_sized_metadata(len(content)), str(tmp_path))
+
+        assert inflight == [2 * len(content)]
+        assert client._limiter._inflight_bytes == 0
+
+    @patch('bloblog.storage.s3_client.boto3.client')
+    def test_update_keeps_content_encoding(self, mock_boto3_client):
+        mock_s3 = MagicMock()
+        mock_boto3_client.return_value = mock_s3
+        metadata = _sized_metadata(10)
+        metadata.content_encoding = 'gzip'
+        client = S3Client(bucket_name='test-bucket')
+
+        client.update_file_metadata(metadata)
+
+        assert mock_s3.copy_object.call_args.kwargs['ContentEncoding'] == 'gzip'
@@ -0,0 +1,54 @@
+import yaml
+from unittest.mock import patch
+from bloblog.aws.session_factory import SessionFactory
+from bloblog.config.config_manager import ConfigManager
+
+
+def _config_manager(tmp_path, workers, max_total_threads, scan_segments, aws=None):
+    config_file = tmp_path / 'config.yaml'
+    config_file.write_text(yaml.safe_dump({
+        'workers': workers,
+        'sync': {'root_path': str(tmp_path), 'exclude_patterns': [], 'scan_segments': scan_segments},
+        'transfer': {'max_total_threads': max_total_threads},
+        'aws': aws or {}
+    }))
+    return ConfigManager(str(config_file))
+
+
+def test_pool_size_follows_parallelism(tmp_path):
+    config = _config_manager(tmp_path, workers=40, max_total_threads=64, scan_segments=8).get_aws_config()
+
+    assert config['max_pool_connections'] == 104
+
+
+def test_pool_size_never_below_botocore_default(tmp_path):
+    config = _config_manager(tmp_path, workers=1, max_total_threads=2, scan_segments=1).get_aws_config()
+
+    assert config['max_pool_connections'] == 10
+
+
+def test_explicit_pool_size_wins(tmp_path):
+    config = _config_manager(tmp_path, workers=40, max_total_threads=64, scan_segments=8, aws={'max_pool_connections': 12}).get_aws_config()
+
+    assert config['max_pool_connections'] == 12
+
+
+def test_botocore_leaves_retries_to_the_rate_control(tmp_path):
+    config = _config_manager(tmp_path, workers=1, max_total_threads=2, scan_segments=1).get_aws_config()
+
+    assert config['max_attempts'] == 1
+    assert SessionFactory(**config).botocore_config.retries['max_attempts'] == 1
+
+
+@patch('bloblog.aws.session_factory.boto3.session.Session')
+def test_clients_share_session_and_config(mock_session_class):
+    session = mock_session_class.return_value
+    factory = SessionFactory(max_pool_connections=50, retry_mode='adaptive', max_attempts=7)
+
+    factory.client('s3')
+    factory.resource('dynamodb')
+
+    session.client.assert_called_once_with('s3', config=factory.botocore_config)
+    session.resource.assert_called_once_with('dynamodb', config=factory.botocore_config)
+    assert factory.botocore_config.max_pool_connections == 50
+    assert factory.botocore_config.retries == {'mode': 'adaptive', 'max_attempts': 7}
@@ -0,0 +1,143 @@
+"""
+Tests for the SQLiteClient class in bloblog.metadata.sqlite_client.
+"""
+
+import sqlite3
+import threading
+import pytest
+from bloblog.metadata.file_metadata import FileMetadata
+from bloblog.metadata.sqlite_client import BATCH_SIZE, SQLiteClient
+
+
+def _record(relative_path, uuid=None, transition=0):
+    return FileMetadata(
+        uuid=uuid or f'uuid-{relative_path}',
+        relative_path=relative_path,
+        last_modified='2023-10-10T10:00:00',
+        upload_status='uploaded',
+        sha256='abc',
+        cache_control='max-age=3600,public',
+        content_type='text/html',
+        size=10,
+        mtime_ns=5,
+        cache_control_transition=transition
+    )
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = SQLiteClient(str(tmp_path / 'metadata.sqlite'))
+    yield client
+    client.close()
+
+
+def test_add_and_get(client):
+    client.add(_record('a.html'))
+
+    record = client.get_file_metadata('a.html')
+
+    assert record.to_item() == _record('a.html').to_item()
+    assert not record.is_dirty()
+    assert client.get_file_metadata('missing.html') is None
+
+
+def test_database_uses_wal(client, tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'metadata.sqlite'))
+
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    connection.close()
+
+
+def test_new_record_for_a_path_replaces_the_old_one(client):
+    client.add(_record('a.html', uuid='old'))
+    client.add(_record('a.html', uuid='new'))
+
+    assert [record.uuid for record in client.fetch_all_records()] == ['new']
+
+
+def test_update_writes_only_existing_records(client):
+    record = _record('a.html')
+    client.add(record)
+    record.sha256 = 'def'
+
+    client.update(record)
+    client.update(_record('gone.html'))
+
+    assert client.get_file_metadata('a.html').sha256 == 'def'
+    assert client.get_file_metadata('gone.html') is None
+
+
+def test_batched_writes_are_applied_in_batches_and_on_flush(client):
+    for index in range(BATCH_SIZE + 10):
+        client.add_batched(_record(f'file-{index}.html'))
+
+    assert len(client.fetch_all_records()) == BATCH_SIZE
+
+    client.delete_batched(_record('file-0.html'))
+    client.flush()
+
+    assert len(client.fetch_all_records()) == BATCH_SIZE + 9
+    assert client.get_file_metadata('file-0.html') is None
+
+
+def test_delete_discards_queued_write(client):
+    record = _record('a.html')
+    client.add_batched(record)
+
+    client.delete(record)
+    client.flush()
+
+    assert client.fetch_all_records() == []
+
+
+def test_fetch_due_transitions(client):
+    client.add(_record('due.html', transition=100))
+    client.add(_record('later.html', transition=300))
+    client.add(_record('unknown.html'))
+
+    due = client.fetch_due_transitions(200)
+
+    assert sorted(record.relative_path for record in due) == ['due.html', 'unknown.html']
+
+
+def test_each_thread_uses_its_own_connection(client):
+    client.add(_record('a.html'))
+    barrier = threading.Barrier(4)
+    connections = []
+
+    def lookup():
+        assert client.get_file_metadata('a.html').relative_path == 'a.html'
+        connections.append(client._connection())
+        # Keep every thread alive until all have their connection.
+        barrier.wait()
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(connection) for connection in connections}) == 4
+    assert client._connection() not in connections
+
+
+def test_database_without_encoding_columns_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE files (uuid TEXT PRIMARY KEY, relative_path TEXT NOT NULL UNIQUE, last_modified TEXT,"
+        " upload_status TEXT, sha256 TEXT, cache_control TEXT, content_type TEXT, size INTEGER,"
+        " mtime_ns INTEGER, cache_control_transition INTEGER)"
+    )
+    connection.execute(
+        "INSERT INTO files VALUES ('uuid-a', 'a.html', '2023-10-10T10:00:00', 'uploaded', 'abc',"
+        " 'max-age=3600,public', 'text/html', 10, 5, 0)"
+    )
+    connection.commit()
+    connection.close()
+
+    client = SQLiteClient(path)
+    record = client.get_file_metadata('a.html')
+
+    assert (record.content_encoding, record.encoded_size, record.encoded_sha256) == ('', 0, '')
+    client.close()
@@ -0,0 +1,99 @@
+import threading
+import pytest
+from bloblog.sync.task_queue import TaskQueue
+from bloblog.metadata.file_metadata import FileMetadata
+
+
+def _task(relative_path):
+    return FileMetadata(
+        uuid=f'uuid-{relative_path}',
+        relative_path=relative_path,
+        last_modified='2023-10-10T10:00:00',
+        upload_status='upload_pending',
+        sha256='abc',
+        cache_control='max-age=3600,public',
+        content_type='text/html'
+    )
+
+
+def test_fifo_order():
+    task_queue = TaskQueue()
+    task_queue.enqueue(_task('a'))
+    task_queue.enqueue(_task('b'))
+
+    assert task_queue.dequeue().relative_path == 'a'
+    assert task_queue.dequeue().relative_path == 'b'
+    assert task_queue.is_empty()
+
+
+def test_dequeue_drains_then_returns_none_after_close():
+    task_queue = TaskQueue()
+    task_queue.enqueue(_task('a'))
+    task_queue.close()
+
+    assert task_queue.dequeue().relative_path == 'a'
+    assert task_queue.dequeue() is None
+
+
+def test_dequeue_times_out_on_open_empty_queue():
+    assert TaskQueue().dequeue(timeout=0.01) is None
+
+
+def test_dequeue_blocks_until_enqueue():
+    task_queue = TaskQueue()
+    received = []
+    consumer = threading.Thread(target=lambda: received.append(task_queue.dequeue()))
+    consumer.start()
+
+    task_queue.enqueue(_task('a'))
+    consumer.join(timeout=5)
+
+    assert [task.relative_path for task in received] == ['a']
+
+
+def test_full_queue_blocks_producer_until_dequeue():
+    task_queue = TaskQueue(maxsize=1)
+    task_queue.enqueue(_task('a'))
+    producer = threading.Thread(target=task_queue.enqueue, args=(_task('b'),))
+    producer.start()
+
+    producer.join(timeout=0.05)
+    assert producer.is_alive()
+    assert task_queue.qsize() == 1
+
+    assert task_queue.dequeue().relative_path == 'a'
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    assert task_queue.dequeue().relative_path == 'b'
+
+
+def test_enqueue_after_close_raises():
+    task_queue = TaskQueue()
+    task_queue.close()
+
+    with pytest.raises(RuntimeError):
+        task_queue.enqueue(_task('a'))
+
+
+def test_reopen_accepts_tasks_again():
+    task_queue = TaskQueue()
+    task_queue.close()
+    assert task_queue.dequeue() is None
+
+    task_queue.reopen()
+    task_queue.enqueue(_task('a'))
+
+    assert not task_queue.is_closed()
+    assert task_queue.dequeue().relative_path == 'a'
+
+
+def test_requeue_after_close_is_drained():
+    task_queue = TaskQueue(maxsize=1)
+    task_queue.enqueue(_task('a'))
+    task_queue.close()
+
+    task_queue.requeue(_task('b'))
+
+    assert task_queue.dequeue().relative_path == 'a'
+    assert task_queue.dequeue().relative_path == 'b'
+    assert task_queue.dequeue() is None
@@ -0,0 +1,41 @@
+import threading
+from bloblog.storage.transfer_limiter import TransferLimiter
+
+
+def test_reservation_blocks_until_budget_is_released():
+    limiter = TransferLimiter(max_inflight_bytes=100, max_total_threads=4)
+    entered = threading.Event()
+
+    def second_transfer():
+        with limiter.reserve(60, 1):
+            entered.set()
+
+    with limiter.reserve(60, 1):
+        thread = threading.Thread(target=second_transfer)
+        thread.start()
+        assert not entered.wait(0.05)
+    assert entered.wait(5)
+    thread.join()
+
+
+def test_thread_budget_is_enforced():
+    limiter = TransferLimiter(max_inflight_bytes=1000, max_total_threads=4)
+    entered = threading.Event()
+
+    def second_transfer():
+        with limiter.reserve(1, 2):
+            entered.set()
+
+    with limiter.reserve(1, 3):
+        thread = threading.Thread(target=second_transfer)
+        thread.start()
+        assert not entered.wait(0.05)
+    assert entered.wait(5)
+    thread.join()
+
+
+def test_oversized_reservation_is_clipped():
+    limiter = TransferLimiter(max_inflight_bytes=100, max_total_threads=4)
+
+    with limiter.reserve(10 ** 9, 16):
+        pass
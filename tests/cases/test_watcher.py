@@ -0,0 +1,59 @@
+"""
+Tests for the ChangeWatcher class in bloblog.sync.watcher.
+"""
+
+import sys
+import pytest
+from bloblog.config.exclude_matcher import ExcludeMatcher
+from bloblog.sync.watcher import ChangeWatcher
+from bloblog.sync.inotify import InotifyEvent, IN_Q_OVERFLOW
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is Linux only")
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'tmp').mkdir()
+    watcher = ChangeWatcher(str(tmp_path), ExcludeMatcher(['tmp']), debounce=0.05, max_delay=1.0)
+    watcher.start()
+    yield watcher
+    watcher.close()
+
+
+def test_burst_of_writes_is_coalesced(tmp_path, watcher):
+    for _ in range(3):
+        (tmp_path / 'index.html').write_text('<html></html>')
+    (tmp_path / 'assets' / 'site.css').write_text('body {}')
+
+    assert watcher.wait_for_changes(timeout=1.0) == {'index.html', 'assets/site.css'}
+
+
+def test_excluded_paths_are_not_reported(tmp_path, watcher):
+    (tmp_path / 'tmp' / 'scratch.txt').write_text('x')
+    (tmp_path / 'tmp.log').write_text('x')
+
+    assert watcher.wait_for_changes(timeout=0.2) == set()
+
+
+def test_new_directories_are_watched(tmp_path, watcher):
+    (tmp_path / 'blog').mkdir()
+    assert watcher.wait_for_changes(timeout=1.0) == {'blog'}
+
+    (tmp_path / 'blog' / 'post.html').write_text('<p></p>')
+    assert watcher.wait_for_changes(timeout=1.0) == {'blog/post.html'}
+
+
+def test_moved_directory_reports_both_paths(tmp_path, watcher):
+    (tmp_path / 'assets').rename(tmp_path / 'static')
+    assert watcher.wait_for_changes(timeout=1.0) == {'assets', 'static'}
+
+    (tmp_path / 'static' / 'site.css').write_text('body {}')
+    assert watcher.wait_for_changes(timeout=1.0) == {'static/site.css'}
+
+
+def test_overflow_requests_a_rescan(watcher):
+    batches = iter([[InotifyEvent(-1, IN_Q_OVERFLOW, 0, '')], []])
+    watcher._inotify.read_events = lambda timeout=None: next(batches)
+
+    assert watcher.wait_for_changes(timeout=0.1) is None